@@ -1,13 +1,25 @@
-from fastapi import FastAPI, HTTPException, Depends
+from fastapi import FastAPI, HTTPException, Depends, Header
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 from fastapi.security import HTTPBearer
 from datetime import datetime, date, time
 from typing import List, Optional
+from sqlalchemy import text
+import asyncio
+import hmac
+import os
+import time as clock
 import uvicorn
 
 from models import Salon, Reservation, User, SalonCreate, ReservationCreate
-from db import get_db, SessionLocal
-from routers import salons, reservations, auth
+from db import get_db, read_your_writes, run_db, SessionLocal
+from routers import salons, reservations, auth, reviews
+from services.autocomplete import autocomplete_index
+from services.pool_metrics import pool_stats
+from services.token_revocation import revoked_tokens
+
+# Jeton exigé (en-tête X-Internal-Token) par /internal/metrics ; non défini = endpoint désactivé
+INTERNAL_METRICS_TOKEN = os.getenv("INTERNAL_METRICS_TOKEN")
 
 app = FastAPI(
     title="Bookinails API",
@@ -22,8 +34,12 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "ETag", "Last-Modified", "X-Cache", "X-Primary-Until"],
 )
 
+# Lecture de ses propres écritures quand une réplique sert les lectures
+app.middleware("http")(read_your_writes)
+
 # Security
 security = HTTPBearer()
 
@@ -31,11 +47,33 @@ security = HTTPBearer()
 app.include_router(salons.router, prefix="/api/salons", tags=["salons"])
 app.include_router(reservations.router, prefix="/api/reservations", tags=["reservations"])
 app.include_router(auth.router, prefix="/api/auth", tags=["auth"])
+app.include_router(reviews.router, prefix="/api/reviews", tags=["reviews"])
 
 # Import and include payments router
 from routers import payments
 app.include_router(payments.router, prefix="/api/payments", tags=["payments"])
 
+@app.on_event("startup")
+async def warm_autocomplete_index():
+    """Construire l'index d'autocomplétion au démarrage"""
+    db = SessionLocal()
+    try:
+        autocomplete_index.load(db)
+    except Exception as e:
+        # Base indisponible : l'index sera construit à la première requête
+        print(f"Index d'autocomplétion non construit au démarrage: {e}")
+    finally:
+        db.close()
+
+@app.on_event("startup")
+async def start_revocation_sync():
+    """Relire les jetons révoqués par les autres workers en tâche de fond, hors des requêtes"""
+    app.state.revocation_sync = asyncio.create_task(revoked_tokens.run(SessionLocal))
+
+@app.on_event("shutdown")
+async def stop_revocation_sync():
+    app.state.revocation_sync.cancel()
+
 @app.get("/")
 async def root():
     return {"message": "Bookinails API - Réservez votre manucure facilement!"}
@@ -44,5 +82,40 @@ async def root():
 async def health_check():
     return {"status": "healthy", "timestamp": datetime.now()}
 
+@app.get("/health/ready")
+async def readiness_check(db=Depends(get_db)):
+    """Vérification approfondie : base joignable et pool de connexions non saturé"""
+    started = clock.perf_counter()
+    try:
+        await run_db(db, lambda session: session.execute(text("SELECT 1")))
+    except Exception as e:
+        return JSONResponse(status_code=503, content={
+            "status": "unavailable",
+            "database": f"injoignable: {e.__class__.__name__}",
+            "pools": pool_stats()
+        })
+    latency_ms = round(1000 * (clock.perf_counter() - started), 3)
+    
+    pools = pool_stats()
+    saturated = [
+        name for name, stats in pools.items()
+        if "size" in stats and stats["checked_out"] >= stats["size"] + max(stats["max_overflow"], 0)
+    ]
+    return JSONResponse(status_code=503 if saturated else 200, content={
+        "status": "saturated" if saturated else "ready",
+        "database": {"latency_ms": latency_ms},
+        "pools": pools,
+        "timestamp": datetime.now().isoformat()
+    })
+
+@app.get("/internal/metrics", include_in_schema=False)
+async def internal_metrics(x_internal_token: Optional[str] = Header(None)):
+    """Métriques internes : pools de connexions (404 tant qu'aucun jeton n'est configuré)"""
+    if not INTERNAL_METRICS_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not hmac.compare_digest(x_internal_token or "", INTERNAL_METRICS_TOKEN):
+        raise HTTPException(status_code=403, detail="Accès refusé")
+    return {"pools": pool_stats(), "timestamp": datetime.now()}
+
 if __name__ == "__main__":
     uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
@@ -1,12 +1,22 @@
-from sqlalchemy import Column, Integer, String, DateTime, Float, Boolean, Text, ForeignKey, Time
+from sqlalchemy import BigInteger, Column, Integer, String, DateTime, Date, Float, Boolean, Text, ForeignKey, Time, Index, UniqueConstraint, DDL, event, inspect, literal_column, text
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
-from pydantic import BaseModel, validator
-from datetime import datetime, date, time
-from typing import List, Optional
+from pydantic import BaseModel, Field, validator
+from datetime import datetime, date, time, timedelta
+from typing import List, Literal, Optional
+
+from services.geo import encode_geohash
+from services.normalize import normalize
+from services.user_cache import user_cache
 
 Base = declarative_base()
 
+# Gammes de prix affichées et niveau numérique utilisé pour filtrer et trier
+PRICE_TIERS = {"€": 1, "€€": 2, "€€€": 3}
+PriceRange = Literal["€", "€€", "€€€"]
+# Gamme absente ou inconnue (salons importés) : jamais NULL, triée après les autres
+UNKNOWN_PRICE_TIER = 9
+
 # SQLAlchemy Models
 class Salon(Base):
     __tablename__ = "salons"
@@ -16,19 +26,49 @@ class Salon(Base):
     description = Column(Text)
     address = Column(String)
     city = Column(String, index=True)
+    city_normalized = Column(String)  # minuscules sans accents (calculé depuis city)
     phone = Column(String)
     email = Column(String)
-    rating = Column(Float, default=0.0)
+    rating = Column(Float, default=0.0)  # rating_sum / total_reviews, maintenu par services.reviews
     total_reviews = Column(Integer, default=0)
+    rating_sum = Column(Float)  # somme des notes ; NULL = rating * total_reviews (salons importés)
     price_range = Column(String)  # €, €€, €€€
+    price_tier = Column(Integer, nullable=False, default=UNKNOWN_PRICE_TIER,
+                        server_default=str(UNKNOWN_PRICE_TIER))  # 1, 2, 3 (calculé depuis price_range)
     image_url = Column(String)
     open_time = Column(Time)
     close_time = Column(Time)
+    latitude = Column(Float)
+    longitude = Column(Float)
+    geohash = Column(String(12), index=True)  # calculé depuis latitude/longitude
     owner_id = Column(Integer, ForeignKey("users.id"))
     created_at = Column(DateTime, default=datetime.utcnow)
     
     reservations = relationship("Reservation", back_populates="salon")
+    reviews = relationship("Review", back_populates="salon")
     owner = relationship("User", back_populates="owned_salons")
+    
+    __table_args__ = (
+        # Pagination keyset sur les tris de la liste des salons
+        Index("ix_salons_rating_id", "rating", "id"),
+        Index("ix_salons_reviews_id", "total_reviews", "id"),
+        Index("ix_salons_price_tier_id", "price_tier", "id"),
+        # Combinaisons filtre + tri de la liste des salons
+        Index("ix_salons_city_rating_id", "city_normalized", "rating", "id"),
+        Index("ix_salons_city_tier_rating_id", "city_normalized", "price_tier", "rating", "id"),
+        Index("ix_salons_city_tier_id", "city_normalized", "price_tier", "id"),
+        Index("ix_salons_tier_rating_id", "price_tier", "rating", "id"),
+    )
+
+@event.listens_for(Salon, "before_insert")
+@event.listens_for(Salon, "before_update")
+def _set_salon_derived_columns(mapper, connection, salon):
+    if salon.latitude is not None and salon.longitude is not None:
+        salon.geohash = encode_geohash(salon.latitude, salon.longitude)
+    else:
+        salon.geohash = None
+    salon.price_tier = PRICE_TIERS.get(salon.price_range, UNKNOWN_PRICE_TIER)
+    salon.city_normalized = normalize(salon.city) if salon.city else None
 
 class User(Base):
     __tablename__ = "users"
@@ -38,11 +78,44 @@ class User(Base):
     name = Column(String)
     phone = Column(String)
     is_professional = Column(Boolean, default=False)
+    hashed_password = Column(String)  # bcrypt ; NULL pour les comptes créés sans mot de passe
     created_at = Column(DateTime, default=datetime.utcnow)
     
     reservations = relationship("Reservation", back_populates="client")
     owned_salons = relationship("Salon", back_populates="owner")
 
+@event.listens_for(User, "after_update")
+@event.listens_for(User, "after_delete")
+def _invalidate_cached_user(mapper, connection, user):
+    """Profil mis en cache par get_current_user, sous l'email actuel et l'ancien"""
+    for email in [user.email, *inspect(user).attrs.email.history.deleted]:
+        user_cache.invalidate(email)
+
+class RevokedToken(Base):
+    __tablename__ = "revoked_tokens"
+    
+    # Identifiant croissant : les workers relisent les révocations par incréments
+    id = Column(Integer, primary_key=True)
+    jti = Column(String, unique=True, nullable=False)
+    expires_at = Column(DateTime, nullable=False, index=True)
+
+class RefreshSession(Base):
+    """Session de connexion : seul le dernier jeton de rafraîchissement émis est valide"""
+    __tablename__ = "refresh_sessions"
+    
+    id = Column(String(32), primary_key=True)  # claim sid des jetons
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    jti = Column(String(32), nullable=False)  # jeton de rafraîchissement courant
+    expires_at = Column(DateTime, nullable=False, index=True)
+
+def _default_end_date(context):
+    """Fin de rendez-vous calculée à l'insertion (début + durée)"""
+    params = context.get_current_parameters()
+    start = params.get("appointment_date")
+    if start is None:
+        return None
+    return start + timedelta(minutes=params.get("duration_minutes") or 60)
+
 class Reservation(Base):
     __tablename__ = "reservations"
     
@@ -52,15 +125,153 @@ class Reservation(Base):
     service_type = Column(String)  # manucure, pose, etc.
     appointment_date = Column(DateTime)
     duration_minutes = Column(Integer, default=60)
+    end_date = Column(DateTime, default=_default_end_date)
     price = Column(Float)
     status = Column(String, default="confirmed")  # confirmed, cancelled, completed
     payment_status = Column(String, default="pending")  # pending, paid, refunded
-    stripe_payment_id = Column(String)
+    stripe_payment_id = Column(String, index=True)  # webhook et remboursements
     client_notes = Column(Text)
     created_at = Column(DateTime, default=datetime.utcnow)
     
     salon = relationship("Salon", back_populates="reservations")
     client = relationship("User", back_populates="reservations")
+    
+    __table_args__ = (
+        # Index partiels limités aux réservations actives : l'historique
+        # (terminées, annulées) n'est jamais parcouru par le moteur de disponibilités
+        # Planning d'un salon sur une journée
+        Index("ix_reservations_active_salon_date", "salon_id", "appointment_date", "end_date",
+              postgresql_where=text("status = 'confirmed'"), sqlite_where=text("status = 'confirmed'")),
+        # Salons occupés sur un créneau, reconstruction des bitmaps
+        Index("ix_reservations_active_date", "appointment_date", "end_date", "salon_id",
+              postgresql_where=text("status = 'confirmed'"), sqlite_where=text("status = 'confirmed'")),
+        # Pagination keyset des listes de réservations
+        Index("ix_reservations_date_id", "appointment_date", "id"),
+        # SQLite : pas de réutilisation d'identifiants après archivage des plus récents
+        {"sqlite_autoincrement": True},
+    )
+
+def active_reservation():
+    """Condition des index partiels, en constante littérale : le planificateur
+    ne retient un index partiel que si la requête porte la même condition"""
+    return Reservation.status == literal_column("'confirmed'")
+
+class ReservationArchive(Base):
+    """Réservations anciennes déplacées hors de la table chaude (services.archive)
+
+    Sur Postgres, table partitionnée par mois de rendez-vous : les partitions
+    sont créées par le job d'archivage et peuvent être détachées ou supprimées
+    en bloc. Pas de clé étrangère : les salons et comptes peuvent disparaître.
+    """
+    __tablename__ = "reservations_archive"
+    
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    appointment_date = Column(DateTime, primary_key=True)  # clé de partitionnement
+    salon_id = Column(Integer, index=True)
+    client_id = Column(Integer, index=True)
+    service_type = Column(String)
+    duration_minutes = Column(Integer)
+    end_date = Column(DateTime)
+    price = Column(Float)
+    status = Column(String)
+    payment_status = Column(String)
+    stripe_payment_id = Column(String)
+    client_notes = Column(Text)
+    created_at = Column(DateTime)
+    archived_at = Column(DateTime, default=datetime.utcnow)
+    
+    __table_args__ = {"postgresql_partition_by": "RANGE (appointment_date)"}
+
+# Partition par défaut : aucune insertion ne peut échouer faute de partition mensuelle
+event.listen(ReservationArchive.__table__, "after_create", DDL(
+    "CREATE TABLE IF NOT EXISTS reservations_archive_default PARTITION OF reservations_archive DEFAULT"
+).execute_if(dialect="postgresql"))
+
+class Review(Base):
+    __tablename__ = "reviews"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    salon_id = Column(Integer, ForeignKey("salons.id"), nullable=False)
+    client_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    rating = Column(Integer, nullable=False)  # 1 à 5
+    comment = Column(Text)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime)
+    
+    salon = relationship("Salon", back_populates="reviews")
+    client = relationship("User")
+    
+    __table_args__ = (
+        # Avis d'un salon, du plus récent au plus ancien (pagination keyset)
+        Index("ix_reviews_salon_created_id", "salon_id", "created_at", "id"),
+        # Un seul avis par client et par salon (modifiable ensuite)
+        UniqueConstraint("salon_id", "client_id", name="uq_reviews_salon_client"),
+    )
+
+class ReservationSlot(Base):
+    __tablename__ = "reservation_slots"
+    
+    # Clé primaire (salon, début de tranche) : deux réservations ne peuvent
+    # pas occuper la même tranche, y compris sous forte concurrence
+    salon_id = Column(Integer, ForeignKey("salons.id"), primary_key=True)
+    slot_start = Column(DateTime, primary_key=True)
+    reservation_id = Column(Integer, ForeignKey("reservations.id"), index=True)
+    # Blocage temporaire pendant le paiement Stripe (sans réservation associée)
+    hold_token = Column(String, index=True)
+    expires_at = Column(DateTime, index=True)
+
+class SalonDayAvailability(Base):
+    __tablename__ = "salon_day_availability"
+    
+    # Clé (day, salon_id) : la recherche teste chaque salon candidat par clé primaire
+    day = Column(Date, primary_key=True)
+    salon_id = Column(Integer, ForeignKey("salons.id"), primary_key=True)
+    # 1 bit par tranche de 5 minutes occupée (288 bits), en 6 mots de 48 bits (4 heures chacun),
+    # testés par ET binaire dans la requête de recherche
+    busy_0 = Column(BigInteger, nullable=False, default=0)  # 00h-04h
+    busy_1 = Column(BigInteger, nullable=False, default=0)  # 04h-08h
+    busy_2 = Column(BigInteger, nullable=False, default=0)  # 08h-12h
+    busy_3 = Column(BigInteger, nullable=False, default=0)  # 12h-16h
+    busy_4 = Column(BigInteger, nullable=False, default=0)  # 16h-20h
+    busy_5 = Column(BigInteger, nullable=False, default=0)  # 20h-24h
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+# Recherche plein texte sur les salons
+# Postgres : index GIN sur une expression tsvector pondérée (réutilisée telle quelle par la requête)
+SALON_SEARCH_VECTOR = (
+    "setweight(to_tsvector('french', coalesce(salons.name, '')), 'A') || "
+    "setweight(to_tsvector('french', coalesce(salons.city, '')), 'B') || "
+    "setweight(to_tsvector('french', coalesce(salons.address, '')), 'C') || "
+    "setweight(to_tsvector('french', coalesce(salons.description, '')), 'D')"
+)
+
+event.listen(Salon.__table__, "after_create", DDL(
+    f"CREATE INDEX IF NOT EXISTS ix_salons_search ON salons USING gin (({SALON_SEARCH_VECTOR}))"
+).execute_if(dialect="postgresql"))
+
+# SQLite : table FTS5 externe synchronisée par triggers
+for statement in [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS salons_fts USING fts5("
+    "name, city, address, description, content='salons', content_rowid='id', "
+    "tokenize='unicode61 remove_diacritics 2')",
+    "CREATE TRIGGER IF NOT EXISTS salons_fts_ai AFTER INSERT ON salons BEGIN "
+    "INSERT INTO salons_fts(rowid, name, city, address, description) "
+    "VALUES (new.id, new.name, new.city, new.address, new.description); END",
+    "CREATE TRIGGER IF NOT EXISTS salons_fts_ad AFTER DELETE ON salons BEGIN "
+    "INSERT INTO salons_fts(salons_fts, rowid, name, city, address, description) "
+    "VALUES ('delete', old.id, old.name, old.city, old.address, old.description); END",
+    "CREATE TRIGGER IF NOT EXISTS salons_fts_au AFTER UPDATE ON salons BEGIN "
+    "INSERT INTO salons_fts(salons_fts, rowid, name, city, address, description) "
+    "VALUES ('delete', old.id, old.name, old.city, old.address, old.description); "
+    "INSERT INTO salons_fts(rowid, name, city, address, description) "
+    "VALUES (new.id, new.name, new.city, new.address, new.description); END",
+    "INSERT INTO salons_fts(salons_fts) VALUES ('rebuild')",
+]:
+    event.listen(Salon.__table__, "after_create", DDL(statement).execute_if(dialect="sqlite"))
+
+event.listen(Salon.__table__, "before_drop", DDL(
+    "DROP TABLE IF EXISTS salons_fts"
+).execute_if(dialect="sqlite"))
 
 # Pydantic Models
 class SalonBase(BaseModel):
@@ -70,16 +281,20 @@ class SalonBase(BaseModel):
     city: str
     phone: str
     email: str
-    price_range: str
+    price_range: PriceRange
     image_url: Optional[str] = None
     open_time: time
     close_time: time
+    latitude: Optional[float] = None
+    longitude: Optional[float] = None
 
 class SalonCreate(SalonBase):
     pass
 
 class SalonResponse(SalonBase):
     id: int
+    # Salons importés : gamme libre ou absente, renvoyée telle quelle
+    price_range: Optional[str] = None
     rating: float
     total_reviews: int
     created_at: datetime
@@ -87,6 +302,30 @@ class SalonResponse(SalonBase):
     class Config:
         from_attributes = True
 
+class NearbySalonResponse(SalonResponse):
+    distance_km: float
+
+class SalonSuggestion(BaseModel):
+    id: int
+    name: str
+    city: str
+    rating: float
+
+class FacetCount(BaseModel):
+    value: str
+    label: str
+    count: int
+
+class RatingFacetCount(BaseModel):
+    min_rating: float
+    count: int
+
+class SalonFacets(BaseModel):
+    total: int
+    cities: List[FacetCount]
+    price_ranges: List[FacetCount]
+    ratings: List[RatingFacetCount]
+
 class ReservationBase(BaseModel):
     service_type: str
     appointment_date: datetime
@@ -108,6 +347,51 @@ class ReservationResponse(ReservationBase):
     class Config:
         from_attributes = True
 
+class SalonSummary(BaseModel):
+    id: int
+    name: str
+    address: str
+    city: str
+    phone: str
+    image_url: Optional[str] = None
+    
+    class Config:
+        from_attributes = True
+
+class ClientSummary(BaseModel):
+    id: int
+    name: str
+    email: str
+    phone: Optional[str] = None
+    
+    class Config:
+        from_attributes = True
+
+class ReservationExpandedResponse(ReservationResponse):
+    # Renseignés seulement si demandés (?expand=salon,client)
+    salon: Optional[SalonSummary] = None
+    client: Optional[ClientSummary] = None
+
+class ReviewCreate(BaseModel):
+    rating: int = Field(..., ge=1, le=5)
+    comment: Optional[str] = None
+
+class ReviewUpdate(BaseModel):
+    rating: Optional[int] = Field(None, ge=1, le=5)
+    comment: Optional[str] = None
+
+class ReviewResponse(BaseModel):
+    id: int
+    salon_id: int
+    client_id: int
+    rating: int
+    comment: Optional[str] = None
+    created_at: datetime
+    updated_at: Optional[datetime] = None
+    
+    class Config:
+        from_attributes = True
+
 class UserBase(BaseModel):
     email: str
     name: str
@@ -115,7 +399,7 @@ class UserBase(BaseModel):
     is_professional: bool = False
 
 class UserCreate(UserBase):
-    pass
+    password: Optional[str] = None
 
 class UserResponse(UserBase):
     id: int
@@ -124,6 +408,12 @@ class UserResponse(UserBase):
     class Config:
         from_attributes = True
 
+class Principal(BaseModel):
+    """Utilisateur authentifié tel que décrit par les claims du jeton"""
+    id: int
+    email: str
+    role: str  # client, professional
+
 class SearchFilters(BaseModel):
     city: Optional[str] = None
     service_type: Optional[str] = None
@@ -1,80 +1,178 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from sqlalchemy.orm import Session
-from passlib.context import CryptContext
 from jose import JWTError, jwt
 from datetime import datetime, timedelta
+from typing import Optional
+from uuid import uuid4
 import os
 
-from db import get_db
-from models import User, UserCreate, UserResponse
+from db import get_db, get_or_create, insert_returning, run_db
+from models import Principal, User, UserCreate, UserResponse
+from services.passwords import HashingOverloaded, password_hasher
+from services.refresh_sessions import end_session, rotate_session, start_session
+from services.token_revocation import revoked_tokens
+from services.user_cache import user_cache
 
 router = APIRouter()
-security = HTTPBearer()
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Sans en-tête Authorization : 401 (get_current_user), pas le 403 par défaut de HTTPBearer
+security = HTTPBearer(auto_error=False)
 
 # JWT settings
 SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key-change-this")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
+REFRESH_TOKEN_EXPIRE_DAYS = int(os.getenv("REFRESH_TOKEN_EXPIRE_DAYS", "30"))
 
-def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+def hashing_overloaded():
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="Trop de connexions simultanées, réessayez dans un instant",
+        headers={"Retry-After": "1"},
+    )
+
+async def verify_password(plain_password, hashed_password):
+    """(valide, nouveau hash si le coût bcrypt a changé), calculé dans le pool de hachage"""
+    try:
+        return await password_hasher.verify_and_update(plain_password, hashed_password)
+    except HashingOverloaded:
+        raise hashing_overloaded()
 
-def get_password_hash(password):
-    return pwd_context.hash(password)
+async def get_password_hash(password):
+    try:
+        return await password_hasher.hash(password)
+    except HashingOverloaded:
+        raise hashing_overloaded()
+
+def store_password_hash(session: Session, user_id: int, hashed_password: str):
+    session.query(User).filter(User.id == user_id).update({User.hashed_password: hashed_password})
+    session.commit()
 
-def create_access_token(data: dict, expires_delta: timedelta = None):
+def create_access_token(data: dict, expires_delta: timedelta = None, token_type: str = "access"):
     to_encode = data.copy()
     if expires_delta:
         expire = datetime.utcnow() + expires_delta
     else:
         expire = datetime.utcnow() + timedelta(minutes=15)
-    to_encode.update({"exp": expire})
+    # jti : identifiant unique, clé de la révocation
+    to_encode.update({"exp": expire, "jti": to_encode.get("jti") or uuid4().hex, "type": token_type})
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-async def get_current_user(
-    credentials: HTTPAuthorizationCredentials = Depends(security),
-    db: Session = Depends(get_db)
-):
-    credentials_exception = HTTPException(
+def refresh_expiry() -> datetime:
+    return datetime.utcnow() + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS)
+
+def issue_tokens(user, session_id: str, refresh_jti: str) -> dict:
+    """Jeton d'accès court et jeton de rafraîchissement long de la session session_id"""
+    claims = {**user_claims(user), "sid": session_id}
+    return {
+        "access_token": create_access_token(claims, timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)),
+        "refresh_token": create_access_token(
+            {**claims, "jti": refresh_jti}, timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS), "refresh"
+        ),
+        "token_type": "bearer",
+    }
+
+def user_role(user) -> str:
+    return "professional" if user.is_professional else "client"
+
+def user_claims(user) -> dict:
+    """Sujet, identifiant et rôle : assez pour authentifier la plupart des requêtes sans base"""
+    return {"sub": user.email, "uid": user.id, "role": user_role(user)}
+
+def credentials_exception():
+    return HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
-    
+
+def decode_token(token: str, token_type: str = "access") -> dict:
     try:
-        payload = jwt.decode(credentials.credentials, SECRET_KEY, algorithms=[ALGORITHM])
-        email: str = payload.get("sub")
-        if email is None:
-            raise credentials_exception
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
     except JWTError:
-        raise credentials_exception
-    
-    user = db.query(User).filter(User.email == email).first()
+        raise credentials_exception()
+    # Jetons émis avant les jetons de rafraîchissement : sans type, ce sont des jetons d'accès
+    if payload.get("sub") is None or payload.get("type", "access") != token_type:
+        raise credentials_exception()
+    return payload
+
+def verify_token(token: Optional[str]) -> dict:
+    """Signature, expiration, type et révocation d'un jeton d'accès (liste lue en mémoire, sans requête)"""
+    if token is None:
+        raise credentials_exception()
+    payload = decode_token(token)
+    if revoked_tokens.is_revoked(payload.get("jti")):
+        raise credentials_exception()
+    return payload
+
+def bearer_token(credentials: Optional[HTTPAuthorizationCredentials]) -> Optional[str]:
+    return credentials.credentials if credentials else None
+
+async def load_user(email: str, db: Session) -> UserResponse:
+    """Profil servi par user_cache tant que l'utilisateur n'a pas changé"""
+    user = user_cache.get(email)
     if user is None:
-        raise credentials_exception
+        db_user = await run_db(db, lambda session: session.query(User).filter(User.email == email).first())
+        if db_user is None:
+            raise credentials_exception()
+        user = UserResponse.model_validate(db_user)
+        user_cache.put(email, user)
     return user
 
+async def get_current_user(
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(security),
+    db: Session = Depends(get_db)
+) -> UserResponse:
+    """Profil complet de l'utilisateur connecté"""
+    payload = verify_token(bearer_token(credentials))
+    return await load_user(payload["sub"], db)
+
+async def get_current_principal(
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(security),
+    db: Session = Depends(get_db)
+) -> Principal:
+    """Identifiant et rôle de l'utilisateur connecté, lus dans le jeton (aucune requête)
+
+    Les jetons émis avant l'ajout des claims uid / role passent par le profil en cache.
+    """
+    payload = verify_token(bearer_token(credentials))
+    if payload.get("uid") is not None and payload.get("role"):
+        return Principal(id=payload["uid"], email=payload["sub"], role=payload["role"])
+    user = await load_user(payload["sub"], db)
+    return Principal(id=user.id, email=user.email, role=user_role(user))
+
+async def get_optional_principal(
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(security),
+    db: Session = Depends(get_db)
+) -> Optional[Principal]:
+    """Comme get_current_principal, mais None sans en-tête Authorization (jeton invalide : 401)"""
+    if credentials is None:
+        return None
+    return await get_current_principal(credentials, db)
+
 @router.post("/register", response_model=UserResponse)
 async def register(user: UserCreate, db: Session = Depends(get_db)):
     """Inscription d'un nouvel utilisateur"""
-    # Vérifier si l'utilisateur existe déjà
-    existing_user = db.query(User).filter(User.email == user.email).first()
-    if existing_user:
-        raise HTTPException(
-            status_code=400,
-            detail="Email déjà enregistré"
-        )
+    hashed_password = await get_password_hash(user.password) if user.password else None
     
-    # Créer le nouvel utilisateur
-    db_user = User(**user.dict())
-    db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
+    def save(session: Session):
+        # Un seul INSERT ... ON CONFLICT DO NOTHING RETURNING : rien n'est renvoyé si l'email existe
+        db_user = insert_returning(
+            session, User, {**user.dict(exclude={"password"}), "hashed_password": hashed_password},
+            conflict=["email"]
+        )
+        if db_user is None:
+            raise HTTPException(
+                status_code=400,
+                detail="Email déjà enregistré"
+            )
+        
+        created = UserResponse.model_validate(db_user)
+        session.commit()
+        return created
     
-    return db_user
+    return await run_db(db, save)
 
 from pydantic import BaseModel
 
@@ -85,34 +183,88 @@ class LoginRequest(BaseModel):
 @router.post("/login")
 async def login(login_data: LoginRequest, db: Session = Depends(get_db)):
     """Connexion utilisateur (simplifiée pour le MVP)"""
-    # Pour le MVP, on accepte tous les emails
-    user = db.query(User).filter(User.email == login_data.email).first()
+    def load_account(session: Session):
+        # Pour le MVP, on accepte tous les emails : compte créé automatiquement,
+        # lecture et création en une requête, sans course entre deux premières connexions
+        db_user = get_or_create(session, User, {
+            "email": login_data.email,
+            "name": login_data.email.split('@')[0],
+            "phone": "",
+            "is_professional": False
+        }, conflict=["email"])
+        account = UserResponse.model_validate(db_user), db_user.hashed_password
+        session.commit()
+        return account
     
-    if not user:
-        # Créer l'utilisateur automatiquement pour le MVP
-        user = User(
-            email=login_data.email, 
-            name=login_data.email.split('@')[0], 
-            phone="",
-            is_professional=False
-        )
-        db.add(user)
-        db.commit()
-        db.refresh(user)
+    user, hashed_password = await run_db(db, load_account)
     
-    # Créer le token
-    access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-    access_token = create_access_token(
-        data={"sub": user.email}, expires_delta=access_token_expires
-    )
+    if hashed_password:
+        valid, new_hash = await verify_password(login_data.password, hashed_password)
+        if not valid:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Email ou mot de passe incorrect"
+            )
+    else:
+        # Compte MVP sans mot de passe : le premier mot de passe saisi devient le sien
+        new_hash = await get_password_hash(login_data.password)
+    if new_hash:
+        # Premier mot de passe, ou hash d'un ancien coût bcrypt recalculé de façon transparente
+        await run_db(db, store_password_hash, user.id, new_hash)
     
+    # Créer les jetons d'une nouvelle session
+    refresh_jti = uuid4().hex
+    session_id = await run_db(db, start_session, user.id, refresh_jti, refresh_expiry())
     return {
-        "access_token": access_token,
-        "token_type": "bearer",
+        **issue_tokens(user, session_id, refresh_jti),
         "user": user
     }
 
+class RefreshRequest(BaseModel):
+    refresh_token: str
+
+@router.post("/refresh")
+async def refresh_tokens(refresh_data: RefreshRequest, db: Session = Depends(get_db)):
+    """Échanger un jeton de rafraîchissement contre une nouvelle paire (sans mot de passe)
+
+    Rotation : le jeton présenté cesse d'être le jeton courant de sa session,
+    un second usage est refusé.
+    """
+    payload = decode_token(refresh_data.refresh_token, "refresh")
+    if not payload.get("sid"):
+        raise credentials_exception()
+    user = await load_user(payload["sub"], db)
+    refresh_jti = uuid4().hex
+    if not await run_db(db, rotate_session, payload["sid"], payload["jti"], refresh_jti, refresh_expiry()):
+        raise credentials_exception()
+    return issue_tokens(user, payload["sid"], refresh_jti)
+
+class LogoutRequest(BaseModel):
+    refresh_token: Optional[str] = None
+
+@router.post("/logout")
+async def logout(
+    logout_data: Optional[LogoutRequest] = None,
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(security),
+    db: Session = Depends(get_db)
+):
+    """Révoquer le jeton d'accès présenté et fermer sa session de rafraîchissement"""
+    payload = verify_token(bearer_token(credentials))
+    session_id = payload.get("sid")
+    if logout_data and logout_data.refresh_token:
+        refresh_payload = decode_token(logout_data.refresh_token, "refresh")
+        if refresh_payload["sub"] != payload["sub"]:
+            raise credentials_exception()
+        session_id = refresh_payload.get("sid") or session_id
+    if payload.get("jti"):
+        # Révocation jusqu'à l'expiration du jeton d'accès (quelques minutes)
+        await run_db(db, revoked_tokens.revoke, payload["jti"], payload["exp"])
+    if session_id:
+        user_id = payload.get("uid") or (await load_user(payload["sub"], db)).id
+        await run_db(db, end_session, session_id, user_id)
+    return {"message": "Déconnexion effectuée"}
+
 @router.get("/me", response_model=UserResponse)
-async def read_users_me(current_user: User = Depends(get_current_user)):
+async def read_users_me(current_user: UserResponse = Depends(get_current_user)):
     """Récupérer les informations de l'utilisateur connecté"""
     return current_user
@@ -1,12 +1,17 @@
 from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
 from typing import Dict, Any
 import stripe
 import os
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
 
-from db import get_db
+from db import get_db, get_or_create, run_db
 from models import Reservation, User, Salon
+from services.availability_store import mark_busy, mark_free
+from services.booking import (
+    SlotConflict, claim_slots, confirm_hold, hold_slots, release_hold, release_slots, sweep_expired_holds
+)
 
 router = APIRouter()
 
@@ -15,6 +20,11 @@ stripe.api_key = os.getenv("STRIPE_SECRET_KEY")
 STRIPE_WEBHOOK_SECRET = os.getenv("STRIPE_WEBHOOK_SECRET")
 FRONTEND_URL = os.getenv("FRONTEND_URL", "http://localhost:3000")
 
+# Durée de vie d'une session Checkout (Stripe impose entre 30 minutes et 24 heures)
+CHECKOUT_SESSION_TTL_MINUTES = int(os.getenv("CHECKOUT_SESSION_TTL_MINUTES", "31"))
+# Marge laissée au webhook après l'expiration de la session avant de libérer le créneau
+HOLD_GRACE_MINUTES = int(os.getenv("HOLD_GRACE_MINUTES", "5"))
+
 @router.post("/create-checkout-session")
 async def create_checkout_session(
     reservation_data: Dict[str, Any],
@@ -29,55 +39,118 @@ async def create_checkout_session(
         price = reservation_data.get("price")
         client_email = reservation_data.get("client_email")
         client_name = reservation_data.get("client_name")
+        duration_minutes = int(reservation_data.get("duration_minutes") or 60)
         
         if not all([salon_id, service_type, appointment_date, price, client_email]):
             raise HTTPException(status_code=400, detail="Données de réservation incomplètes")
         
-        # Get salon info
-        salon = db.query(Salon).filter(Salon.id == salon_id).first()
-        if not salon:
-            raise HTTPException(status_code=404, detail="Salon non trouvé")
+        try:
+            appointment_start = datetime.fromisoformat(appointment_date)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Date de rendez-vous invalide")
         
-        # Create Stripe checkout session
-        session = stripe.checkout.Session.create(
-            payment_method_types=['card'],
-            line_items=[{
-                'price_data': {
-                    'currency': 'eur',
-                    'product_data': {
-                        'name': f'{service_type} - {salon.name}',
-                        'description': f'Réservation le {appointment_date}',
-                        'images': [salon.image_url] if salon.image_url else [],
-                    },
-                    'unit_amount': int(float(price) * 100),  # Stripe uses cents
-                },
-                'quantity': 1,
-            }],
-            mode='payment',
-            success_url=f'{FRONTEND_URL}/payment-success?session_id={{CHECKOUT_SESSION_ID}}',
-            cancel_url=f'{FRONTEND_URL}/payment-cancel',
-            customer_email=client_email,
-            metadata={
-                'salon_id': str(salon_id),
-                'service_type': service_type,
-                'appointment_date': appointment_date,
-                'client_email': client_email,
-                'client_name': client_name,
-            }
-        )
+        session_expires_at = datetime.utcnow() + timedelta(minutes=CHECKOUT_SESSION_TTL_MINUTES)
+        
+        def hold(db_session: Session):
+            # Get salon info
+            salon = db_session.query(Salon).filter(Salon.id == salon_id).first()
+            if not salon:
+                raise HTTPException(status_code=404, detail="Salon non trouvé")
+            
+            # Bloquer le créneau le temps du paiement
+            sweep_expired_holds(db_session)
+            try:
+                hold_token = hold_slots(
+                    db_session, salon.id, appointment_start, duration_minutes,
+                    expires_at=session_expires_at + timedelta(minutes=HOLD_GRACE_MINUTES)
+                )
+            except SlotConflict:
+                db_session.rollback()
+                raise HTTPException(status_code=409, detail="Ce créneau n'est plus disponible")
+            db_session.commit()
+            db_session.refresh(salon)
+            return salon, hold_token
+        
+        salon, hold_token = await run_db(db, hold)
+        
+        # Create Stripe checkout session (appel HTTP bloquant, hors de la boucle d'événements)
+        try:
+            session = await run_in_threadpool(
+                create_stripe_session,
+                salon, service_type, appointment_date, price, client_email, client_name,
+                duration_minutes, hold_token, session_expires_at
+            )
+        except stripe.error.StripeError:
+            await run_db(db, _release_hold, hold_token)
+            raise
         
-        return {'checkout_url': session.url, 'session_id': session.id}
+        return {'checkout_url': session.url, 'session_id': session.id, 'hold_expires_at': session_expires_at}
         
+    except HTTPException:
+        raise
     except stripe.error.StripeError as e:
         raise HTTPException(status_code=400, detail=f"Erreur Stripe: {str(e)}")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erreur serveur: {str(e)}")
 
+def _release_hold(db: Session, hold_token: str) -> int:
+    released = release_hold(db, hold_token)
+    db.commit()
+    return released
+
+def create_stripe_session(salon, service_type, appointment_date, price, client_email, client_name,
+                          duration_minutes, hold_token, expires_at):
+    """Créer la session Checkout Stripe liée à un blocage de créneau"""
+    return stripe.checkout.Session.create(
+        payment_method_types=['card'],
+        line_items=[{
+            'price_data': {
+                'currency': 'eur',
+                'product_data': {
+                    'name': f'{service_type} - {salon.name}',
+                    'description': f'Réservation le {appointment_date}',
+                    'images': [salon.image_url] if salon.image_url else [],
+                },
+                'unit_amount': int(float(price) * 100),  # Stripe uses cents
+            },
+            'quantity': 1,
+        }],
+        mode='payment',
+        success_url=f'{FRONTEND_URL}/payment-success?session_id={{CHECKOUT_SESSION_ID}}',
+        cancel_url=f'{FRONTEND_URL}/payment-cancel',
+        customer_email=client_email,
+        expires_at=int(expires_at.replace(tzinfo=timezone.utc).timestamp()),
+        metadata={
+            'salon_id': str(salon.id),
+            'service_type': service_type,
+            'appointment_date': appointment_date,
+            'duration_minutes': str(duration_minutes),
+            'client_email': client_email,
+            'client_name': client_name,
+            'hold_token': hold_token,
+        }
+    )
+
+@router.post("/session/{session_id}/cancel")
+async def cancel_checkout_session(session_id: str, db: Session = Depends(get_db)):
+    """Annuler une session de paiement et libérer le créneau bloqué"""
+    try:
+        session = await run_in_threadpool(stripe.checkout.Session.retrieve, session_id)
+        if session.status == 'open':
+            await run_in_threadpool(stripe.checkout.Session.expire, session_id)
+    except stripe.error.StripeError as e:
+        raise HTTPException(status_code=400, detail=f"Session introuvable: {str(e)}")
+    
+    hold_token = (session.metadata or {}).get('hold_token')
+    released = await run_db(db, _release_hold, hold_token) if hold_token else 0
+    
+    return {'released': released > 0}
+
 @router.get("/session/{session_id}")
 async def get_checkout_session(session_id: str):
     """Récupérer les détails d'une session de paiement"""
     try:
-        session = stripe.checkout.Session.retrieve(session_id)
+        session = await run_in_threadpool(stripe.checkout.Session.retrieve, session_id)
         return {
             'payment_status': session.payment_status,
             'customer_details': session.customer_details,
@@ -105,6 +178,9 @@ async def stripe_webhook(request: Request, db: Session = Depends(get_db)):
     if event['type'] == 'checkout.session.completed':
         session = event['data']['object']
         await handle_successful_payment(session, db)
+    elif event['type'] == 'checkout.session.expired':
+        session = event['data']['object']
+        await handle_expired_session(session, db)
     elif event['type'] == 'payment_intent.payment_failed':
         payment_intent = event['data']['object']
         await handle_failed_payment(payment_intent, db)
@@ -112,47 +188,78 @@ async def stripe_webhook(request: Request, db: Session = Depends(get_db)):
     return {'status': 'success'}
 
 async def handle_successful_payment(session: Dict[str, Any], db: Session):
-    """Traiter un paiement réussi"""
-    try:
-        metadata = session.get('metadata', {})
-        
-        # Get or create client
-        client_email = metadata.get('client_email')
-        client = db.query(User).filter(User.email == client_email).first()
-        
-        if not client:
-            # Create new client
-            client = User(
-                email=client_email,
-                name=metadata.get('client_name', ''),
-                phone='',
-                is_professional=False
-            )
-            db.add(client)
-            db.commit()
-            db.refresh(client)
-        
-        # Create reservation
-        reservation = Reservation(
-            salon_id=int(metadata.get('salon_id')),
-            client_id=client.id,
-            service_type=metadata.get('service_type'),
-            appointment_date=datetime.fromisoformat(metadata.get('appointment_date')),
-            duration_minutes=60,  # Default duration
-            price=session['amount_total'] / 100,  # Convert from cents
-            status='confirmed',
-            payment_status='paid',
-            stripe_payment_id=session['payment_intent']
+    """Traiter un paiement réussi
+
+    Créneau pris entre-temps : le client est remboursé aussitôt. Toute erreur
+    (remboursement compris) fait échouer le webhook, que Stripe renvoie ensuite ;
+    l'enregistrement et le remboursement sont idempotents.
+    """
+    reservation_id = await run_db(db, _record_payment, session)
+    if reservation_id is None:
+        refund = await run_in_threadpool(
+            stripe.Refund.create,
+            payment_intent=session['payment_intent'],
+            metadata={'motif': 'creneau_indisponible'},
+            idempotency_key=f"slot-unavailable-{session['payment_intent']}"
         )
-        
-        db.add(reservation)
-        db.commit()
-        
-        # TODO: Send confirmation email
-        print(f"Réservation confirmée: {reservation.id}")
-        
-    except Exception as e:
-        print(f"Erreur lors du traitement du paiement: {str(e)}")
+        print(f"Créneau déjà réservé, paiement {session['payment_intent']} remboursé: {refund.id}")
+        return
+    
+    # TODO: Send confirmation email
+    print(f"Réservation confirmée: {reservation_id}")
+
+def _record_payment(db: Session, session: Dict[str, Any]):
+    """Créer la réservation payée ; None si le créneau a été pris entre-temps"""
+    metadata = session.get('metadata', {})
+    
+    # Webhook renvoyé par Stripe : paiement déjà enregistré
+    existing = db.query(Reservation.id).filter(
+        Reservation.stripe_payment_id == session['payment_intent']
+    ).scalar()
+    if existing is not None:
+        return existing
+    
+    # Get or create client
+    client_email = metadata.get('client_email')
+    client = get_or_create(db, User, {
+        "email": client_email,
+        "name": metadata.get('client_name', ''),
+        "phone": '',
+        "is_professional": False
+    }, conflict=["email"])
+    
+    # Create reservation
+    reservation = Reservation(
+        salon_id=int(metadata.get('salon_id')),
+        client_id=client.id,
+        service_type=metadata.get('service_type'),
+        appointment_date=datetime.fromisoformat(metadata.get('appointment_date')),
+        duration_minutes=int(metadata.get('duration_minutes') or 60),
+        price=session['amount_total'] / 100,  # Convert from cents
+        status='confirmed',
+        payment_status='paid',
+        stripe_payment_id=session['payment_intent']
+    )
+    
+    db.add(reservation)
+    db.flush()
+    try:
+        if metadata.get('hold_token'):
+            confirm_hold(db, metadata['hold_token'], reservation)
+        else:
+            claim_slots(db, reservation)
+    except SlotConflict:
+        db.rollback()
+        return None
+    mark_busy(db, reservation.salon_id, reservation.appointment_date, reservation.duration_minutes)
+    db.commit()
+    return reservation.id
+
+async def handle_expired_session(session: Dict[str, Any], db: Session):
+    """Libérer le créneau d'une session Checkout expirée sans paiement"""
+    hold_token = (session.get('metadata') or {}).get('hold_token')
+    if hold_token:
+        await run_db(db, _release_hold, hold_token)
 
 async def handle_failed_payment(payment_intent: Dict[str, Any], db: Session):
     """Traiter un paiement échoué"""
@@ -166,25 +273,37 @@ async def create_refund(
     db: Session = Depends(get_db)
 ):
     """Créer un remboursement"""
-    try:
-        # Find the reservation
-        reservation = db.query(Reservation).filter(
+    def find_reservation(db_session: Session):
+        return db_session.query(Reservation).filter(
             Reservation.stripe_payment_id == payment_intent_id
         ).first()
+    
+    def cancel_reservation(db_session: Session):
+        reservation = find_reservation(db_session)
+        if reservation.status == 'confirmed':
+            release_slots(db_session, reservation.id)
+            mark_free(db_session, reservation.salon_id, reservation.appointment_date,
+                      reservation.duration_minutes, reservation.id)
+        reservation.status = 'cancelled'
+        reservation.payment_status = 'refunded'
+        db_session.commit()
+    
+    try:
+        # Find the reservation
+        reservation = await run_db(db, find_reservation)
         
         if not reservation:
             raise HTTPException(status_code=404, detail="Réservation non trouvée")
         
         # Create refund in Stripe
-        refund = stripe.Refund.create(
+        refund = await run_in_threadpool(
+            stripe.Refund.create,
             payment_intent=payment_intent_id,
             reason=reason
         )
         
         # Update reservation status
-        reservation.status = 'cancelled'
-        reservation.payment_status = 'refunded'
-        db.commit()
+        await run_db(db, cancel_reservation)
         
         return {
             'refund_id': refund.id,
@@ -201,7 +320,7 @@ async def create_refund(
 async def list_refunds(payment_intent_id: str):
     """Lister les remboursements pour un paiement"""
     try:
-        refunds = stripe.Refund.list(payment_intent=payment_intent_id)
+        refunds = await run_in_threadpool(stripe.Refund.list, payment_intent=payment_intent_id)
         return {
             'refunds': [{
                 'id': refund.id,
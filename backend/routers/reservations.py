@@ -1,12 +1,50 @@
-from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks
-from sqlalchemy.orm import Session
-from typing import List
+from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks, Query, Response
+from sqlalchemy import exists, or_, select
+from sqlalchemy.orm import Session, joinedload, noload
+from datetime import timedelta
+from typing import List, Optional, Set
 
-from db import get_db
-from models import Reservation, ReservationCreate, ReservationResponse
+from db import get_db, get_read_db, insert_returning, run_db
+from models import (
+    Principal, Reservation, ReservationArchive, ReservationCreate, ReservationExpandedResponse,
+    ReservationResponse, Salon
+)
+from routers.auth import credentials_exception, get_optional_principal
+from services.availability_store import AvailabilityBusy, mark_busy, mark_free
+from services.booking import SlotConflict, claim_slots, release_slots
+from services.pagination import paginated
 
 router = APIRouter()
 
+# Tri keyset des listes de réservations : plus récent rendez-vous d'abord
+RESERVATION_SORT_KEYS = [
+    (Reservation.appointment_date, True, lambda reservation: reservation.appointment_date),
+    (Reservation.id, True, lambda reservation: reservation.id),
+]
+
+# Relations incluses à la demande dans les listes (?expand=salon,client)
+RESERVATION_EXPANSIONS = {
+    "salon": Reservation.salon,
+    "client": Reservation.client,
+}
+
+def requested_expansions(expand: Optional[str]) -> Set[str]:
+    requested = {name.strip() for name in expand.split(",") if name.strip()} if expand else set()
+    unknown = requested - RESERVATION_EXPANSIONS.keys()
+    if unknown:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Expansion inconnue : {', '.join(sorted(unknown))} (valeurs possibles : salon, client)"
+        )
+    return requested
+
+def expansion_options(requested: Set[str]) -> list:
+    """Relations demandées chargées par jointure dans la même requête, les autres jamais chargées"""
+    return [
+        joinedload(relationship) if name in requested else noload(relationship)
+        for name, relationship in RESERVATION_EXPANSIONS.items()
+    ]
+
 @router.post("/", response_model=ReservationResponse)
 async def create_reservation(
     reservation: ReservationCreate,
@@ -14,43 +52,81 @@ async def create_reservation(
     db: Session = Depends(get_db)
 ):
     """Créer une nouvelle réservation"""
-    # Vérifier que le salon existe
-    from models import Salon
-    salon = db.query(Salon).filter(Salon.id == reservation.salon_id).first()
-    if not salon:
-        raise HTTPException(status_code=404, detail="Salon non trouvé")
-    
-    # Créer la réservation
-    db_reservation = Reservation(
-        **reservation.dict(),
-        client_id=1,  # TODO: récupérer l'ID du client authentifié
-        status="confirmed"
-    )
+    def save(session: Session):
+        # Un seul INSERT ... SELECT WHERE EXISTS : pas de lecture préalable du salon.
+        # Insertion Core : end_date est calculée ici (pas de valeur par défaut contextuelle)
+        db_reservation = insert_returning(session, Reservation, {
+            **reservation.dict(),
+            "client_id": 1,  # TODO: récupérer l'ID du client authentifié
+            "status": "confirmed",
+            "end_date": reservation.appointment_date + timedelta(minutes=reservation.duration_minutes or 60)
+        }, where=exists().where(Salon.id == reservation.salon_id))
+        if db_reservation is None:
+            raise HTTPException(status_code=404, detail="Salon non trouvé")
+        
+        try:
+            claim_slots(session, db_reservation)
+            mark_busy(session, db_reservation.salon_id, db_reservation.appointment_date,
+                      db_reservation.duration_minutes)
+        except SlotConflict:
+            session.rollback()
+            raise HTTPException(status_code=409, detail="Ce créneau n'est plus disponible")
+        except AvailabilityBusy:
+            session.rollback()
+            raise HTTPException(
+                status_code=503,
+                detail="Trop de réservations simultanées sur ce salon, réessayez dans un instant",
+                headers={"Retry-After": "1"}
+            )
+        created = ReservationResponse.model_validate(db_reservation)
+        session.commit()
+        return created
     
-    db.add(db_reservation)
-    db.commit()
-    db.refresh(db_reservation)
+    db_reservation = await run_db(db, save)
     
     # Envoyer email de confirmation en arrière-plan
     background_tasks.add_task(send_confirmation_email, db_reservation.id)
     
     return db_reservation
 
-@router.get("/", response_model=List[ReservationResponse])
+@router.get("/", response_model=List[ReservationExpandedResponse])
 async def get_reservations(
-    db: Session = Depends(get_db),
+    response: Response,
+    db: Session = Depends(get_read_db),
+    cursor: Optional[str] = Query(None, description="Curseur de la page suivante (en-tête X-Next-Cursor)"),
+    expand: Optional[str] = Query(None, description="Objets liés à inclure, séparés par des virgules : salon, client"),
     skip: int = 0,
-    limit: int = 20
+    limit: int = 20,
+    principal: Optional[Principal] = Depends(get_optional_principal)
 ):
     """Récupérer les réservations de l'utilisateur connecté"""
+    requested = requested_expansions(expand)
+    visible = []
+    if "client" in requested:
+        # Coordonnées du client : seulement sur ses propres réservations ou celles de ses salons
+        if principal is None:
+            raise credentials_exception()
+        visible.append(or_(
+            Reservation.client_id == principal.id,
+            Reservation.salon_id.in_(select(Salon.id).where(Salon.owner_id == principal.id))
+        ))
     # TODO: filtrer par client_id de l'utilisateur authentifié
-    reservations = db.query(Reservation).offset(skip).limit(limit).all()
-    return reservations
+    return await run_db(db, lambda session: paginated(
+        response, session.query(Reservation).options(*expansion_options(requested)).filter(*visible),
+        "appointment_date", RESERVATION_SORT_KEYS, limit, cursor, skip
+    ))
 
 @router.get("/{reservation_id}", response_model=ReservationResponse)
-async def get_reservation(reservation_id: int, db: Session = Depends(get_db)):
+async def get_reservation(reservation_id: int, db: Session = Depends(get_read_db)):
     """Récupérer une réservation par son ID"""
-    reservation = db.query(Reservation).filter(Reservation.id == reservation_id).first()
+    def load(session: Session):
+        # Les réservations anciennes ont été déplacées par le job d'archivage
+        return (
+            session.query(Reservation).filter(Reservation.id == reservation_id).first()
+            or session.query(ReservationArchive).filter(ReservationArchive.id == reservation_id).first()
+        )
+    
+    reservation = await run_db(db, load)
     
     if not reservation:
         raise HTTPException(status_code=404, detail="Réservation non trouvée")
@@ -60,13 +136,20 @@ async def get_reservation(reservation_id: int, db: Session = Depends(get_db)):
 @router.patch("/{reservation_id}/cancel")
 async def cancel_reservation(reservation_id: int, db: Session = Depends(get_db)):
     """Annuler une réservation"""
-    reservation = db.query(Reservation).filter(Reservation.id == reservation_id).first()
-    
-    if not reservation:
-        raise HTTPException(status_code=404, detail="Réservation non trouvée")
+    def cancel(session: Session):
+        reservation = session.query(Reservation).filter(Reservation.id == reservation_id).first()
+        
+        if not reservation:
+            raise HTTPException(status_code=404, detail="Réservation non trouvée")
+        
+        if reservation.status == "confirmed":
+            release_slots(session, reservation.id)
+            mark_free(session, reservation.salon_id, reservation.appointment_date,
+                      reservation.duration_minutes, reservation.id)
+        reservation.status = "cancelled"
+        session.commit()
     
-    reservation.status = "cancelled"
-    db.commit()
+    await run_db(db, cancel)
     
     return {"message": "Réservation annulée avec succès"}
 
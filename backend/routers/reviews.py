@@ -0,0 +1,61 @@
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.orm import Session
+
+from db import get_db, run_db
+from models import Principal, Review, ReviewResponse, ReviewUpdate
+from routers.auth import get_current_principal
+from services.reviews import delete_review, lock_review, rating_changed, update_review
+
+router = APIRouter()
+
+def load_own_review(session: Session, review_id: int, user_id: int) -> Review:
+    """Avis verrouillé jusqu'au commit, s'il appartient à l'utilisateur connecté"""
+    review = lock_review(session, review_id)
+    if not review:
+        raise HTTPException(status_code=404, detail="Avis non trouvé")
+    if review.client_id != user_id:
+        raise HTTPException(status_code=403, detail="Vous ne pouvez modifier que vos propres avis")
+    return review
+
+@router.patch("/{review_id}", response_model=ReviewResponse)
+async def edit_review(
+    review_id: int,
+    changes: ReviewUpdate,
+    db: Session = Depends(get_db),
+    current_user: Principal = Depends(get_current_principal)
+):
+    """Modifier la note ou le commentaire d'un avis"""
+    user_id = current_user.id
+    
+    def save(session: Session):
+        review, rating = update_review(
+            session, load_own_review(session, review_id, user_id), changes.rating, changes.comment
+        )
+        session.commit()
+        session.refresh(review)
+        return review, rating
+    
+    review, rating = await run_db(db, save)
+    if rating is not None:
+        await rating_changed(review.salon_id, rating)
+    return review
+
+@router.delete("/{review_id}")
+async def remove_review(
+    review_id: int,
+    db: Session = Depends(get_db),
+    current_user: Principal = Depends(get_current_principal)
+):
+    """Supprimer un avis"""
+    user_id = current_user.id
+    
+    def delete(session: Session):
+        review = load_own_review(session, review_id, user_id)
+        salon_id = review.salon_id
+        rating = delete_review(session, review)
+        session.commit()
+        return salon_id, rating
+    
+    salon_id, rating = await run_db(db, delete)
+    await rating_changed(salon_id, rating)
+    return {"message": "Avis supprimé avec succès"}
@@ -1,156 +1,344 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from sqlalchemy import and_, false, or_
 from sqlalchemy.orm import Session
 from typing import List, Optional
-from datetime import date
+from datetime import date, datetime, time, timedelta
+import heapq
 
-from db import get_db
-from models import Salon, SalonCreate, SalonResponse, SearchFilters
+from db import get_db, get_read_db, run_db
+from models import (
+    PRICE_TIERS, NearbySalonResponse, Principal, Review, ReviewCreate, ReviewResponse, Salon, SalonCreate,
+    SalonFacets, SalonResponse, SalonSuggestion, SearchFilters
+)
+from routers.auth import get_current_principal
+from services.availability import SLOT_GRANULARITY_MINUTES, availability_filter, get_day_slots
+from services.autocomplete import autocomplete_index
+from services.cache import response_cache
+from services.facets import salon_facets
+from services.geo import bounding_box, covering_prefixes, haversine_km
+from services.normalize import normalize
+from services.pagination import paginated
+from services.ranking import popular_ranking
+from services.reviews import DuplicateReview, create_review, rating_changed
+from services.search import full_text_search, search_score, search_terms
 
 router = APIRouter()
 
+# Clés de tri keyset de la liste des salons (index composites correspondants sur Salon)
+SALON_SORT_KEYS = {
+    "rating": [
+        (Salon.rating, True, lambda salon: salon.rating),
+        (Salon.id, True, lambda salon: salon.id),
+    ],
+    "price": [
+        (Salon.price_tier, False, lambda salon: salon.price_tier),
+        (Salon.id, False, lambda salon: salon.id),
+    ],
+    "reviews": [
+        (Salon.total_reviews, True, lambda salon: salon.total_reviews),
+        (Salon.id, True, lambda salon: salon.id),
+    ],
+}
+
+# Avis d'un salon : plus récents d'abord (index ix_reviews_salon_created_id)
+REVIEW_SORT_KEYS = [
+    (Review.created_at, True, lambda review: review.created_at),
+    (Review.id, True, lambda review: review.id),
+]
+
+def filter_salons(query, city=None, price_range=None, min_rating=None):
+    """Filtres ville / gamme de prix / note, sur les colonnes normalisées indexées"""
+    # Filtrage par ville
+    if city:
+        query = query.filter(Salon.city_normalized == normalize(city))
+    
+    # Filtrage par gamme de prix
+    if price_range:
+        # Gamme inconnue : aucun salon (et non les salons sans gamme)
+        tier = PRICE_TIERS.get(price_range)
+        query = query.filter(Salon.price_tier == tier if tier is not None else false())
+    
+    # Filtrage par note minimum
+    if min_rating:
+        query = query.filter(Salon.rating >= min_rating)
+    
+    return query
+
 @router.get("/", response_model=List[SalonResponse])
 async def get_salons(
-    db: Session = Depends(get_db),
-    city: Optional[str] = Query(None, description="Filtrer par ville"),
+    request: Request,
+    response: Response,
+    db: Session = Depends(get_read_db),
+    city: Optional[str] = Query(None, description="Filtrer par ville (sans accents ni casse)"),
     service_type: Optional[str] = Query(None, description="Type de service"),
     price_range: Optional[str] = Query(None, description="Gamme de prix (€, €€, €€€)"),
     min_rating: Optional[float] = Query(None, description="Note minimum"),
     available_date: Optional[date] = Query(None, description="Date de disponibilité"),
     available_time: Optional[str] = Query(None, description="Heure de disponibilité (HH:MM)"),
+    duration: int = Query(60, ge=15, le=480, description="Durée de la prestation en minutes"),
     sort_by: Optional[str] = Query("rating", description="Tri par: rating, price, distance"),
-    skip: int = Query(0, description="Nombre d'éléments à ignorer"),
+    cursor: Optional[str] = Query(None, description="Curseur de la page suivante (en-tête X-Next-Cursor)"),
+    skip: int = Query(0, description="Nombre d'éléments à ignorer (compatibilité, préférer cursor)"),
     limit: int = Query(20, description="Nombre maximum d'éléments")
 ):
     """Récupérer la liste des salons avec filtres avancés"""
-    query = db.query(Salon)
-    
-    # Filtrage par ville
-    if city:
-        query = query.filter(Salon.city.ilike(f"%{city}%"))
-    
-    # Filtrage par gamme de prix
-    if price_range:
-        query = query.filter(Salon.price_range == price_range)
+    slot_start = None
+    if available_date and available_time:
+        try:
+            slot_time = time.fromisoformat(available_time)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Heure invalide (format HH:MM)")
+        slot_start = datetime.combine(available_date, slot_time)
     
-    # Filtrage par note minimum
-    if min_rating:
-        query = query.filter(Salon.rating >= min_rating)
+    # Tri et pagination
+    if sort_by not in SALON_SORT_KEYS:
+        sort_by = "rating"
+    keys = SALON_SORT_KEYS[sort_by]
     
-    # Tri
-    if sort_by == "rating":
-        query = query.order_by(Salon.rating.desc())
-    elif sort_by == "price":
-        # Tri par prix (€ < €€ < €€€)
-        price_order = {"€": 1, "€€": 2, "€€€": 3}
-        query = query.order_by(Salon.price_range)
-    elif sort_by == "reviews":
-        query = query.order_by(Salon.total_reviews.desc())
-    else:
-        query = query.order_by(Salon.rating.desc())
-    
-    salons = query.offset(skip).limit(limit).all()
-    
-    # Filtrage par disponibilité (logique simplifiée)
-    if available_date and available_time:
-        # Dans une vraie app, on vérifierait les créneaux disponibles
-        # Pour le MVP, on retourne tous les salons
-        pass
+    def load(session: Session, collector: Response):
+        query = filter_salons(session.query(Salon), city, price_range, min_rating)
+        
+        # Filtrage par disponibilité, évalué en base avant la pagination
+        if slot_start:
+            query = query.filter(availability_filter(slot_start, slot_start + timedelta(minutes=duration)))
+        
+        return paginated(collector, query, sort_by, keys, limit, cursor, skip)
     
-    return salons
+    # La disponibilité change à chaque réservation : pas de cache pour ce filtre
+    if slot_start:
+        return await run_db(db, load, response)
+    return await response_cache.serve(
+        request, ["salons"],
+        lambda collector: run_db(db, load, collector),
+        List[SalonResponse]
+    )
 
 @router.get("/search", response_model=List[SalonResponse])
 async def search_salons(
+    request: Request,
     q: str = Query(..., description="Terme de recherche"),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
+    cursor: Optional[str] = Query(None, description="Curseur de la page suivante (en-tête X-Next-Cursor)"),
     limit: int = Query(10, description="Nombre maximum de résultats")
 ):
-    """Recherche textuelle dans les salons"""
-    query = db.query(Salon).filter(
-        Salon.name.ilike(f"%{q}%") |
-        Salon.description.ilike(f"%{q}%") |
-        Salon.city.ilike(f"%{q}%") |
-        Salon.address.ilike(f"%{q}%")
-    ).order_by(Salon.rating.desc())
+    """Recherche plein texte dans les salons, triée par pertinence et note"""
+    if not search_terms(q):
+        return []
+    
+    def load(session: Session, collector: Response):
+        score = search_score(session, q)
+        query = full_text_search(session, q).add_columns(score.label("score"))
+        keys = [
+            (score, True, lambda row: row.score),
+            (Salon.id, True, lambda row: row[0].id),
+        ]
+        rows = paginated(collector, query, "search", keys, limit, cursor)
+        return [row[0] for row in rows]
     
-    return query.limit(limit).all()
+    return await response_cache.serve(
+        request, ["salons"],
+        lambda collector: run_db(db, load, collector),
+        List[SalonResponse]
+    )
+
+@router.get("/autocomplete", response_model=List[SalonSuggestion])
+async def autocomplete_salons(
+    q: str = Query(..., description="Début du nom du salon ou de la ville"),
+    db: Session = Depends(get_read_db),
+    limit: int = Query(8, ge=1, le=20, description="Nombre maximum de suggestions")
+):
+    """Suggestions de salons servies depuis l'index en mémoire"""
+    if not autocomplete_index.loaded:
+        await run_db(db, autocomplete_index.load)
+    return autocomplete_index.search(q, limit)
+
+@router.get("/facets", response_model=SalonFacets)
+async def get_salon_facets(
+    request: Request,
+    db: Session = Depends(get_read_db),
+    city: Optional[str] = Query(None, description="Filtrer par ville (sans accents ni casse)"),
+    price_range: Optional[str] = Query(None, description="Gamme de prix (€, €€, €€€)"),
+    min_rating: Optional[float] = Query(None, description="Note minimum")
+):
+    """Comptes par ville, gamme de prix et note pour les filtres courants (une requête agrégée)"""
+    # Clé normalisée : « Paris » et « paris » partagent la même entrée ; la gamme
+    # reste brute, une gamme inconnue (aucun salon) ne doit pas partager la clé sans filtre
+    key = "facets:{}:{}:{}".format(
+        normalize(city) if city else "",
+        price_range or "",
+        min_rating or ""
+    )
+    return await response_cache.serve(
+        request, ["salons"],
+        lambda collector: run_db(
+            db, salon_facets, lambda query: filter_salons(query, city, price_range, min_rating)
+        ),
+        SalonFacets,
+        key=key
+    )
 
 @router.get("/popular", response_model=List[SalonResponse])
 async def get_popular_salons(
-    db: Session = Depends(get_db),
-    limit: int = Query(6, description="Nombre de salons populaires")
+    request: Request,
+    db: Session = Depends(get_read_db),
+    city: Optional[str] = Query(None, description="Classement d'une ville"),
+    limit: int = Query(6, ge=1, le=50, description="Nombre de salons populaires")
 ):
-    """Récupérer les salons populaires (les mieux notés)"""
-    return db.query(Salon).filter(
-        Salon.rating >= 4.5,
-        Salon.total_reviews >= 20
-    ).order_by(
-        Salon.rating.desc(),
-        Salon.total_reviews.desc()
-    ).limit(limit).all()
+    """Récupérer les salons populaires (moyenne bayésienne note / nombre d'avis), depuis l'instantané"""
+    return await response_cache.serve(
+        request, ["salons"],
+        lambda collector: run_db(db, popular_ranking.top, limit, city),
+        List[SalonResponse]
+    )
 
 @router.get("/nearby")
 async def get_nearby_salons(
-    lat: float = Query(..., description="Latitude"),
-    lng: float = Query(..., description="Longitude"),
-    radius: int = Query(10, description="Rayon en km"),
-    db: Session = Depends(get_db),
-    limit: int = Query(20)
+    lat: float = Query(..., ge=-90, le=90, description="Latitude"),
+    lng: float = Query(..., ge=-180, le=180, description="Longitude"),
+    radius: float = Query(10, gt=0, le=200, description="Rayon en km"),
+    db: Session = Depends(get_read_db),
+    limit: int = Query(20, ge=1, le=100, description="Nombre maximum de salons")
 ):
-    """Récupérer les salons à proximité (fonctionnalité future)"""
-    # Pour le MVP, on retourne tous les salons
-    # Dans une vraie app, on utiliserait PostGIS ou une API de géolocalisation
-    salons = db.query(Salon).order_by(Salon.rating.desc()).limit(limit).all()
+    """Récupérer les salons dans un rayon donné, du plus proche au plus éloigné"""
+    # Présélection par cellules geohash (plages sur l'index B-tree), puis rectangle englobant
+    lat_min, lat_max, lng_min, lng_max = bounding_box(lat, lng, radius)
+    cells = [
+        and_(Salon.geohash >= prefix, Salon.geohash < prefix + "~")
+        for prefix in sorted(covering_prefixes(lat, lng, radius))
+    ]
+    
+    def load(session: Session):
+        # Passe de distance sur (id, latitude, longitude) seulement, quelle que soit la densité
+        candidates = session.query(Salon.id, Salon.latitude, Salon.longitude).filter(
+            or_(*cells),
+            Salon.latitude.between(lat_min, lat_max),
+            Salon.longitude.between(lng_min, lng_max)
+        ).all()
+        
+        # Distance exacte, filtrage sur le rayon, puis les limit plus proches
+        in_radius = []
+        for salon_id, latitude, longitude in candidates:
+            distance = haversine_km(lat, lng, latitude, longitude)
+            if distance <= radius:
+                in_radius.append((distance, salon_id))
+        nearest = heapq.nsmallest(limit, in_radius)
+        if not nearest:
+            return []
+        
+        # Lignes complètes des seuls salons retournés
+        salons = {
+            salon.id: salon
+            for salon in session.query(Salon).filter(Salon.id.in_([salon_id for _, salon_id in nearest]))
+        }
+        return [(distance, salons[salon_id]) for distance, salon_id in nearest]
+    
+    nearby = await run_db(db, load)
     
     return {
         "center": {"lat": lat, "lng": lng},
         "radius": radius,
-        "salons": salons,
-        "message": "Géolocalisation en cours d'implémentation"
+        "salons": [
+            NearbySalonResponse(
+                **SalonResponse.model_validate(salon).model_dump(),
+                distance_km=round(distance, 3)
+            )
+            for distance, salon in nearby
+        ]
     }
 
 @router.get("/{salon_id}", response_model=SalonResponse)
-async def get_salon(salon_id: int, db: Session = Depends(get_db)):
+async def get_salon(salon_id: int, request: Request, db: Session = Depends(get_read_db)):
     """Récupérer un salon par son ID"""
-    salon = db.query(Salon).filter(Salon.id == salon_id).first()
-    
-    if not salon:
-        raise HTTPException(status_code=404, detail="Salon non trouvé")
+    def load(session: Session):
+        salon = session.query(Salon).filter(Salon.id == salon_id).first()
+        
+        if not salon:
+            raise HTTPException(status_code=404, detail="Salon non trouvé")
+        
+        return salon
     
-    return salon
+    return await response_cache.serve(
+        request, [f"salon:{salon_id}"],
+        lambda collector: run_db(db, load),
+        SalonResponse
+    )
 
 @router.post("/", response_model=SalonResponse)
 async def create_salon(salon: SalonCreate, db: Session = Depends(get_db)):
     """Créer un nouveau salon"""
-    db_salon = Salon(**salon.dict())
-    db.add(db_salon)
-    db.commit()
-    db.refresh(db_salon)
+    def save(session: Session):
+        db_salon = Salon(**salon.dict())
+        session.add(db_salon)
+        session.commit()
+        session.refresh(db_salon)
+        return db_salon
+    
+    db_salon = await run_db(db, save)
+    autocomplete_index.add(db_salon)
+    popular_ranking.invalidate()
+    await response_cache.invalidate_salon(db_salon.id)
     return db_salon
 
 @router.get("/{salon_id}/availability")
 async def get_salon_availability(
     salon_id: int,
     date: date = Query(...),
-    db: Session = Depends(get_db)
+    duration: int = Query(60, ge=15, le=480, description="Durée de la prestation en minutes"),
+    granularity: int = Query(SLOT_GRANULARITY_MINUTES, ge=5, le=240, description="Pas entre deux créneaux en minutes"),
+    db: Session = Depends(get_read_db)
 ):
     """Récupérer les créneaux disponibles pour un salon à une date donnée"""
-    salon = db.query(Salon).filter(Salon.id == salon_id).first()
-    
-    if not salon:
-        raise HTTPException(status_code=404, detail="Salon non trouvé")
-    
-    # Logique simplifiée : créneaux par heure de 9h à 18h
-    available_slots = []
-    for hour in range(9, 19):  # 9h à 18h
-        slot_time = f"{hour:02d}:00"
-        available_slots.append({
-            "time": slot_time,
-            "available": True,  # Simplification - à améliorer avec vraies réservations
-            "price": 45.0
-        })
+    def load(session: Session):
+        salon = session.query(Salon).filter(Salon.id == salon_id).first()
+        
+        if not salon:
+            raise HTTPException(status_code=404, detail="Salon non trouvé")
+        
+        return get_day_slots(session, salon, date, duration, granularity)
     
     return {
         "salon_id": salon_id,
         "date": date,
-        "slots": available_slots
+        "slots": await run_db(db, load)
     }
+
+@router.get("/{salon_id}/reviews", response_model=List[ReviewResponse])
+async def get_salon_reviews(
+    salon_id: int,
+    response: Response,
+    db: Session = Depends(get_read_db),
+    cursor: Optional[str] = Query(None, description="Curseur de la page suivante (en-tête X-Next-Cursor)"),
+    limit: int = Query(20, ge=1, le=100)
+):
+    """Récupérer les avis d'un salon, du plus récent au plus ancien"""
+    return await run_db(db, lambda session: paginated(
+        response, session.query(Review).filter(Review.salon_id == salon_id), "recent", REVIEW_SORT_KEYS,
+        limit, cursor
+    ))
+
+@router.post("/{salon_id}/reviews", response_model=ReviewResponse)
+async def create_salon_review(
+    salon_id: int,
+    review: ReviewCreate,
+    db: Session = Depends(get_db),
+    current_user: Principal = Depends(get_current_principal)
+):
+    """Publier un avis ; la note et le nombre d'avis du salon sont mis à jour dans la même transaction"""
+    client_id = current_user.id
+    
+    def save(session: Session):
+        if not session.query(Salon.id).filter(Salon.id == salon_id).first():
+            raise HTTPException(status_code=404, detail="Salon non trouvé")
+        
+        try:
+            db_review, rating = create_review(session, salon_id, client_id, review.rating, review.comment)
+        except DuplicateReview:
+            session.rollback()
+            raise HTTPException(status_code=409, detail="Vous avez déjà publié un avis sur ce salon")
+        session.commit()
+        session.refresh(db_review)
+        return db_review, rating
+    
+    db_review, rating = await run_db(db, save)
+    await rating_changed(salon_id, rating)
+    return db_review
@@ -0,0 +1,112 @@
+"""
+Archivage des réservations
+La table reservations ne garde que l'activité récente : les rendez-vous passés
+sortent des index partiels (statut « completed »), puis les plus anciens sont
+déplacés par lots vers reservations_archive (partitionnée par mois sur Postgres)
+"""
+
+import os
+from datetime import date, datetime, timedelta
+from typing import Iterator, List, Optional
+
+from sqlalchemy import func, literal, text
+from sqlalchemy.orm import Session
+
+from models import Reservation, ReservationArchive, ReservationSlot, active_reservation
+
+# Ancienneté (en jours de rendez-vous) au-delà de laquelle une réservation est archivée
+ARCHIVE_AFTER_DAYS = int(os.getenv("RESERVATION_ARCHIVE_AFTER_DAYS", "180"))
+
+# Lignes traitées par transaction : verrous courts, pas de gros journal de transaction
+ARCHIVE_BATCH_SIZE = int(os.getenv("RESERVATION_ARCHIVE_BATCH_SIZE", "1000"))
+
+ARCHIVED_COLUMNS = [
+    "id", "salon_id", "client_id", "service_type", "appointment_date", "duration_minutes", "end_date",
+    "price", "status", "payment_status", "stripe_payment_id", "client_notes", "created_at",
+]
+
+
+def _batch_ids(db: Session, *criteria, batch_size: int) -> List[int]:
+    """Identifiants du prochain lot ; SKIP LOCKED laisse passer les réservations en cours d'écriture"""
+    rows = db.query(Reservation.id).filter(*criteria).order_by(
+        Reservation.appointment_date, Reservation.id
+    ).limit(batch_size).with_for_update(skip_locked=True).all()
+    return [row[0] for row in rows]
+
+
+def complete_past_reservations(db: Session, now: Optional[datetime] = None,
+                               batch_size: int = ARCHIVE_BATCH_SIZE) -> int:
+    """Passer les rendez-vous confirmés terminés en « completed »
+
+    Ils quittent les index partiels des réservations actives ; leurs tranches
+    (reservation_slots) ne protègent plus rien et sont supprimées.
+    """
+    now = now or datetime.utcnow()
+    total = 0
+    while True:
+        ids = _batch_ids(db, active_reservation(), Reservation.end_date <= now, batch_size=batch_size)
+        if not ids:
+            return total
+        db.query(ReservationSlot).filter(
+            ReservationSlot.reservation_id.in_(ids)
+        ).delete(synchronize_session=False)
+        db.query(Reservation).filter(Reservation.id.in_(ids)).update(
+            {Reservation.status: "completed"}, synchronize_session=False
+        )
+        db.commit()
+        total += len(ids)
+
+
+def _months(start: date, end: date) -> Iterator[date]:
+    month = start.replace(day=1)
+    while month <= end:
+        yield month
+        month = (month + timedelta(days=32)).replace(day=1)
+
+
+def ensure_archive_partitions(db: Session, start: datetime, end: datetime):
+    """Postgres : créer les partitions mensuelles couvrant [start, end]"""
+    if db.get_bind().dialect.name != "postgresql":
+        return
+    for month in _months(start.date(), end.date()):
+        following = (month + timedelta(days=32)).replace(day=1)
+        db.execute(text(
+            f"CREATE TABLE IF NOT EXISTS reservations_archive_{month:%Y_%m} "
+            f"PARTITION OF reservations_archive "
+            f"FOR VALUES FROM ('{month.isoformat()}') TO ('{following.isoformat()}')"
+        ))
+
+
+def archive_reservations(db: Session, cutoff: Optional[datetime] = None,
+                         batch_size: int = ARCHIVE_BATCH_SIZE) -> int:
+    """Déplacer vers reservations_archive les réservations dont le rendez-vous précède cutoff
+
+    Chaque lot est copié puis supprimé dans la même transaction : une
+    interruption ne perd ni ne duplique aucune ligne.
+    """
+    cutoff = cutoff or datetime.utcnow() - timedelta(days=ARCHIVE_AFTER_DAYS)
+    archived_at = datetime.utcnow()
+    total = 0
+    while True:
+        ids = _batch_ids(
+            db, Reservation.appointment_date < cutoff, ~active_reservation(), batch_size=batch_size
+        )
+        if not ids:
+            return total
+        first, last = db.query(
+            func.min(Reservation.appointment_date), func.max(Reservation.appointment_date)
+        ).filter(Reservation.id.in_(ids)).one()
+        ensure_archive_partitions(db, first, last)
+
+        db.execute(ReservationArchive.__table__.insert().from_select(
+            ARCHIVED_COLUMNS + ["archived_at"],
+            db.query(*[getattr(Reservation, column) for column in ARCHIVED_COLUMNS], literal(archived_at))
+            .filter(Reservation.id.in_(ids))
+        ))
+        db.query(ReservationSlot).filter(
+            ReservationSlot.reservation_id.in_(ids)
+        ).delete(synchronize_session=False)
+        db.query(Reservation).filter(Reservation.id.in_(ids)).delete(synchronize_session=False)
+        db.commit()
+        total += len(ids)
+
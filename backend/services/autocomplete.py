@@ -0,0 +1,101 @@
+"""
+Autocomplétion des salons
+Index de préfixes en mémoire (tableau trié + bisect) sur les noms et villes,
+construit au démarrage et mis à jour à chaque création de salon
+"""
+
+import heapq
+import threading
+from bisect import bisect_left, insort
+from typing import Dict, List, Set, Tuple
+
+from sqlalchemy.orm import Session
+
+from models import Salon
+from services.normalize import tokenize
+
+
+class PrefixIndex:
+    """Tableau trié de (mot normalisé, id du salon) interrogé par bisect"""
+
+    def __init__(self):
+        self._keys: List[Tuple[str, int]] = []
+        self._salons: Dict[int, dict] = {}
+        self._lock = threading.Lock()
+        self.loaded = False
+
+    def _entries(self, salon: dict) -> Set[Tuple[str, int]]:
+        words = tokenize(salon["name"]) + tokenize(salon["city"])
+        return {(word, salon["id"]) for word in words}
+
+    def build(self, salons: List[dict]):
+        """Construire l'index complet (remplace le contenu existant)"""
+        keys = set()
+        for salon in salons:
+            keys |= self._entries(salon)
+        with self._lock:
+            self._salons = {salon["id"]: salon for salon in salons}
+            self._keys = sorted(keys)
+            self.loaded = True
+
+    def load(self, db: Session):
+        """Charger l'index depuis la base (colonnes utiles uniquement)"""
+        rows = db.query(Salon.id, Salon.name, Salon.city, Salon.rating).all()
+        self.build([
+            {"id": id, "name": name, "city": city, "rating": rating or 0.0}
+            for id, name, city, rating in rows
+        ])
+
+    def add(self, salon: Salon):
+        """Ajouter (ou remplacer) un salon sans reconstruire l'index"""
+        entry = {"id": salon.id, "name": salon.name, "city": salon.city, "rating": salon.rating or 0.0}
+        with self._lock:
+            if salon.id in self._salons:
+                for key in self._entries(self._salons[salon.id]):
+                    self._remove_key(key)
+            self._salons[salon.id] = entry
+            for key in self._entries(entry):
+                insort(self._keys, key)
+
+    def update_rating(self, salon_id: int, rating: float):
+        salon = self._salons.get(salon_id)
+        if salon is not None:
+            self._salons[salon_id] = {**salon, "rating": rating or 0.0}
+
+    def _remove_key(self, key: Tuple[str, int]):
+        index = bisect_left(self._keys, key)
+        if index < len(self._keys) and self._keys[index] == key:
+            del self._keys[index]
+
+    def _prefix_ids(self, prefix: str) -> Set[int]:
+        keys = self._keys
+        index = bisect_left(keys, (prefix, -1))
+        ids = set()
+        while index < len(keys) and keys[index][0].startswith(prefix):
+            ids.add(keys[index][1])
+            index += 1
+        return ids
+
+    def search(self, q: str, limit: int = 8) -> List[dict]:
+        """Salons dont chaque mot saisi préfixe un mot du nom ou de la ville, par note décroissante"""
+        terms = tokenize(q)
+        if not terms:
+            return []
+
+        ids = self._prefix_ids(terms[0])
+        for term in terms[1:]:
+            if not ids:
+                break
+            ids &= self._prefix_ids(term)
+
+        salons = [self._salons[id] for id in ids if id in self._salons]
+        return heapq.nlargest(limit, salons, key=lambda salon: (salon["rating"], -salon["id"]))
+
+    def reset(self):
+        with self._lock:
+            self._keys = []
+            self._salons = {}
+            self.loaded = False
+
+
+autocomplete_index = PrefixIndex()
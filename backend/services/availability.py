@@ -0,0 +1,213 @@
+"""
+Moteur de disponibilités Bookinails
+Calcul des créneaux libres d'un salon à partir des réservations confirmées
+et des créneaux bloqués par un paiement en cours
+"""
+
+import os
+from datetime import date, datetime, time, timedelta
+from typing import List, Tuple
+
+from sqlalchemy import and_, exists, func
+from sqlalchemy.orm import Session
+
+from models import Reservation, ReservationSlot, Salon, active_reservation
+from services.availability_store import (
+    BUCKET_MINUTES, busy_clause, get_day_mask, is_materialized, mask_to_intervals
+)
+from services.booking import slot_keys
+
+# Granularité par défaut des créneaux proposés (en minutes)
+SLOT_GRANULARITY_MINUTES = int(os.getenv("SLOT_GRANULARITY_MINUTES", "30"))
+
+# Horaires utilisés quand le salon n'a pas renseigné les siens
+DEFAULT_OPEN_TIME = time(9, 0)
+DEFAULT_CLOSE_TIME = time(19, 0)
+
+# Prix indicatif affiché sur les créneaux
+DEFAULT_SLOT_PRICE = 45.0
+
+Interval = Tuple[int, int]
+
+
+def to_minutes(value: time) -> int:
+    """Convertir une heure en minutes depuis minuit"""
+    return value.hour * 60 + value.minute
+
+
+def format_minutes(minutes: int) -> str:
+    """Formater des minutes depuis minuit en HH:MM"""
+    return f"{minutes // 60:02d}:{minutes % 60:02d}"
+
+
+def opening_window(open_time, close_time) -> Interval:
+    """Fenêtre d'ouverture d'un salon, en minutes depuis minuit"""
+    return (
+        to_minutes(open_time or DEFAULT_OPEN_TIME),
+        to_minutes(close_time or DEFAULT_CLOSE_TIME),
+    )
+
+
+def load_busy_intervals(db: Session, salon_id: int, day: date) -> List[Interval]:
+    """Charger les réservations confirmées d'une journée en une seule requête indexée"""
+    day_start = datetime.combine(day, time.min)
+    rows = db.query(
+        Reservation.appointment_date,
+        Reservation.duration_minutes
+    ).filter(
+        Reservation.salon_id == salon_id,
+        Reservation.appointment_date >= day_start,
+        Reservation.appointment_date < day_start + timedelta(days=1),
+        active_reservation()
+    ).all()
+
+    # Bornes arrondies vers l'extérieur aux tranches des bitmaps et des clés de réservation
+    intervals = []
+    for appointment_date, duration in rows:
+        start = appointment_date.hour * 60 + appointment_date.minute
+        end = start + (duration or 60)
+        intervals.append((start - start % BUCKET_MINUTES, -(-end // BUCKET_MINUTES) * BUCKET_MINUTES))
+    return intervals
+
+
+def active_hold():
+    """Condition SQL : tranche bloquée par un paiement en cours (pas encore de réservation)"""
+    return and_(ReservationSlot.reservation_id.is_(None), ReservationSlot.expires_at > datetime.utcnow())
+
+
+def load_held_intervals(db: Session, salon_id: int, day: date) -> List[Interval]:
+    """Tranches bloquées d'une journée (parcours de la clé primaire salon, tranche)
+
+    Les blocages ne figurent pas dans les bitmaps : ils expirent sans écriture,
+    on les lit donc à chaque calcul de disponibilités.
+    """
+    day_start = datetime.combine(day, time.min)
+    rows = db.query(ReservationSlot.slot_start).filter(
+        ReservationSlot.salon_id == salon_id,
+        ReservationSlot.slot_start >= day_start,
+        ReservationSlot.slot_start < day_start + timedelta(days=1),
+        active_hold()
+    ).all()
+    return [
+        (to_minutes(slot_start.time()), to_minutes(slot_start.time()) + BUCKET_MINUTES)
+        for slot_start, in rows
+    ]
+
+
+def merge_intervals(intervals: List[Interval]) -> List[Interval]:
+    """Fusionner des intervalles qui se chevauchent (ou se touchent)"""
+    merged: List[Interval] = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1]:
+            if end > merged[-1][1]:
+                merged[-1] = (merged[-1][0], end)
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def compute_free_slots(
+    window: Interval,
+    busy: List[Interval],
+    duration: int = 60,
+    granularity: int = SLOT_GRANULARITY_MINUTES
+) -> List[Tuple[int, bool]]:
+    """Balayer la journée et indiquer pour chaque début de créneau s'il est libre
+
+    Les intervalles occupés sont fusionnés puis parcourus avec un seul pointeur,
+    les débuts de créneau étant croissants : O(n log n + créneaux).
+    """
+    open_minutes, close_minutes = window
+    merged = merge_intervals(busy)
+
+    slots = []
+    index = 0
+    start = open_minutes
+    while start + duration <= close_minutes:
+        while index < len(merged) and merged[index][1] <= start:
+            index += 1
+        available = index == len(merged) or merged[index][0] >= start + duration
+        slots.append((start, available))
+        start += granularity
+    return slots
+
+
+def get_day_slots(
+    db: Session,
+    salon,
+    day: date,
+    duration: int = 60,
+    granularity: int = SLOT_GRANULARITY_MINUTES
+) -> List[dict]:
+    """Créneaux d'un salon pour une journée, au format de l'API
+
+    Dans l'horizon matérialisé, l'occupation est lue dans le bitmap du
+    salon-jour ; au-delà, elle est recalculée depuis les réservations.
+    Les créneaux bloqués par un paiement en cours sont occupés dans les deux cas.
+    """
+    if is_materialized(day):
+        busy = mask_to_intervals(get_day_mask(db, salon.id, day))
+    else:
+        busy = load_busy_intervals(db, salon.id, day)
+    busy += load_held_intervals(db, salon.id, day)
+    window = opening_window(salon.open_time, salon.close_time)
+
+    return [
+        {
+            "time": format_minutes(start),
+            "available": available,
+            "price": DEFAULT_SLOT_PRICE
+        }
+        for start, available in compute_free_slots(window, busy, duration, granularity)
+    ]
+
+
+def salon_open_clause(slot_start: datetime, slot_end: datetime):
+    """Condition SQL : salon ouvert sur toute la durée du créneau"""
+    if slot_end.date() != slot_start.date():
+        end_time = time.max
+    else:
+        end_time = slot_end.time()
+
+    return and_(
+        func.coalesce(Salon.open_time, DEFAULT_OPEN_TIME) <= slot_start.time(),
+        func.coalesce(Salon.close_time, DEFAULT_CLOSE_TIME) >= end_time
+    )
+
+
+def salon_free_clause(slot_start: datetime, slot_end: datetime):
+    """Condition SQL : salon ouvert sur le créneau et sans réservation qui le chevauche
+
+    Évaluée dans la requête de recherche (anti-jointure), avant la pagination.
+    """
+    overlapping = exists().where(
+        Reservation.salon_id == Salon.id,
+        active_reservation(),
+        Reservation.appointment_date < slot_end,
+        Reservation.end_date > slot_start
+    )
+
+    return and_(salon_open_clause(slot_start, slot_end), ~overlapping)
+
+
+def held_clause(slot_start: datetime, slot_end: datetime):
+    """Condition SQL : une tranche du créneau est bloquée par un paiement en cours"""
+    return exists().where(
+        ReservationSlot.salon_id == Salon.id,
+        ReservationSlot.slot_start.in_(slot_keys(slot_start, int((slot_end - slot_start).total_seconds() // 60))),
+        active_hold()
+    )
+
+
+def availability_filter(slot_start: datetime, slot_end: datetime):
+    """Filtre de disponibilité pour la recherche de salons
+
+    Lit les bitmaps matérialisés quand le jour est dans l'horizon, sinon
+    retombe sur l'anti-jointure avec les réservations ; les créneaux bloqués
+    par un paiement en cours sont exclus dans les deux cas.
+    """
+    if is_materialized(slot_start.date()):
+        free = and_(salon_open_clause(slot_start, slot_end), ~busy_clause(slot_start, slot_end))
+    else:
+        free = salon_free_clause(slot_start, slot_end)
+    return and_(free, ~held_clause(slot_start, slot_end))
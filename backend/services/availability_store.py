@@ -0,0 +1,265 @@
+"""
+Bitmaps de disponibilité matérialisés
+Un masque de 288 bits par salon et par jour (1 bit = 1 tranche de 5 minutes
+occupée, la granularité des clés de reservation_slots), mis à jour de façon
+incrémentale à chaque écriture de réservation. Stocké en mots entiers pour que
+la recherche teste l'occupation par ET binaire directement en SQL
+"""
+
+import os
+from datetime import date, datetime, time, timedelta
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from sqlalchemy import exists, or_, text
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.orm import Session
+
+from db import dialect_insert
+from models import Reservation, Salon, SalonDayAvailability, active_reservation
+from services.booking import SLOT_KEY_MINUTES
+
+# Mêmes tranches que les clés de réservation : bitmap et réservation donnent la même réponse
+BUCKET_MINUTES = SLOT_KEY_MINUTES
+BUCKETS_PER_DAY = 24 * 60 // BUCKET_MINUTES
+# Mots de 48 bits (4 heures) : positifs dans un BIGINT signé
+WORD_BITS = 48
+WORD_MASK = (1 << WORD_BITS) - 1
+WORD_COLUMNS = [
+    SalonDayAvailability.busy_0, SalonDayAvailability.busy_1, SalonDayAvailability.busy_2,
+    SalonDayAvailability.busy_3, SalonDayAvailability.busy_4, SalonDayAvailability.busy_5,
+]
+
+# Nombre de jours à venir garantis par la reconstruction
+AVAILABILITY_HORIZON_DAYS = int(os.getenv("AVAILABILITY_HORIZON_DAYS", "60"))
+
+# Attente maximale (Postgres) derrière la mise à jour concurrente d'un même salon-jour.
+# Le verrou de ligne n'est tenu que de la dernière instruction d'une réservation à son
+# commit : plus généreux que SLOT_LOCK_TIMEOUT_MS, posé plus tôt dans la transaction
+AVAILABILITY_LOCK_TIMEOUT_MS = int(os.getenv("AVAILABILITY_LOCK_TIMEOUT_MS", "5000"))
+
+# Réservations créées pendant une reconstruction, réappliquées ensuite (décalage d'horloge compris)
+REBUILD_CATCH_UP = timedelta(minutes=1)
+
+
+class AvailabilityBusy(Exception):
+    """Le bitmap du salon-jour n'a pas pu être mis à jour à temps (verrou tenu trop longtemps)"""
+
+
+def split_mask(mask: int) -> Dict[str, int]:
+    """Masque de la journée -> valeurs des colonnes busy_0 ... busy_5"""
+    return {column.key: (mask >> (i * WORD_BITS)) & WORD_MASK for i, column in enumerate(WORD_COLUMNS)}
+
+
+def join_mask(words) -> int:
+    """Valeurs des colonnes busy_0 ... busy_5 -> masque de la journée"""
+    mask = 0
+    for i, word in enumerate(words):
+        mask |= (word or 0) << (i * WORD_BITS)
+    return mask
+
+
+def row_mask(row: SalonDayAvailability) -> int:
+    return join_mask(getattr(row, column.key) for column in WORD_COLUMNS)
+
+
+def set_row_mask(row: SalonDayAvailability, mask: int):
+    for key, word in split_mask(mask).items():
+        setattr(row, key, word)
+
+
+def day_masks(start: datetime, duration: int) -> Iterator[Tuple[date, int]]:
+    """Découper un rendez-vous en (jour, masque des tranches touchées)
+
+    Les bornes sont arrondies vers l'extérieur, comme les clés de
+    reservation_slots : un rendez-vous à 10h02 occupe la tranche de 10h00.
+    """
+    end = start + timedelta(minutes=duration or 60)
+    day = start.date()
+    while datetime.combine(day, time.min) < end:
+        day_start = datetime.combine(day, time.min)
+        first_minute = max(0, int((start - day_start).total_seconds() // 60))
+        last_minute = min(24 * 60, -int(-(end - day_start).total_seconds() // 60))
+        first = first_minute // BUCKET_MINUTES
+        last = -(-last_minute // BUCKET_MINUTES)
+        if last > first:
+            yield day, ((1 << (last - first)) - 1) << first
+        day += timedelta(days=1)
+
+
+def mask_to_intervals(mask: int) -> List[Tuple[int, int]]:
+    """Convertir un masque en intervalles occupés (minutes depuis minuit)"""
+    intervals = []
+    bucket = 0
+    while mask >> bucket:
+        if (mask >> bucket) & 1:
+            first = bucket
+            while (mask >> bucket) & 1:
+                bucket += 1
+            intervals.append((first * BUCKET_MINUTES, bucket * BUCKET_MINUTES))
+        else:
+            bucket += 1
+    return intervals
+
+
+def is_materialized(day: date) -> bool:
+    """Le jour fait-il partie de l'horizon couvert par les bitmaps ?"""
+    today = date.today()
+    return today <= day <= today + timedelta(days=AVAILABILITY_HORIZON_DAYS)
+
+
+def _update_words(db: Session, statement):
+    """Exécuter une mise à jour de bitmap ; lock_timeout traduit en AvailabilityBusy"""
+    if db.get_bind().dialect.name == "postgresql":
+        db.execute(text(f"SET LOCAL lock_timeout = '{AVAILABILITY_LOCK_TIMEOUT_MS}ms'"))
+    try:
+        db.execute(statement)
+    except DBAPIError as e:
+        # 55P03 : lock_not_available (voir services.booking._insert_slots)
+        if getattr(e.orig, "pgcode", None) == "55P03":
+            raise AvailabilityBusy(str(e.orig)) from e
+        raise
+
+
+def _or_mask(db: Session, salon_id: int, day: date, mask: int):
+    """busy_n = busy_n | masque, ligne créée au besoin (INSERT ... ON CONFLICT DO UPDATE)"""
+    table = SalonDayAvailability.__table__
+    words = split_mask(mask)
+    statement = dialect_insert(db, table).values(
+        day=day, salon_id=salon_id, updated_at=datetime.utcnow(), **words
+    )
+    statement = statement.on_conflict_do_update(
+        index_elements=[table.c.day, table.c.salon_id],
+        set_={
+            **{key: table.c[key].bitwise_or(statement.excluded[key]) for key, word in words.items() if word},
+            "updated_at": statement.excluded.updated_at,
+        }
+    )
+    _update_words(db, statement)
+
+
+def mark_busy(db: Session, salon_id: int, start: datetime, duration: int):
+    """Marquer les tranches d'un rendez-vous comme occupées
+
+    Une instruction par jour, sans lecture préalable ni SELECT ... FOR UPDATE :
+    les réservations d'un même salon-jour ne se sérialisent que de cette
+    instruction au commit. À appeler en dernier dans la transaction.
+    """
+    for day, mask in day_masks(start, duration):
+        _or_mask(db, salon_id, day, mask)
+
+
+def mark_free(db: Session, salon_id: int, start: datetime, duration: int, reservation_id: int):
+    """Libérer les tranches d'un rendez-vous annulé
+
+    Seuls les bits concernés sont recalculés : ceux encore touchés par une
+    autre réservation confirmée (tranche partagée) restent occupés. Une seule
+    instruction par jour : busy_n = (busy_n & ~masque) | autres.
+    """
+    table = SalonDayAvailability.__table__
+    for day, mask in day_masks(start, duration):
+        first = (mask & -mask).bit_length() - 1
+        window_start = datetime.combine(day, time.min) + timedelta(minutes=first * BUCKET_MINUTES)
+        window_end = datetime.combine(day, time.min) + timedelta(minutes=mask.bit_length() * BUCKET_MINUTES)
+        others = db.query(Reservation.appointment_date, Reservation.duration_minutes).filter(
+            Reservation.salon_id == salon_id,
+            Reservation.id != reservation_id,
+            active_reservation(),
+            Reservation.appointment_date < window_end,
+            Reservation.end_date > window_start
+        ).all()
+        kept = 0
+        for other_start, other_duration in others:
+            for other_day, other_mask in day_masks(other_start, other_duration):
+                if other_day == day:
+                    kept |= other_mask & mask
+
+        cleared, kept = split_mask(mask), split_mask(kept)
+        _update_words(db, table.update().where(
+            table.c.day == day,
+            table.c.salon_id == salon_id
+        ).values(
+            **{
+                key: table.c[key].bitwise_and(~word & WORD_MASK).bitwise_or(kept[key])
+                for key, word in cleared.items() if word
+            },
+            updated_at=datetime.utcnow()
+        ))
+
+
+def get_day_mask(db: Session, salon_id: int, day: date) -> int:
+    """Masque d'occupation d'un salon pour une journée (lecture par clé primaire)"""
+    row = db.query(*WORD_COLUMNS).filter(
+        SalonDayAvailability.day == day,
+        SalonDayAvailability.salon_id == salon_id
+    ).first()
+    return join_mask(row) if row else 0
+
+
+def busy_clause(slot_start: datetime, slot_end: datetime):
+    """Condition SQL : le bitmap du salon est occupé sur au moins une tranche du créneau
+
+    ET binaire évalué par la base, mot par mot, sur la ligne (jour, salon) :
+    la recherche n'a rien à charger en Python, quel que soit le nombre de salons.
+    """
+    clauses = []
+    for day, slot_mask in day_masks(slot_start, int((slot_end - slot_start).total_seconds() // 60)):
+        overlaps = [
+            column.bitwise_and(word) != 0
+            for column, word in zip(WORD_COLUMNS, split_mask(slot_mask).values()) if word
+        ]
+        clauses.append(exists().where(
+            SalonDayAvailability.day == day,
+            SalonDayAvailability.salon_id == Salon.id,
+            or_(*overlaps)
+        ))
+    return or_(*clauses)
+
+
+def _horizon_masks(db: Session, start_day: date, end_day: date, *criteria) -> Dict[Tuple[date, int], int]:
+    """Masques (jour, salon) des réservations confirmées entre start_day et end_day"""
+    masks: Dict[Tuple[date, int], int] = {}
+    rows = db.query(
+        Reservation.salon_id,
+        Reservation.appointment_date,
+        Reservation.duration_minutes
+    ).filter(
+        active_reservation(),
+        Reservation.appointment_date < datetime.combine(end_day, time.min),
+        Reservation.end_date > datetime.combine(start_day, time.min),
+        *criteria
+    ).yield_per(1000)
+    for salon_id, appointment_date, duration in rows:
+        for day, mask in day_masks(appointment_date, duration):
+            if start_day <= day < end_day:
+                masks[(day, salon_id)] = masks.get((day, salon_id), 0) | mask
+    return masks
+
+
+def rebuild_availability(db: Session, days: int = AVAILABILITY_HORIZON_DAYS, start_day: Optional[date] = None):
+    """Reconstruire les bitmaps de l'horizon à partir des réservations confirmées
+
+    Répare toute dérive (archivage, correction manuelle en SQL) ; lancé chaque
+    nuit par database/archive.py. Les réservations enregistrées pendant la
+    reconstruction sont réappliquées avant le commit : aucune n'est perdue.
+    """
+    started_at = datetime.utcnow()
+    start_day = start_day or date.today()
+    end_day = start_day + timedelta(days=days + 1)
+
+    masks = _horizon_masks(db, start_day, end_day)
+    db.query(SalonDayAvailability).filter(
+        SalonDayAvailability.day >= start_day,
+        SalonDayAvailability.day < end_day
+    ).delete(synchronize_session=False)
+    db.bulk_insert_mappings(SalonDayAvailability, [
+        {"day": day, "salon_id": salon_id, **split_mask(mask)}
+        for (day, salon_id), mask in masks.items()
+    ])
+
+    # Réservations validées entre la lecture et la suppression : remises par OU binaire
+    for (day, salon_id), mask in _horizon_masks(
+        db, start_day, end_day, Reservation.created_at >= started_at - REBUILD_CATCH_UP
+    ).items():
+        _or_mask(db, salon_id, day, mask)
+    db.commit()
+    return len(masks)
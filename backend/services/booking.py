@@ -0,0 +1,129 @@
+"""
+Sérialisation des réservations par créneau
+Chaque réservation insère une clé (salon, tranche de 5 minutes) ; la clé
+primaire de reservation_slots garantit qu'une tranche n'est prise qu'une fois.
+Pendant un paiement Stripe, les mêmes clés portent un blocage temporaire.
+"""
+
+import os
+import uuid
+from datetime import datetime, timedelta
+from typing import List
+
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError, IntegrityError
+from sqlalchemy.orm import Session
+
+from models import Reservation, ReservationSlot
+
+SLOT_KEY_MINUTES = 5
+
+# Attente maximale (Postgres) derrière une transaction concurrente sur la même tranche
+SLOT_LOCK_TIMEOUT_MS = int(os.getenv("SLOT_LOCK_TIMEOUT_MS", "500"))
+
+
+class SlotConflict(Exception):
+    """Le créneau demandé est déjà occupé"""
+
+
+def slot_keys(start: datetime, duration: int) -> List[datetime]:
+    """Débuts des tranches de 5 minutes couvertes par un rendez-vous"""
+    end = start + timedelta(minutes=duration or 60)
+    key = start.replace(second=0, microsecond=0)
+    key -= timedelta(minutes=key.minute % SLOT_KEY_MINUTES)
+
+    keys = []
+    while key < end:
+        keys.append(key)
+        key += timedelta(minutes=SLOT_KEY_MINUTES)
+    return keys
+
+
+def _insert_slots(db: Session, salon_id: int, start: datetime, duration: int, **fields) -> int:
+    """Insérer les clés d'un créneau en une seule instruction
+
+    Les blocages expirés encore présents sur ces clés sont d'abord purgés
+    (recherche par clé primaire). Le perdant d'une course reçoit une violation
+    d'unicité (ou un lock_timeout sur Postgres) traduite en SlotConflict ;
+    la transaction doit alors être annulée.
+    """
+    if db.get_bind().dialect.name == "postgresql":
+        db.execute(text(f"SET LOCAL lock_timeout = '{SLOT_LOCK_TIMEOUT_MS}ms'"))
+
+    keys = slot_keys(start, duration)
+    db.query(ReservationSlot).filter(
+        ReservationSlot.salon_id == salon_id,
+        ReservationSlot.slot_start.in_(keys),
+        ReservationSlot.expires_at < datetime.utcnow()
+    ).delete(synchronize_session=False)
+
+    rows = [{"salon_id": salon_id, "slot_start": key, **fields} for key in keys]
+    try:
+        db.execute(ReservationSlot.__table__.insert(), rows)
+    except IntegrityError as e:
+        raise SlotConflict(str(e.orig)) from e
+    except DBAPIError as e:
+        # 55P03 : lock_not_available, la transaction concurrente n'a pas fini à temps
+        # (OperationalError avec psycopg2, erreur générique avec asyncpg)
+        if getattr(e.orig, "pgcode", None) == "55P03":
+            raise SlotConflict(str(e.orig)) from e
+        raise
+    return len(keys)
+
+
+def claim_slots(db: Session, reservation: Reservation):
+    """Réserver les tranches d'un rendez-vous dans la transaction courante"""
+    _insert_slots(
+        db, reservation.salon_id, reservation.appointment_date,
+        reservation.duration_minutes, reservation_id=reservation.id
+    )
+
+
+def release_slots(db: Session, reservation_id: int):
+    """Libérer les tranches d'une réservation annulée"""
+    db.query(ReservationSlot).filter(
+        ReservationSlot.reservation_id == reservation_id
+    ).delete(synchronize_session=False)
+
+
+def hold_slots(db: Session, salon_id: int, start: datetime, duration: int, expires_at: datetime) -> str:
+    """Bloquer un créneau jusqu'à expires_at (paiement en cours) et renvoyer le jeton du blocage"""
+    token = uuid.uuid4().hex
+    _insert_slots(db, salon_id, start, duration, hold_token=token, expires_at=expires_at)
+    return token
+
+
+def confirm_hold(db: Session, hold_token: str, reservation: Reservation):
+    """Transformer un blocage en réservation
+
+    Si le blocage a expiré entre-temps (et a pu être purgé), les tranches
+    sont réclamées à nouveau, ce qui peut lever SlotConflict.
+    """
+    keys = slot_keys(reservation.appointment_date, reservation.duration_minutes)
+    converted = db.query(ReservationSlot).filter(
+        ReservationSlot.hold_token == hold_token,
+        ReservationSlot.reservation_id.is_(None)
+    ).update({
+        ReservationSlot.reservation_id: reservation.id,
+        ReservationSlot.hold_token: None,
+        ReservationSlot.expires_at: None
+    }, synchronize_session=False)
+
+    if converted != len(keys):
+        release_slots(db, reservation.id)
+        claim_slots(db, reservation)
+
+
+def release_hold(db: Session, hold_token: str) -> int:
+    """Libérer un blocage (paiement annulé ou session expirée)"""
+    return db.query(ReservationSlot).filter(
+        ReservationSlot.hold_token == hold_token,
+        ReservationSlot.reservation_id.is_(None)
+    ).delete(synchronize_session=False)
+
+
+def sweep_expired_holds(db: Session) -> int:
+    """Purger les blocages expirés (parcours de l'index sur expires_at)"""
+    return db.query(ReservationSlot).filter(
+        ReservationSlot.expires_at < datetime.utcnow()
+    ).delete(synchronize_session=False)
@@ -0,0 +1,321 @@
+"""
+Cache des réponses HTTP des endpoints de lecture des salons
+Corps JSON mis en cache avec ETag / Last-Modified (réponses 304 sur requête
+conditionnelle), servis périmés le temps d'une revalidation, et invalidés
+par étiquettes (« salons », « salon:<id> ») ; les requêtes identiques
+arrivant sur une entrée absente partagent une seule construction
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import asdict, dataclass, field
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from fastapi import Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.encoders import jsonable_encoder
+from pydantic import TypeAdapter
+
+from services.singleflight import SingleFlight
+
+# Durée pendant laquelle une réponse est servie sans revalidation (secondes)
+CACHE_TTL_SECONDS = int(os.getenv("CACHE_TTL_SECONDS", "60"))
+# Durée supplémentaire pendant laquelle une réponse périmée peut encore être servie
+CACHE_STALE_SECONDS = int(os.getenv("CACHE_STALE_SECONDS", "300"))
+# Bornes du cache local
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "1000"))
+CACHE_MAX_BYTES = int(os.getenv("CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+# Backend partagé (redis://...) ; vide = cache local au processus
+CACHE_URL = os.getenv("CACHE_URL", "")
+# Délai maximal d'une opération sur le backend partagé : au-delà, la requête est servie sans cache
+CACHE_TIMEOUT_SECONDS = float(os.getenv("CACHE_TIMEOUT_SECONDS", "0.25"))
+
+# En-têtes posés par les endpoints et conservés avec la réponse
+CACHED_HEADERS = ("X-Next-Cursor",)
+
+
+@dataclass
+class CacheEntry:
+    body: bytes
+    etag: str
+    last_modified: float
+    stored_at: float
+    headers: Dict[str, str] = field(default_factory=dict)
+
+    @property
+    def size(self) -> int:
+        return len(self.body)
+
+
+class LocalCacheBackend:
+    """LRU en mémoire borné en nombre d'entrées et en octets"""
+
+    # Opérations en mémoire : appelées directement depuis la boucle d'événements
+    blocking = False
+    errors: Tuple[type, ...] = ()
+
+    def __init__(self, max_entries: int = CACHE_MAX_ENTRIES, max_bytes: int = CACHE_MAX_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, Tuple[CacheEntry, float]]" = OrderedDict()
+        self._versions: Dict[str, int] = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[CacheEntry]:
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None:
+                return None
+            entry, expires_at = item
+            if time.time() >= expires_at:
+                self._pop(key)
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key: str, entry: CacheEntry, ttl: int):
+        if entry.size > self.max_bytes:
+            return
+        with self._lock:
+            self._pop(key)
+            self._entries[key] = (entry, time.time() + ttl)
+            self._bytes += entry.size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._pop(next(iter(self._entries)))
+
+    def _pop(self, key: str):
+        item = self._entries.pop(key, None)
+        if item is not None:
+            self._bytes -= item[0].size
+
+    def versions(self, tags: List[str]) -> List[int]:
+        with self._lock:
+            return [self._versions.get(tag, 0) for tag in tags]
+
+    def bump(self, tags: Iterable[str]):
+        with self._lock:
+            for tag in tags:
+                self._versions[tag] = self._versions.get(tag, 0) + 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._versions.clear()
+            self._bytes = 0
+
+
+class RedisCacheBackend:
+    """Cache partagé entre les workers (Redis), mêmes opérations que le cache local
+
+    Client synchrone : ResponseCache l'appelle dans le pool de threads, et
+    traite ses erreurs (Redis lent ou arrêté) comme un cache absent.
+    """
+
+    PREFIX = "bookinails:cache:"
+    blocking = True
+
+    def __init__(self, url: str, timeout: float = CACHE_TIMEOUT_SECONDS):
+        import redis
+
+        self.errors = (redis.exceptions.RedisError,)
+        self._redis = redis.Redis.from_url(url, socket_timeout=timeout, socket_connect_timeout=timeout)
+
+    def get(self, key: str) -> Optional[CacheEntry]:
+        raw = self._redis.get(self.PREFIX + key)
+        if raw is None:
+            return None
+        data = json.loads(raw)
+        data["body"] = data["body"].encode()
+        return CacheEntry(**data)
+
+    def set(self, key: str, entry: CacheEntry, ttl: int):
+        data = {**asdict(entry), "body": entry.body.decode()}
+        self._redis.set(self.PREFIX + key, json.dumps(data), ex=ttl)
+
+    def versions(self, tags: List[str]) -> List[int]:
+        if not tags:
+            return []
+        return [int(value or 0) for value in self._redis.mget([self.PREFIX + "tag:" + tag for tag in tags])]
+
+    def bump(self, tags: Iterable[str]):
+        pipeline = self._redis.pipeline()
+        for tag in tags:
+            pipeline.incr(self.PREFIX + "tag:" + tag)
+        pipeline.execute()
+
+    def clear(self):
+        for key in self._redis.scan_iter(self.PREFIX + "*"):
+            self._redis.delete(key)
+
+
+def _http_date(timestamp: float) -> str:
+    return format_datetime(datetime.fromtimestamp(int(timestamp), tz=timezone.utc), usegmt=True)
+
+
+def _not_modified(request: Request, entry: CacheEntry) -> bool:
+    """Requête conditionnelle satisfaite par l'entrée (If-None-Match prioritaire)"""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match:
+        tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+        return "*" in tags or entry.etag in tags
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            since = parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+        return int(entry.last_modified) <= since
+    return False
+
+
+class ResponseCache:
+    """Cache des réponses JSON des endpoints de lecture
+
+    La clé d'une réponse inclut la version de ses étiquettes : invalider une
+    étiquette revient à incrémenter sa version, les anciennes entrées ne sont
+    plus jamais lues et sortent du cache par LRU ou expiration.
+    """
+
+    def __init__(self, backend, ttl: int = CACHE_TTL_SECONDS, stale_ttl: int = CACHE_STALE_SECONDS):
+        self.backend = backend
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self._revalidating: Set[str] = set()
+        self._lock = threading.Lock()
+        self._flights = SingleFlight()
+
+    async def _call(self, method: Callable, *args, default: Any = None) -> Any:
+        """Opération du backend (pool de threads s'il est distant) ; en erreur, default"""
+        try:
+            if self.backend.blocking:
+                return await run_in_threadpool(method, *args)
+            return method(*args)
+        except self.backend.errors as e:
+            print(f"Cache indisponible ({method.__name__}): {e}")
+            return default
+
+    async def _key(self, request: Request, tags: List[str], key: Optional[str] = None) -> Optional[str]:
+        """Clé de l'entrée, versions des étiquettes comprises ; None si le backend ne répond pas"""
+        if key is None:
+            query = "&".join(f"{name}={value}" for name, value in sorted(request.query_params.multi_items()))
+            key = f"{request.url.path}?{query}"
+        versions = await self._call(self.backend.versions, tags)
+        if versions is None:
+            return None
+        return key + "#" + ",".join(f"{tag}:{version}" for tag, version in zip(tags, versions))
+
+    def _claim_revalidation(self, key: str) -> bool:
+        with self._lock:
+            if key in self._revalidating:
+                return False
+            self._revalidating.add(key)
+            return True
+
+    async def _build(
+        self,
+        key: Optional[str],
+        build: Callable[[Response], Awaitable[Any]],
+        model: Any,
+        previous: Optional[CacheEntry]
+    ) -> CacheEntry:
+        collector = Response()
+        content = await build(collector)
+        if model is not None:
+            content = TypeAdapter(model).dump_python(content, mode="json")
+        body = json.dumps(jsonable_encoder(content), ensure_ascii=False, separators=(",", ":")).encode()
+
+        now = time.time()
+        etag = '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+        # Contenu identique : la date de dernière modification ne bouge pas
+        last_modified = previous.last_modified if previous and previous.etag == etag else now
+        entry = CacheEntry(
+            body=body,
+            etag=etag,
+            last_modified=last_modified,
+            stored_at=now,
+            headers={name: collector.headers[name] for name in CACHED_HEADERS if name in collector.headers},
+        )
+        if key is not None:
+            await self._call(self.backend.set, key, entry, self.ttl + self.stale_ttl)
+        return entry
+
+    def _respond(self, request: Request, entry: CacheEntry, status: str) -> Response:
+        headers = {
+            "ETag": entry.etag,
+            "Last-Modified": _http_date(entry.last_modified),
+            "Cache-Control": f"public, max-age={self.ttl}, stale-while-revalidate={self.stale_ttl}",
+            "X-Cache": status,
+            **entry.headers,
+        }
+        if _not_modified(request, entry):
+            return Response(status_code=304, headers=headers)
+        return Response(content=entry.body, media_type="application/json", headers=headers)
+
+    async def serve(
+        self,
+        request: Request,
+        tags: List[str],
+        build: Callable[[Response], Awaitable[Any]],
+        model: Any = None,
+        key: Optional[str] = None
+    ) -> Response:
+        """Réponse en cache pour la requête, ou construite par build(response) puis mise en cache
+
+        build est asynchrone (accès base via db.run_db) et reçoit une Response
+        dont les en-têtes (X-Next-Cursor) sont conservés ;
+        model est le type de réponse utilisé pour sérialiser le résultat ;
+        key remplace la clé par défaut (chemin et paramètres de la requête).
+        Backend indisponible : réponse construite et servie comme un MISS.
+        """
+        key = await self._key(request, tags, key)
+        if key is None:
+            return self._respond(request, await self._build(None, build, model, None), "MISS")
+        entry = await self._call(self.backend.get, key)
+
+        if entry is not None:
+            age = time.time() - entry.stored_at
+            if age < self.ttl:
+                return self._respond(request, entry, "HIT")
+            # Périmée : une seule requête revalide, les autres reçoivent l'ancienne réponse
+            if not self._claim_revalidation(key):
+                return self._respond(request, entry, "STALE")
+            try:
+                entry = await self._build(key, build, model, entry)
+            finally:
+                with self._lock:
+                    self._revalidating.discard(key)
+            return self._respond(request, entry, "REVALIDATED")
+
+        # Entrée absente : les requêtes concurrentes attendent la même construction
+        status = "COALESCED" if self._flights.in_flight(key) else "MISS"
+        entry = await self._flights.do(key, lambda: self._build(key, build, model, None))
+        return self._respond(request, entry, status)
+
+    async def invalidate(self, *tags: str):
+        await self._call(self.backend.bump, tags)
+
+    async def invalidate_salon(self, salon_id: int):
+        """Un salon a changé (création, note) : sa fiche et toutes les listes"""
+        await self.invalidate("salons", f"salon:{salon_id}")
+
+    def clear(self):
+        self.backend.clear()
+        with self._lock:
+            self._revalidating.clear()
+
+
+def _backend():
+    if CACHE_URL:
+        return RedisCacheBackend(CACHE_URL)
+    return LocalCacheBackend()
+
+
+response_cache = ResponseCache(_backend())
@@ -0,0 +1,110 @@
+"""
+Facettes de la recherche de salons
+Comptes par ville, gamme de prix et tranche de note en une seule requête
+agrégée : GROUPING SETS sur Postgres, UNION ALL de GROUP BY ailleurs
+"""
+
+from typing import Callable, Dict, List
+
+from sqlalchemy import case, func, literal, literal_column, tuple_
+from sqlalchemy.orm import Query, Session
+
+from models import PRICE_TIERS, FacetCount, RatingFacetCount, Salon, SalonFacets
+
+# Seuils proposés pour le filtre « note minimum », du plus haut au plus bas
+RATING_THRESHOLDS = (4.5, 4.0, 3.0, 0.0)
+
+PRICE_RANGES = {tier: price_range for price_range, tier in PRICE_TIERS.items()}
+
+
+def rating_bucket():
+    """Indice de la tranche de note (0 = la plus haute)
+
+    Seuils en constantes littérales : l'expression du SELECT est identique
+    à celle du GROUP BY.
+    """
+    rating = func.coalesce(Salon.rating, literal_column("0"))
+    return case(
+        *[
+            (rating >= literal_column(repr(threshold)), literal_column(str(index)))
+            for index, threshold in enumerate(RATING_THRESHOLDS[:-1])
+        ],
+        else_=literal_column(str(len(RATING_THRESHOLDS) - 1))
+    )
+
+
+def _grouping_sets_rows(db: Session, apply_filters: Callable[[Query], Query]) -> List[tuple]:
+    """Postgres : un seul passage sur les salons, un ensemble de regroupement par facette"""
+    city, tier, bucket = Salon.city_normalized, Salon.price_tier, rating_bucket()
+    query = apply_filters(db.query(
+        func.grouping(city),
+        func.grouping(tier),
+        city,
+        tier,
+        bucket,
+        func.min(Salon.city),
+        func.count()
+    )).group_by(func.grouping_sets(tuple_(city), tuple_(tier), tuple_(bucket)))
+
+    rows = []
+    for by_city, by_tier, city_value, tier_value, bucket_value, label, count in query.all():
+        if by_city == 0:
+            rows.append(("city", city_value, label, count))
+        elif by_tier == 0:
+            rows.append(("price", tier_value, None, count))
+        else:
+            rows.append(("rating", bucket_value, None, count))
+    return rows
+
+
+def _union_rows(db: Session, apply_filters: Callable[[Query], Query]) -> List[tuple]:
+    """Équivalent sans GROUPING SETS (SQLite) : un GROUP BY par facette, en une requête"""
+    def grouped(facet: str, column):
+        return apply_filters(db.query(
+            literal(facet),
+            column,
+            func.min(Salon.city),
+            func.count()
+        )).group_by(column)
+
+    return grouped("city", Salon.city_normalized).union_all(
+        grouped("price", Salon.price_tier),
+        grouped("rating", rating_bucket())
+    ).all()
+
+
+def salon_facets(db: Session, apply_filters: Callable[[Query], Query]) -> SalonFacets:
+    """Comptes par facette pour les salons retenus par apply_filters"""
+    if db.get_bind().dialect.name == "postgresql":
+        rows = _grouping_sets_rows(db, apply_filters)
+    else:
+        rows = _union_rows(db, apply_filters)
+
+    cities: List[FacetCount] = []
+    price_ranges: List[FacetCount] = []
+    buckets: Dict[int, int] = {}
+    for facet, value, label, count in rows:
+        if value is None:
+            continue
+        if facet == "city":
+            cities.append(FacetCount(value=value, label=label, count=count))
+        elif facet == "price":
+            price_range = PRICE_RANGES.get(value)
+            if price_range:
+                price_ranges.append(FacetCount(value=price_range, label=price_range, count=count))
+        else:
+            buckets[int(value)] = count
+
+    # Tranches cumulées : nombre de salons ayant au moins cette note
+    ratings = []
+    total = 0
+    for index, threshold in enumerate(RATING_THRESHOLDS):
+        total += buckets.get(index, 0)
+        ratings.append(RatingFacetCount(min_rating=threshold, count=total))
+
+    return SalonFacets(
+        total=total,
+        cities=sorted(cities, key=lambda facet: (-facet.count, facet.label)),
+        price_ranges=sorted(price_ranges, key=lambda facet: PRICE_TIERS[facet.value]),
+        ratings=ratings
+    )
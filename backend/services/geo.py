@@ -0,0 +1,105 @@
+"""
+Géolocalisation des salons
+Geohash indexé (B-tree) pour présélectionner les cellules autour d'un point,
+puis distance exacte (haversine) pour filtrer et trier
+"""
+
+import math
+from typing import List, Set, Tuple
+
+GEOHASH_ALPHABET = "0123456789bcdefghjkmnpqrstuvwxyz"
+GEOHASH_PRECISION = 9
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE_LAT = 111.32
+
+# Nombre maximum de cellules interrogées pour un rayon donné
+MAX_COVERING_CELLS = 16
+
+
+def encode_geohash(lat: float, lng: float, precision: int = GEOHASH_PRECISION) -> str:
+    """Encoder une position en geohash (bits de longitude et latitude entrelacés)"""
+    lat_range = [-90.0, 90.0]
+    lng_range = [-180.0, 180.0]
+    chars = []
+    bits = 0
+    bit_count = 0
+    even = True
+
+    while len(chars) < precision:
+        target, value = (lng_range, lng) if even else (lat_range, lat)
+        middle = (target[0] + target[1]) / 2
+        if value >= middle:
+            bits = (bits << 1) | 1
+            target[0] = middle
+        else:
+            bits <<= 1
+            target[1] = middle
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(GEOHASH_ALPHABET[bits])
+            bits = 0
+            bit_count = 0
+
+    return "".join(chars)
+
+
+def cell_size(precision: int) -> Tuple[float, float]:
+    """Hauteur et largeur (en degrés) d'une cellule geohash"""
+    total_bits = 5 * precision
+    lng_bits = (total_bits + 1) // 2
+    lat_bits = total_bits // 2
+    return 180.0 / (2 ** lat_bits), 360.0 / (2 ** lng_bits)
+
+
+def haversine_km(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+    """Distance orthodromique entre deux points, en kilomètres"""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = math.radians(lat2 - lat1)
+    dlambda = math.radians(lng2 - lng1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+
+def bounding_box(lat: float, lng: float, radius_km: float) -> Tuple[float, float, float, float]:
+    """Rectangle (lat_min, lat_max, lng_min, lng_max) englobant le cercle de recherche"""
+    dlat = radius_km / KM_PER_DEGREE_LAT
+    dlng = radius_km / (KM_PER_DEGREE_LAT * max(math.cos(math.radians(lat)), 1e-6))
+    return (
+        max(lat - dlat, -90.0), min(lat + dlat, 90.0),
+        max(lng - dlng, -180.0), min(lng + dlng, 180.0),
+    )
+
+
+def _steps(low: float, high: float, step: float) -> List[float]:
+    values = []
+    value = low
+    while value < high:
+        values.append(value)
+        value += step
+    values.append(high)
+    return values
+
+
+def covering_prefixes(lat: float, lng: float, radius_km: float) -> Set[str]:
+    """Préfixes geohash dont les cellules recouvrent le cercle de recherche
+
+    On choisit la précision la plus fine qui couvre le rectangle englobant
+    avec au plus MAX_COVERING_CELLS cellules.
+    """
+    lat_min, lat_max, lng_min, lng_max = bounding_box(lat, lng, radius_km)
+
+    precision = 1
+    for candidate in range(GEOHASH_PRECISION, 0, -1):
+        height, width = cell_size(candidate)
+        cells = (math.ceil((lat_max - lat_min) / height) + 1) * (math.ceil((lng_max - lng_min) / width) + 1)
+        if cells <= MAX_COVERING_CELLS:
+            precision = candidate
+            break
+
+    height, width = cell_size(precision)
+    return {
+        encode_geohash(cell_lat, cell_lng, precision)
+        for cell_lat in _steps(lat_min, lat_max, height)
+        for cell_lng in _steps(lng_min, lng_max, width)
+    }
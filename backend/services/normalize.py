@@ -0,0 +1,17 @@
+"""
+Normalisation de texte
+Minuscules sans accents, pour les index de préfixes et les colonnes normalisées
+"""
+
+import unicodedata
+from typing import List
+
+
+def normalize(value: str) -> str:
+    """Minuscules sans accents, espaces superflus retirés"""
+    decomposed = unicodedata.normalize("NFKD", value or "")
+    return " ".join("".join(c for c in decomposed if not unicodedata.combining(c)).lower().split())
+
+
+def tokenize(value: str) -> List[str]:
+    return normalize(value).replace("-", " ").replace("'", " ").split()
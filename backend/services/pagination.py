@@ -0,0 +1,106 @@
+"""
+Pagination par curseur (keyset)
+Le curseur opaque encode les valeurs de tri du dernier élément renvoyé ;
+la page suivante reprend juste après, quel que soit le numéro de page
+"""
+
+import base64
+import json
+from datetime import datetime
+from typing import Any, Callable, List, Optional, Sequence, Tuple
+
+from fastapi import HTTPException, Response
+from sqlalchemy import and_, or_
+from sqlalchemy.orm import Query
+
+# (expression de tri, tri décroissant, lecture de la valeur sur une ligne)
+SortKey = Tuple[Any, bool, Callable[[Any], Any]]
+
+
+class InvalidCursor(ValueError):
+    """Curseur illisible ou émis pour un autre tri"""
+
+
+def _encode_value(value):
+    if isinstance(value, datetime):
+        return {"dt": value.isoformat()}
+    return value
+
+
+def _decode_value(value):
+    if isinstance(value, dict) and "dt" in value:
+        return datetime.fromisoformat(value["dt"])
+    return value
+
+
+def encode_cursor(sort: str, values: Sequence[Any]) -> str:
+    payload = json.dumps({"s": sort, "v": [_encode_value(v) for v in values]}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, sort: str, size: int) -> List[Any]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        values = [_decode_value(v) for v in payload["v"]]
+    except (ValueError, KeyError, TypeError) as e:
+        raise InvalidCursor("Curseur invalide") from e
+    if payload.get("s") != sort or len(values) != size:
+        raise InvalidCursor("Curseur émis pour un autre tri")
+    return values
+
+
+def keyset_after(keys: Sequence[SortKey], values: Sequence[Any]):
+    """Condition « strictement après » pour un tri multi-colonnes
+
+    (a, b) après (va, vb) : a après va, ou a = va et b après vb, etc.
+    """
+    clauses = []
+    for position, (column, descending, _) in enumerate(keys):
+        equal_prefix = [keys[i][0] == values[i] for i in range(position)]
+        after = column < values[position] if descending else column > values[position]
+        clauses.append(and_(*equal_prefix, after))
+    return or_(*clauses)
+
+
+def paginate(
+    query: Query,
+    sort: str,
+    keys: Sequence[SortKey],
+    limit: int,
+    cursor: Optional[str] = None
+) -> Tuple[list, Optional[str]]:
+    """Appliquer le tri et la page keyset ; renvoie (lignes, curseur suivant)"""
+    if cursor:
+        query = query.filter(keyset_after(keys, decode_cursor(cursor, sort, len(keys))))
+    query = query.order_by(*[column.desc() if descending else column.asc() for column, descending, _ in keys])
+
+    rows = query.limit(limit + 1).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(sort, [getter(rows[-1]) for _, _, getter in keys])
+    return rows, next_cursor
+
+
+def paginated(
+    response: Response,
+    query: Query,
+    sort: str,
+    keys: Sequence[SortKey],
+    limit: int,
+    cursor: Optional[str] = None,
+    skip: int = 0
+) -> list:
+    """Page keyset (curseur suivant dans l'en-tête X-Next-Cursor) ou, si skip > 0, page par offset"""
+    if skip:
+        # Mode de compatibilité : coût proportionnel à la profondeur de page
+        order = [column.desc() if descending else column.asc() for column, descending, _ in keys]
+        return query.order_by(*order).offset(skip).limit(limit).all()
+    try:
+        rows, next_cursor = paginate(query, sort, keys, limit, cursor)
+    except InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return rows
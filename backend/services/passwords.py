@@ -0,0 +1,65 @@
+"""
+Hachage des mots de passe hors de la boucle d'événements
+bcrypt coûte 100+ ms de CPU par appel : les calculs passent par un pool de
+threads borné (bcrypt libère le GIL) avec une file d'attente limitée, qui
+refuse immédiatement les demandes en excès plutôt que de bloquer le worker
+"""
+
+import asyncio
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional, Tuple
+
+from passlib.context import CryptContext
+
+# Coût bcrypt (2^rounds itérations) ; un changement déclenche le rehachage à la connexion
+PASSWORD_BCRYPT_ROUNDS = int(os.getenv("PASSWORD_BCRYPT_ROUNDS", "12"))
+# Threads dédiés au hachage (par worker)
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+# Calculs en cours ou en attente au-delà desquels les nouvelles demandes sont refusées
+PASSWORD_HASH_MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", "32"))
+
+
+class HashingOverloaded(RuntimeError):
+    """Trop de hachages en attente : réessayer plus tard"""
+
+
+class PasswordHasher:
+    def __init__(self, rounds: int = PASSWORD_BCRYPT_ROUNDS, workers: int = PASSWORD_HASH_WORKERS,
+                 max_pending: int = PASSWORD_HASH_MAX_PENDING):
+        # Bornes min = max = rounds : tout hash d'un autre coût est à mettre à jour
+        self.context = CryptContext(
+            schemes=["bcrypt"],
+            deprecated="auto",
+            bcrypt__default_rounds=rounds,
+            bcrypt__min_rounds=rounds,
+            bcrypt__max_rounds=rounds,
+        )
+        self.max_pending = max_pending
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="password-hash")
+        self._lock = threading.Lock()
+        self.pending = 0
+        self.rejected = 0
+
+    async def _run(self, fn: Callable, *args):
+        with self._lock:
+            if self.pending >= self.max_pending:
+                self.rejected += 1
+                raise HashingOverloaded("File de hachage pleine")
+            self.pending += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+        finally:
+            with self._lock:
+                self.pending -= 1
+
+    async def hash(self, password: str) -> str:
+        return await self._run(self.context.hash, password)
+
+    async def verify_and_update(self, password: str, hashed: str) -> Tuple[bool, Optional[str]]:
+        """(mot de passe valide, nouveau hash si le coût ou l'algorithme a changé)"""
+        return await self._run(self.context.verify_and_update, password, hashed)
+
+
+password_hasher = PasswordHasher()
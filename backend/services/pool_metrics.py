@@ -0,0 +1,123 @@
+"""
+Métriques du pool de connexions
+Temps d'attente au checkout, connexions utilisées, débordement, timeouts et
+invalidations, relevés par une sous-classe du pool et par ses événements
+"""
+
+import threading
+import time
+from collections import deque
+from typing import Dict, Optional, Type
+
+from sqlalchemy import event, exc
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import Pool, QueuePool
+
+# Nombre de temps d'attente conservés pour le calcul des percentiles
+WAIT_SAMPLES = 1000
+
+
+class PoolMetrics:
+    """Compteurs d'un pool, lus par /internal/metrics et /health/ready"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.checkouts = 0
+            self.timeouts = 0
+            self.invalidations = 0
+            self.peak_checked_out = 0
+            self.peak_overflow = 0
+            self.wait_total = 0.0
+            self.wait_max = 0.0
+            self._waits = deque(maxlen=WAIT_SAMPLES)
+
+    def record_wait(self, seconds: float):
+        with self._lock:
+            self.checkouts += 1
+            self.wait_total += seconds
+            self.wait_max = max(self.wait_max, seconds)
+            self._waits.append(seconds)
+
+    def record_timeout(self):
+        with self._lock:
+            self.timeouts += 1
+
+    def record_in_use(self, checked_out: int, overflow: int):
+        with self._lock:
+            self.peak_checked_out = max(self.peak_checked_out, checked_out)
+            self.peak_overflow = max(self.peak_overflow, overflow)
+
+    def record_invalidation(self):
+        with self._lock:
+            self.invalidations += 1
+
+    def snapshot(self, pool: Optional[Pool] = None) -> dict:
+        with self._lock:
+            waits = sorted(self._waits)
+            stats = {
+                "checkouts": self.checkouts,
+                "timeouts": self.timeouts,
+                "invalidations": self.invalidations,
+                "peak_checked_out": self.peak_checked_out,
+                "peak_overflow": self.peak_overflow,
+                "wait_ms": {
+                    "avg": round(1000 * self.wait_total / self.checkouts, 3) if self.checkouts else 0.0,
+                    "p95": round(1000 * waits[int(0.95 * (len(waits) - 1))], 3) if waits else 0.0,
+                    "max": round(1000 * self.wait_max, 3),
+                },
+            }
+        if isinstance(pool, QueuePool):
+            stats.update(
+                size=pool.size(),
+                max_overflow=pool._max_overflow,
+                checked_out=pool.checkedout(),
+                checked_in=pool.checkedin(),
+                overflow=max(pool.overflow(), 0),
+            )
+        return stats
+
+
+def instrumented_pool(base: Type[QueuePool], metrics: PoolMetrics) -> Type[QueuePool]:
+    """Sous-classe du pool qui chronomètre l'attente d'une connexion
+
+    Les métriques sont portées par la classe : elles survivent à pool.recreate()
+    (engine.dispose(), invalidation de toutes les connexions).
+    """
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            connection = base._do_get(self)
+        except exc.TimeoutError:
+            self.metrics.record_timeout()
+            raise
+        self.metrics.record_wait(time.perf_counter() - started)
+        return connection
+
+    return type(f"Instrumented{base.__name__}", (base,), {"metrics": metrics, "_do_get": _do_get})
+
+
+# Pools surveillés, par nom (« primary », « primary_async », ...)
+_monitored: Dict[str, tuple] = {}
+
+
+def monitor_engine(name: str, engine: Engine, metrics: PoolMetrics):
+    """Brancher les événements du pool de engine et l'exposer dans pool_stats()"""
+    def on_checkout(dbapi_connection, connection_record, connection_proxy):
+        pool = engine.pool
+        if isinstance(pool, QueuePool):
+            metrics.record_in_use(pool.checkedout(), max(pool.overflow(), 0))
+
+    def on_invalidate(dbapi_connection, connection_record, exception):
+        metrics.record_invalidation()
+
+    event.listen(engine, "checkout", on_checkout)
+    event.listen(engine, "invalidate", on_invalidate)
+    _monitored[name] = (engine, metrics)
+
+
+def pool_stats() -> Dict[str, dict]:
+    return {name: metrics.snapshot(engine.pool) for name, (engine, metrics) in _monitored.items()}
@@ -0,0 +1,139 @@
+"""
+Classement de popularité des salons
+Instantané en mémoire du top des salons (global et par ville), classés par
+moyenne bayésienne ; reconstruit à expiration ou quand une note change
+"""
+
+import os
+import threading
+import time
+from typing import Dict, List, Optional
+
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from models import Salon, SalonResponse
+from services.normalize import normalize
+
+# Nombre d'avis « fictifs » à la moyenne globale ajoutés à chaque salon
+POPULAR_PRIOR_REVIEWS = int(os.getenv("POPULAR_PRIOR_REVIEWS", "20"))
+# Durée de vie de l'instantané (secondes)
+POPULAR_REFRESH_SECONDS = int(os.getenv("POPULAR_REFRESH_SECONDS", "300"))
+# Nombre de salons conservés par classement (global et par ville)
+POPULAR_SNAPSHOT_SIZE = 50
+
+
+def _global_mean(db: Session) -> float:
+    """Note moyenne de l'ensemble des avis (pondérée par le nombre d'avis)"""
+    total_reviews, weighted = db.query(
+        func.sum(Salon.total_reviews),
+        func.sum(Salon.rating * Salon.total_reviews)
+    ).one()
+    return weighted / total_reviews if total_reviews else 0.0
+
+
+def _score_expression(mean: float):
+    """Moyenne bayésienne : note tirée vers la moyenne globale tant que le salon a peu d'avis"""
+    rating = func.coalesce(Salon.rating, 0.0)
+    reviews = func.coalesce(Salon.total_reviews, 0)
+    return (POPULAR_PRIOR_REVIEWS * mean + rating * reviews) / (POPULAR_PRIOR_REVIEWS + reviews)
+
+
+class PopularityRanking:
+    """Classements précalculés : lecture en temps constant, reconstruction par une seule requête
+
+    Le verrou ne protège que l'état en mémoire, jamais une requête SQL : avec
+    une session asynchrone, run_sync exécute le calcul sur le thread de la
+    boucle d'événements, qui se bloquerait en attendant un verrou tenu par une
+    requête suspendue.
+    """
+
+    def __init__(self):
+        self._global: List[SalonResponse] = []
+        self._by_city: Dict[str, List[SalonResponse]] = {}
+        self._built_at: Optional[float] = None
+        self._published = False
+        self._building = False
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def _is_fresh(self) -> bool:
+        return self._built_at is not None and time.monotonic() - self._built_at < POPULAR_REFRESH_SECONDS
+
+    def _compute(self, db: Session):
+        """Classements global et par ville (deux requêtes, quelle que soit la taille de la table)"""
+        mean = _global_mean(db)
+        score = _score_expression(mean)
+
+        # Un salon sans avis n'a pas sa place dans le classement
+        top = db.query(Salon).filter(Salon.total_reviews > 0).order_by(
+            score.desc(), Salon.id
+        ).limit(POPULAR_SNAPSHOT_SIZE).all()
+
+        # Top N de chaque ville en une seule requête (fonction de fenêtre)
+        ranked = select(
+            Salon.id,
+            func.row_number().over(
+                partition_by=Salon.city_normalized,
+                order_by=(score.desc(), Salon.id)
+            ).label("position")
+        ).where(Salon.total_reviews > 0).subquery()
+        per_city = db.query(Salon).join(ranked, ranked.c.id == Salon.id).filter(
+            ranked.c.position <= POPULAR_SNAPSHOT_SIZE
+        ).order_by(Salon.city_normalized, ranked.c.position).all()
+
+        by_city: Dict[str, List[SalonResponse]] = {}
+        for salon in per_city:
+            by_city.setdefault(salon.city_normalized, []).append(SalonResponse.model_validate(salon))
+        return [SalonResponse.model_validate(salon) for salon in top], by_city
+
+    def refresh(self, db: Session):
+        """Recalculer les classements puis les publier"""
+        with self._lock:
+            generation = self._generation
+        top, by_city = self._compute(db)
+        with self._lock:
+            self._global = top
+            self._by_city = by_city
+            self._published = True
+            # Note modifiée pendant le calcul : publié mais à recalculer à la prochaine lecture
+            self._built_at = time.monotonic() if generation == self._generation else None
+
+    def ensure_fresh(self, db: Session):
+        with self._lock:
+            if self._is_fresh():
+                return
+            # Une seule reconstruction à la fois ; les autres requêtes servent
+            # l'instantané périmé plutôt que d'attendre
+            if self._building and self._published:
+                return
+            self._building = True
+        try:
+            self.refresh(db)
+        finally:
+            with self._lock:
+                self._building = False
+
+    def top(self, db: Session, limit: int, city: Optional[str] = None) -> List[SalonResponse]:
+        """Salons les plus populaires, globalement ou dans une ville"""
+        self.ensure_fresh(db)
+        salons = self._by_city.get(normalize(city), []) if city else self._global
+        return salons[:limit]
+
+    def invalidate(self):
+        """Forcer la reconstruction à la prochaine lecture (note ou nombre d'avis modifié)"""
+        with self._lock:
+            self._generation += 1
+            self._built_at = None
+
+    def reset(self):
+        with self._lock:
+            self._global = []
+            self._by_city = {}
+            self._built_at = None
+            self._published = False
+            self._building = False
+            self._generation += 1
+
+
+popular_ranking = PopularityRanking()
@@ -0,0 +1,51 @@
+"""
+Sessions de rafraîchissement
+Une ligne par connexion (appareil) et non par jeton émis : la rotation remplace
+le jti courant de la session, un jeton déjà échangé ne correspond plus à rien.
+La table grandit avec le nombre de sessions ouvertes, pas avec les rafraîchissements
+"""
+
+from datetime import datetime
+from uuid import uuid4
+
+from sqlalchemy.orm import Session
+
+from models import RefreshSession
+
+
+def start_session(db: Session, user_id: int, jti: str, expires_at: datetime) -> str:
+    """Ouvrir une session à la connexion ; renvoie son identifiant (claim sid)"""
+    # Les sessions expirées ne servent plus à personne
+    db.query(RefreshSession).filter(RefreshSession.expires_at <= datetime.utcnow()).delete(
+        synchronize_session=False
+    )
+    session_id = uuid4().hex
+    db.add(RefreshSession(id=session_id, user_id=user_id, jti=jti, expires_at=expires_at))
+    db.commit()
+    return session_id
+
+
+def rotate_session(db: Session, session_id: str, jti: str, new_jti: str, expires_at: datetime) -> bool:
+    """Remplacer le jeton courant jti par new_jti ; False si jti n'est plus le jeton courant
+
+    Comparaison et remplacement dans le même UPDATE : de deux rotations simultanées
+    du même jeton, une seule aboutit. Un jeton déjà échangé présenté à nouveau
+    (vol probable) ferme la session entière.
+    """
+    rotated = db.query(RefreshSession).filter(
+        RefreshSession.id == session_id,
+        RefreshSession.jti == jti,
+        RefreshSession.expires_at > datetime.utcnow()
+    ).update({RefreshSession.jti: new_jti, RefreshSession.expires_at: expires_at}, synchronize_session=False)
+    if not rotated:
+        db.query(RefreshSession).filter(RefreshSession.id == session_id).delete(synchronize_session=False)
+    db.commit()
+    return bool(rotated)
+
+
+def end_session(db: Session, session_id: str, user_id: int):
+    """Fermer une session (déconnexion) : son jeton de rafraîchissement n'est plus accepté"""
+    db.query(RefreshSession).filter(
+        RefreshSession.id == session_id, RefreshSession.user_id == user_id
+    ).delete(synchronize_session=False)
+    db.commit()
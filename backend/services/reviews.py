@@ -0,0 +1,91 @@
+"""
+Avis clients et agrégats de note des salons
+Chaque écriture d'avis ajuste la somme et le nombre de notes du salon dans la
+même transaction, par une seule mise à jour atomique : Salon.rating reste une
+colonne indexée, jamais recalculée par AVG à la lecture
+"""
+
+from datetime import datetime
+from typing import Optional, Tuple
+
+from sqlalchemy import case, func
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from models import Review, Salon
+from services.autocomplete import autocomplete_index
+from services.cache import response_cache
+from services.ranking import popular_ranking
+
+
+class DuplicateReview(Exception):
+    """Le client a déjà publié un avis sur ce salon"""
+
+
+def apply_rating_delta(db: Session, salon_id: int, delta_sum: int, delta_count: int) -> Optional[float]:
+    """Ajouter delta_sum à la somme des notes et delta_count au nombre d'avis ; renvoie la nouvelle note
+
+    Calcul fait par la base dans l'UPDATE (pas de lecture-modification-écriture) :
+    deux avis simultanés sur le même salon ne peuvent pas perdre de mise à jour.
+    """
+    current_count = func.coalesce(Salon.total_reviews, 0)
+    current_sum = func.coalesce(Salon.rating_sum, func.coalesce(Salon.rating, 0.0) * current_count)
+    new_count = current_count + delta_count
+    new_sum = current_sum + delta_sum
+    db.query(Salon).filter(Salon.id == salon_id).update({
+        Salon.rating_sum: case((new_count > 0, new_sum), else_=0.0),
+        Salon.total_reviews: new_count,
+        Salon.rating: case((new_count > 0, new_sum / new_count), else_=0.0),
+    }, synchronize_session=False)
+    return db.query(Salon.rating).filter(Salon.id == salon_id).scalar()
+
+
+def create_review(db: Session, salon_id: int, client_id: int, rating: int,
+                  comment: Optional[str]) -> Tuple[Review, Optional[float]]:
+    """Créer un avis ; renvoie (avis, nouvelle note du salon)
+
+    La contrainte uq_reviews_salon_client tranche entre deux envois simultanés :
+    DuplicateReview est levée avant toute modification du salon, la transaction
+    doit alors être annulée.
+    """
+    review = Review(salon_id=salon_id, client_id=client_id, rating=rating, comment=comment)
+    db.add(review)
+    try:
+        db.flush()
+    except IntegrityError as e:
+        raise DuplicateReview(str(e.orig)) from e
+    return review, apply_rating_delta(db, salon_id, rating, 1)
+
+
+def update_review(db: Session, review: Review, rating: Optional[int],
+                  comment: Optional[str]) -> Tuple[Review, Optional[float]]:
+    """Modifier un avis lu avec verrou (lock_review) : l'ancienne note sert au delta
+
+    La note du salon renvoyée est None quand elle n'a pas changé.
+    """
+    salon_rating = None
+    if rating is not None and rating != review.rating:
+        salon_rating = apply_rating_delta(db, review.salon_id, rating - review.rating, 0)
+        review.rating = rating
+    if comment is not None:
+        review.comment = comment
+    review.updated_at = datetime.utcnow()
+    return review, salon_rating
+
+
+def delete_review(db: Session, review: Review) -> Optional[float]:
+    db.delete(review)
+    return apply_rating_delta(db, review.salon_id, -review.rating, -1)
+
+
+def lock_review(db: Session, review_id: int) -> Optional[Review]:
+    """Lire un avis en le verrouillant jusqu'à la fin de la transaction"""
+    return db.query(Review).filter(Review.id == review_id).with_for_update().first()
+
+
+async def rating_changed(salon_id: int, rating: Optional[float]):
+    """Après commit : instantané des populaires, cache HTTP et index d'autocomplétion"""
+    popular_ranking.invalidate()
+    await response_cache.invalidate_salon(salon_id)
+    if rating is not None:
+        autocomplete_index.update_rating(salon_id, rating)
@@ -0,0 +1,81 @@
+"""
+Recherche plein texte des salons
+tsvector + GIN sur Postgres, FTS5 sur SQLite ; pertinence pondérée par la note
+"""
+
+import os
+import re
+from typing import List
+
+from sqlalchemy import Float, column, func, literal_column, table, text
+from sqlalchemy.orm import Query, Session
+
+from models import SALON_SEARCH_VECTOR, Salon
+
+# Poids de la pertinence textuelle et de la note dans le score final
+SEARCH_RELEVANCE_WEIGHT = float(os.getenv("SEARCH_RELEVANCE_WEIGHT", "0.7"))
+SEARCH_RATING_WEIGHT = float(os.getenv("SEARCH_RATING_WEIGHT", "0.3"))
+
+# Poids BM25 des colonnes de salons_fts : nom, ville, adresse, description
+FTS5_COLUMN_WEIGHTS = (10.0, 5.0, 2.0, 1.0)
+
+salons_fts = table("salons_fts", column("rowid"))
+search_vector = literal_column(f"({SALON_SEARCH_VECTOR})")
+
+
+def search_terms(q: str) -> List[str]:
+    """Découper la saisie en mots (la syntaxe des moteurs n'est jamais exposée)"""
+    return re.findall(r"\w+", q.lower())
+
+
+def _tsquery(terms: List[str]):
+    """Requête tsquery Postgres : tous les mots, en préfixe"""
+    return func.to_tsquery("french", " & ".join(f"{term}:*" for term in terms))
+
+
+def _blend(relevance):
+    """Score final : pertinence ramenée dans [0, 1) mélangée avec la note sur 5"""
+    return (
+        SEARCH_RELEVANCE_WEIGHT * relevance / (relevance + 1)
+        + SEARCH_RATING_WEIGHT * func.coalesce(Salon.rating, 0.0) / 5.0
+    )
+
+
+def search_score(db: Session, q: str):
+    """Expression de score de la recherche (utilisée pour le tri)"""
+    dialect = db.get_bind().dialect.name
+
+    if dialect == "postgresql":
+        return _blend(func.ts_rank_cd(search_vector, _tsquery(search_terms(q)), type_=Float))
+    if dialect == "sqlite":
+        # bm25() est négatif : plus il est petit, plus le document est pertinent
+        return _blend(-func.bm25(literal_column("salons_fts"), *FTS5_COLUMN_WEIGHTS, type_=Float))
+    return func.coalesce(Salon.rating, 0.0)
+
+
+def full_text_search(db: Session, q: str) -> Query:
+    """Requête des salons correspondant à q (le tri par search_score est appliqué par l'appelant)"""
+    terms = search_terms(q)
+    if not terms:
+        return db.query(Salon).filter(text("1 = 0"))
+
+    dialect = db.get_bind().dialect.name
+
+    if dialect == "postgresql":
+        query = db.query(Salon).filter(search_vector.op("@@")(_tsquery(terms)))
+    elif dialect == "sqlite":
+        match = " ".join(f'"{term}"*' for term in terms)
+        query = db.query(Salon).join(salons_fts, salons_fts.c.rowid == Salon.id).filter(
+            literal_column("salons_fts").op("MATCH")(match)
+        )
+    else:
+        query = db.query(Salon)
+        for term in terms:
+            query = query.filter(
+                Salon.name.ilike(f"%{term}%") |
+                Salon.description.ilike(f"%{term}%") |
+                Salon.city.ilike(f"%{term}%") |
+                Salon.address.ilike(f"%{term}%")
+            )
+
+    return query
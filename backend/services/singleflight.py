@@ -0,0 +1,49 @@
+"""
+Regroupement des requêtes identiques (single-flight)
+Tant qu'un calcul est en cours pour une clé, les appels suivants attendent
+son résultat au lieu de relancer la même requête en base
+"""
+
+import asyncio
+from typing import Awaitable, Callable, Dict, TypeVar
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    """Un seul calcul en vol par clé ; les autres appelants partagent son futur"""
+
+    def __init__(self):
+        self._calls: Dict[str, asyncio.Future] = {}
+
+    def in_flight(self, key: str) -> bool:
+        return key in self._calls
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[T]]) -> T:
+        while key in self._calls:
+            future = self._calls[key]
+            try:
+                # shield : l'annulation d'un appelant en attente n'annule pas le calcul partagé
+                return await asyncio.shield(future)
+            except asyncio.CancelledError:
+                if not future.cancelled():
+                    raise
+                # Le meneur a été annulé (client déconnecté) : un appelant en attente reprend la main
+
+        future = asyncio.get_running_loop().create_future()
+        self._calls[key] = future
+        try:
+            result = await fn()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Marquer l'exception comme lue même si personne n'attendait
+            future.exception()
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            del self._calls[key]
@@ -0,0 +1,177 @@
+"""
+Révocation des jetons d'accès JWT
+Identifiants (jti) des jetons d'accès révoqués avant leur expiration
+(déconnexion), gardés en mémoire : un filtre de Bloom répond en temps constant
+« sûrement pas révoqué » pour la quasi-totalité des requêtes, un petit ensemble
+exact tranche les cas positifs. Les entrées disparaissent à l'expiration du
+jeton (quelques minutes). La table revoked_tokens sert de source commune aux
+workers, relue par incréments en tâche de fond, jamais pendant une requête
+"""
+
+import asyncio
+import hashlib
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Callable, Dict, Iterable, Optional
+
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import or_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from models import RevokedToken
+
+# Taille du filtre de Bloom (bits) et nombre de fonctions de hachage :
+# ~1 % de faux positifs jusqu'à 100 000 jetons révoqués non expirés
+REVOCATION_BLOOM_BITS = int(os.getenv("REVOCATION_BLOOM_BITS", str(1 << 20)))
+REVOCATION_BLOOM_HASHES = int(os.getenv("REVOCATION_BLOOM_HASHES", "7"))
+# Intervalle de relecture des révocations émises par les autres workers
+REVOCATION_SYNC_SECONDS = float(os.getenv("REVOCATION_SYNC_SECONDS", "10"))
+# Identifiant sauté par une relecture (transaction pas encore validée) : relu pendant ce délai
+REVOCATION_GAP_SECONDS = float(os.getenv("REVOCATION_GAP_SECONDS", "60"))
+# Nombre maximum d'identifiants sautés suivis par relecture
+REVOCATION_MAX_GAPS = 1000
+
+
+class BloomFilter:
+    """Filtre de Bloom à double hachage (Kirsch-Mitzenmacher) sur un bytearray"""
+
+    def __init__(self, bits: int = REVOCATION_BLOOM_BITS, hashes: int = REVOCATION_BLOOM_HASHES):
+        self.bits = bits
+        self.hashes = hashes
+        self._array = bytearray((bits + 7) // 8)
+
+    def _positions(self, key: str) -> Iterable[int]:
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return ((h1 + i * h2) % self.bits for i in range(self.hashes))
+
+    def add(self, key: str):
+        for position in self._positions(key):
+            self._array[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, key: str) -> bool:
+        return all(self._array[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+
+class RevocationList:
+    """jti révoqués jusqu'à leur expiration ; lectures sans verrou ni requête"""
+
+    def __init__(self, bits: int = REVOCATION_BLOOM_BITS, hashes: int = REVOCATION_BLOOM_HASHES):
+        self._bits = bits
+        self._hashes = hashes
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._bloom = BloomFilter(self._bits, self._hashes)
+            self._expires: Dict[str, float] = {}
+            # Dernier identifiant lu, et identifiants sautés -> instant où ils l'ont été
+            self._last_seen_id = 0
+            self._gaps: Dict[int, float] = {}
+
+    def add(self, jti: str, expires: float):
+        """expires : instant d'expiration du jeton (claim exp, secondes Unix)"""
+        with self._lock:
+            self._expires[jti] = expires
+            self._bloom.add(jti)
+
+    def is_revoked(self, jti: Optional[str]) -> bool:
+        if not jti or jti not in self._bloom:
+            return False
+        expires = self._expires.get(jti)
+        return expires is not None and expires > time.time()
+
+    def __len__(self) -> int:
+        return len(self._expires)
+
+    def _purge_expired(self, now: float):
+        """Oublier les jetons expirés ; le filtre est reconstruit (pas de suppression dans un Bloom)"""
+        expired = [jti for jti, expires in self._expires.items() if expires <= now]
+        if not expired:
+            return
+        for jti in expired:
+            del self._expires[jti]
+        bloom = BloomFilter(self._bits, self._hashes)
+        for jti in self._expires:
+            bloom.add(jti)
+        self._bloom = bloom
+
+    def sync(self, db: Session):
+        """Lire les révocations enregistrées depuis la relecture précédente (tous workers)
+
+        Lecture par identifiant croissant. Un identifiant attribué à une transaction
+        pas encore validée apparaît comme un trou : il est relu aux relectures
+        suivantes pendant REVOCATION_GAP_SECONDS.
+        """
+        with self._lock:
+            last_seen_id = self._last_seen_id
+            gaps = list(self._gaps)
+        condition = RevokedToken.id > last_seen_id
+        if gaps:
+            condition = or_(condition, RevokedToken.id.in_(gaps))
+        rows = db.query(RevokedToken.id, RevokedToken.jti, RevokedToken.expires_at).filter(condition).all()
+
+        now, monotonic = time.time(), time.monotonic()
+        with self._lock:
+            if self._last_seen_id != last_seen_id:
+                # Réinitialisée ou relue entre-temps
+                return
+            seen = set()
+            for row_id, jti, expires_at in rows:
+                seen.add(row_id)
+                expires = expires_at.replace(tzinfo=timezone.utc).timestamp()
+                if expires > now:
+                    self._expires[jti] = expires
+                    self._bloom.add(jti)
+            newest = max(seen, default=last_seen_id)
+            if newest > last_seen_id:
+                for missing in range(max(last_seen_id + 1, newest - REVOCATION_MAX_GAPS), newest):
+                    if missing not in seen:
+                        self._gaps[missing] = monotonic
+                self._last_seen_id = newest
+            self._gaps = {
+                row_id: skipped_at for row_id, skipped_at in self._gaps.items()
+                if row_id not in seen and monotonic - skipped_at < REVOCATION_GAP_SECONDS
+            }
+            self._purge_expired(now)
+
+    def _sync_with(self, session_factory: Callable[[], Session]):
+        db = session_factory()
+        try:
+            self.sync(db)
+        finally:
+            db.close()
+
+    async def run(self, session_factory: Callable[[], Session], interval: float = REVOCATION_SYNC_SECONDS):
+        """Relire la table en boucle, dans le pool de threads (tâche lancée au démarrage)"""
+        while True:
+            try:
+                await run_in_threadpool(self._sync_with, session_factory)
+            except Exception as e:
+                print(f"Relecture des jetons révoqués impossible: {e}")
+            await asyncio.sleep(interval)
+
+    def revoke(self, db: Session, jti: str, expires: float) -> bool:
+        """Révoquer un jeton jusqu'à son expiration ; False s'il l'était déjà"""
+        self.add(jti, expires)
+        # Les lignes expirées ne servent plus à personne
+        db.query(RevokedToken).filter(RevokedToken.expires_at <= datetime.utcnow()).delete(
+            synchronize_session=False
+        )
+        db.add(RevokedToken(
+            jti=jti,
+            expires_at=datetime.fromtimestamp(expires, timezone.utc).replace(tzinfo=None)
+        ))
+        try:
+            db.commit()
+        except IntegrityError:
+            db.rollback()
+            return False
+        return True
+
+revoked_tokens = RevocationList()
@@ -0,0 +1,134 @@
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from datetime import datetime, time, timedelta
+
+from main import app
+from models import Base, Salon, Reservation, ReservationArchive, ReservationSlot, active_reservation
+from db import get_db
+from services.archive import archive_reservations, complete_past_reservations
+from services.booking import claim_slots
+
+# Test database setup
+SQLALCHEMY_DATABASE_URL = "sqlite:///./test_archive.db"
+
+engine = create_engine(
+    SQLALCHEMY_DATABASE_URL,
+    connect_args={"check_same_thread": False},
+    poolclass=StaticPool,
+)
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+NOW = datetime(2030, 6, 15, 12, 0)
+
+def override_get_db():
+    try:
+        db = TestingSessionLocal()
+        yield db
+    finally:
+        db.close()
+
+@pytest.fixture
+def client():
+    app.dependency_overrides[get_db] = override_get_db
+    Base.metadata.create_all(bind=engine)
+    with TestClient(app) as c:
+        yield c
+    Base.metadata.drop_all(bind=engine)
+
+@pytest.fixture
+def db(client):
+    session = TestingSessionLocal()
+    salon = Salon(
+        name="Salon Archive",
+        description="Nail art",
+        address="1 Rue Test",
+        city="Paris",
+        phone="0123456789",
+        email="salon@test.com",
+        price_range="€€",
+        open_time=time(9, 0),
+        close_time=time(19, 0)
+    )
+    session.add(salon)
+    session.commit()
+    yield session
+    session.close()
+
+def add_reservation(db, days, status="confirmed"):
+    reservation = Reservation(
+        salon_id=1,
+        client_id=1,
+        service_type="Manucure",
+        appointment_date=datetime.combine((NOW + timedelta(days=days)).date(), time(10, 0)),
+        duration_minutes=60,
+        price=45.0,
+        status=status
+    )
+    db.add(reservation)
+    db.flush()
+    if status == "confirmed":
+        claim_slots(db, reservation)
+    db.commit()
+    return reservation.id
+
+def test_past_reservations_leave_active_set(db):
+    """Test that finished confirmed reservations are completed and release their slots"""
+    past = add_reservation(db, -2)
+    future = add_reservation(db, 3)
+
+    assert complete_past_reservations(db, NOW, batch_size=1) == 1
+    assert db.get(Reservation, past).status == "completed"
+    assert db.get(Reservation, future).status == "confirmed"
+    assert {slot.reservation_id for slot in db.query(ReservationSlot)} == {future}
+
+def test_archive_moves_old_rows_in_batches(client, db):
+    """Test batched archival and lookups of archived reservations"""
+    old = [add_reservation(db, -400, "cancelled"), add_reservation(db, -300), add_reservation(db, -250)]
+    recent = add_reservation(db, -10, "cancelled")
+    future = add_reservation(db, 3)
+
+    complete_past_reservations(db, NOW)
+    assert archive_reservations(db, NOW - timedelta(days=180), batch_size=2) == 3
+
+    assert {row.id for row in db.query(Reservation)} == {recent, future}
+    archived = {row.id: row for row in db.query(ReservationArchive)}
+    assert set(archived) == set(old)
+    assert archived[old[0]].status == "cancelled"
+    assert archived[old[1]].status == "completed"
+    assert archived[old[1]].end_date == archived[old[1]].appointment_date + timedelta(minutes=60)
+    assert db.query(ReservationSlot).filter(ReservationSlot.reservation_id.in_(old)).count() == 0
+
+    response = client.get(f"/api/reservations/{old[0]}")
+    assert response.status_code == 200
+    assert response.json()["status"] == "cancelled"
+
+    # Pas de réutilisation d'identifiant après archivage
+    assert add_reservation(db, 5) > future
+
+def test_availability_queries_use_partial_index(db):
+    """Test that the availability lookups only scan the active partial indexes"""
+    for days in range(-30, 30):
+        add_reservation(db, days, "confirmed" if days > 0 else "completed")
+    db.execute(text("ANALYZE"))
+
+    day_start = datetime.combine(NOW.date(), time.min)
+    queries = [
+        db.query(Reservation.appointment_date).filter(
+            Reservation.salon_id == 1,
+            Reservation.appointment_date >= day_start,
+            Reservation.appointment_date < day_start + timedelta(days=1),
+            active_reservation()
+        ),
+        db.query(Reservation.salon_id).filter(
+            active_reservation(),
+            Reservation.appointment_date < day_start + timedelta(days=1),
+            Reservation.end_date > day_start
+        ),
+    ]
+    for query in queries:
+        sql = str(query.statement.compile(engine, compile_kwargs={"literal_binds": True}))
+        plan = [row[3] for row in db.execute(text(f"EXPLAIN QUERY PLAN {sql}"))]
+        assert "ix_reservations_active_" in plan[0], plan
@@ -0,0 +1,105 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from datetime import datetime, time, timedelta
+
+from main import app
+from models import Base
+from db import async_database_url, get_db, run_db
+from services.cache import response_cache
+from services.ranking import popular_ranking
+
+# Test database setup : schéma créé en synchrone, requêtes servies par aiosqlite
+SQLALCHEMY_DATABASE_URL = "sqlite:///./test_async_db.db"
+
+engine = create_engine(SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False})
+async_engine = create_async_engine(async_database_url(SQLALCHEMY_DATABASE_URL))
+TestingAsyncSessionLocal = async_sessionmaker(async_engine, expire_on_commit=False)
+
+async def override_get_db():
+    async with TestingAsyncSessionLocal() as db:
+        yield db
+
+@pytest.fixture
+def client():
+    app.dependency_overrides[get_db] = override_get_db
+    response_cache.clear()
+    popular_ranking.reset()
+    Base.metadata.create_all(bind=engine)
+    with TestClient(app) as c:
+        yield c
+    Base.metadata.drop_all(bind=engine)
+    response_cache.clear()
+
+@pytest.fixture
+def salon_id(client):
+    response = client.post("/api/salons/", json={
+        "name": "Async Nails",
+        "description": "Nail art",
+        "address": "1 Rue Test",
+        "city": "Paris",
+        "phone": "0123456789",
+        "email": "async@test.com",
+        "price_range": "€€",
+        "open_time": "09:00:00",
+        "close_time": "18:00:00"
+    })
+    assert response.status_code == 200
+    return response.json()["id"]
+
+def test_async_database_url():
+    """Test the mapping to async drivers"""
+    assert async_database_url("postgresql://u:p@db/bookinails") == "postgresql+asyncpg://u:p@db/bookinails"
+    assert async_database_url("postgresql+psycopg2://u:p@db/x") == "postgresql+asyncpg://u:p@db/x"
+    assert async_database_url("sqlite:///./x.db") == "sqlite+aiosqlite:///./x.db"
+
+def test_salon_reads_with_async_session(client, salon_id):
+    """Test salon endpoints served through an AsyncSession"""
+    assert client.get(f"/api/salons/{salon_id}").json()["name"] == "Async Nails"
+    assert [s["id"] for s in client.get("/api/salons/?city=paris").json()] == [salon_id]
+    assert [s["id"] for s in client.get("/api/salons/search?q=async").json()] == [salon_id]
+    assert client.get("/api/salons/facets").json()["total"] == 1
+    assert client.get(f"/api/salons/{salon_id}/availability?date=2030-01-07").json()["slots"]
+
+def test_booking_with_async_session(client, salon_id):
+    """Test reservation, conflict and cancellation through an AsyncSession"""
+    start = datetime.combine((datetime.now() + timedelta(days=1)).date(), time(10, 0))
+    payload = {
+        "salon_id": salon_id,
+        "service_type": "Manucure",
+        "appointment_date": start.isoformat(),
+        "duration_minutes": 60,
+        "price": 45.0
+    }
+    first = client.post("/api/reservations/", json=payload)
+    assert first.status_code == 200
+    assert client.post("/api/reservations/", json=payload).status_code == 409
+
+    reservation_id = first.json()["id"]
+    assert client.patch(f"/api/reservations/{reservation_id}/cancel").status_code == 200
+    assert client.post("/api/reservations/", json=payload).status_code == 200
+
+def test_concurrent_popular_with_async_session(client, salon_id):
+    """Test that concurrent rebuilds of the popular ranking do not block the event loop"""
+    with ThreadPoolExecutor(max_workers=5) as pool:
+        futures = [pool.submit(client.get, f"/api/salons/popular?limit={limit}") for limit in range(1, 6)]
+        responses = [future.result(timeout=10) for future in futures]
+    assert [response.status_code for response in responses] == [200] * 5
+
+def test_sync_session_runs_off_event_loop():
+    """Test that a classic Session is used from the threadpool, not the event loop thread"""
+    SessionLocal = sessionmaker(bind=engine)
+    db = SessionLocal()
+
+    async def run():
+        return threading.get_ident(), await run_db(db, lambda session: threading.get_ident())
+
+    loop_thread, query_thread = asyncio.run(run())
+    db.close()
+    assert loop_thread != query_thread
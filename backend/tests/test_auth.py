@@ -1,12 +1,23 @@
 import pytest
 from fastapi.testclient import TestClient
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.pool import StaticPool
 
+from jose import jwt
+
 from main import app
-from models import Base, User
+from models import Base, RefreshSession, RevokedToken, User
 from db import get_db
+import asyncio
+import time
+from datetime import datetime, timedelta
+
+from routers import auth as auth_router
+from routers.auth import ALGORITHM, SECRET_KEY
+from services.passwords import HashingOverloaded, PasswordHasher
+from services.token_revocation import BloomFilter, RevocationList, revoked_tokens
+from services.user_cache import UserCache, user_cache
 
 # Test database setup
 SQLALCHEMY_DATABASE_URL = "sqlite:///./test.db"
@@ -25,14 +36,16 @@ def override_get_db():
     finally:
         db.close()
 
-app.dependency_overrides[get_db] = override_get_db
-
 @pytest.fixture
 def client():
+    app.dependency_overrides[get_db] = override_get_db
+    user_cache.clear()
+    revoked_tokens.reset()
     Base.metadata.create_all(bind=engine)
     with TestClient(app) as c:
         yield c
     Base.metadata.drop_all(bind=engine)
+    user_cache.clear()
 
 @pytest.fixture
 def test_user_data():
@@ -74,6 +87,28 @@ def test_register_duplicate_email(client, test_user_data):
     response = client.post("/api/auth/register", json=test_user_data)
     assert response.status_code == 400
 
+def test_register_and_login_write_in_one_statement(client, test_user_data):
+    """Test that account creation is a single upsert and repeated logins reuse the account"""
+    statements = []
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+    event.listen(engine, "before_cursor_execute", record)
+    try:
+        response = client.post("/api/auth/register", json=test_user_data)
+    finally:
+        event.remove(engine, "before_cursor_execute", record)
+    assert response.status_code == 200
+    user_statements = [statement for statement in statements if "users" in statement]
+    assert len(user_statements) == 1
+    assert "ON CONFLICT" in user_statements[0] and "RETURNING" in user_statements[0]
+
+    # Compte créé à la première connexion, retrouvé par la même requête ensuite
+    first = client.post("/api/auth/login", json={"email": "new@test.com", "password": "secret"})
+    second = client.post("/api/auth/login", json={"email": "new@test.com", "password": "secret"})
+    assert first.status_code == second.status_code == 200
+    assert first.json()["user"]["id"] == second.json()["user"]["id"]
+    assert first.json()["user"]["name"] == "new"
+
 def test_login_success(client, test_user_data):
     """Test successful login"""
     # Register user first
@@ -123,3 +158,228 @@ def test_unauthorized_access(client):
     """Test accessing protected route without token"""
     response = client.get("/api/auth/me")
     assert response.status_code == 401
+
+def login_headers(client, email):
+    response = client.post("/api/auth/login", json={"email": email, "password": "testpassword"})
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+def count_statements(client, url, headers):
+    statements = []
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+    event.listen(engine, "before_cursor_execute", record)
+    try:
+        response = client.get(url, headers=headers)
+    finally:
+        event.remove(engine, "before_cursor_execute", record)
+    return response, len(statements)
+
+def test_current_user_cached_until_changed(client, test_user_data):
+    """Test that the authenticated profile is served from cache and refreshed on update"""
+    client.post("/api/auth/register", json=test_user_data)
+    headers = login_headers(client, test_user_data["email"])
+
+    # Révocations relues en tâche de fond : seule la lecture du profil
+    response, statements = count_statements(client, "/api/auth/me", headers)
+    assert response.status_code == 200
+    assert statements == 1
+    response, statements = count_statements(client, "/api/auth/me", headers)
+    assert response.json()["name"] == test_user_data["name"]
+    assert statements == 0
+
+    # Toute modification de l'utilisateur invalide son entrée
+    db = TestingSessionLocal()
+    user = db.query(User).filter(User.email == test_user_data["email"]).first()
+    user.name = "Nouveau Nom"
+    db.commit()
+    db.close()
+    assert client.get("/api/auth/me", headers=headers).json()["name"] == "Nouveau Nom"
+
+def test_token_carries_id_and_role(client):
+    """Test uid / role claims in issued tokens"""
+    headers = login_headers(client, "claims@example.com")
+    payload = jwt.decode(headers["Authorization"].split()[1], SECRET_KEY, algorithms=[ALGORITHM])
+    assert payload["sub"] == "claims@example.com"
+    assert payload["role"] == "client"
+    assert payload["uid"] == client.get("/api/auth/me", headers=headers).json()["id"]
+
+def test_invalid_token_rejected(client):
+    """Test that a malformed or foreign token gets a 401"""
+    response = client.get("/api/auth/me", headers={"Authorization": "Bearer not-a-token"})
+    assert response.status_code == 401
+    forged = jwt.encode({"sub": "x@example.com"}, "other-secret", algorithm=ALGORITHM)
+    response = client.get("/api/auth/me", headers={"Authorization": f"Bearer {forged}"})
+    assert response.status_code == 401
+
+def test_user_cache_bounds():
+    """Test LRU eviction and expiry of the user cache"""
+    cache = UserCache(ttl=60, max_entries=2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    cache.get("a")
+    cache.put("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+
+    expired = UserCache(ttl=0, max_entries=2)
+    expired.put("a", 1)
+    assert expired.get("a") is None
+
+def stored_hash(email):
+    db = TestingSessionLocal()
+    hashed_password = db.query(User.hashed_password).filter(User.email == email).scalar()
+    db.close()
+    return hashed_password
+
+def test_login_checks_registered_password(client, test_user_data, monkeypatch):
+    """Test that a password given at registration is required at login"""
+    monkeypatch.setattr(auth_router, "password_hasher", PasswordHasher(rounds=4))
+    response = client.post("/api/auth/register", json={**test_user_data, "password": "s3cret"})
+    assert response.status_code == 200
+    assert "password" not in response.json() and "hashed_password" not in response.json()
+
+    response = client.post("/api/auth/login", json={"email": test_user_data["email"], "password": "wrong"})
+    assert response.status_code == 401
+    response = client.post("/api/auth/login", json={"email": test_user_data["email"], "password": "s3cret"})
+    assert response.status_code == 200
+    assert "hashed_password" not in response.json()["user"]
+
+def test_rehash_on_login_when_cost_changes(client, test_user_data, monkeypatch):
+    """Test transparent rehash when the bcrypt cost is changed"""
+    monkeypatch.setattr(auth_router, "password_hasher", PasswordHasher(rounds=4))
+    client.post("/api/auth/register", json={**test_user_data, "password": "s3cret"})
+    assert stored_hash(test_user_data["email"]).startswith("$2b$04$")
+
+    monkeypatch.setattr(auth_router, "password_hasher", PasswordHasher(rounds=5))
+    response = client.post("/api/auth/login", json={"email": test_user_data["email"], "password": "s3cret"})
+    assert response.status_code == 200
+    assert stored_hash(test_user_data["email"]).startswith("$2b$05$")
+
+def test_hashing_queue_fails_fast(client, monkeypatch):
+    """Test that hashing requests beyond the queue limit are rejected immediately"""
+    hasher = PasswordHasher(rounds=4, workers=1, max_pending=1)
+
+    async def burst():
+        return await asyncio.gather(*[hasher.hash("secret") for _ in range(3)], return_exceptions=True)
+
+    results = asyncio.run(burst())
+    assert results[0].startswith("$2b$04$")
+    assert all(isinstance(result, HashingOverloaded) for result in results[1:])
+    assert hasher.pending == 0 and hasher.rejected == 2
+
+    monkeypatch.setattr(auth_router, "password_hasher", PasswordHasher(rounds=4, max_pending=0))
+    response = client.post("/api/auth/login", json={"email": "storm@example.com", "password": "secret"})
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "1"
+
+def test_refresh_token_rotation(client):
+    """Test refresh without password and one-time use of refresh tokens"""
+    tokens = client.post("/api/auth/login", json={"email": "refresh@example.com", "password": "secret"}).json()
+    assert tokens["refresh_token"] != tokens["access_token"]
+
+    response = client.post("/api/auth/refresh", json={"refresh_token": tokens["refresh_token"]})
+    assert response.status_code == 200
+    renewed = response.json()
+    assert client.get("/api/auth/me", headers={"Authorization": f"Bearer {renewed['access_token']}"}).status_code == 200
+
+    # Rotation : l'ancien jeton de rafraîchissement ne sert qu'une fois
+    assert client.post("/api/auth/refresh", json={"refresh_token": tokens["refresh_token"]}).status_code == 401
+    # Un type de jeton ne remplace pas l'autre
+    assert client.post("/api/auth/refresh", json={"refresh_token": renewed["access_token"]}).status_code == 401
+    headers = {"Authorization": f"Bearer {renewed['refresh_token']}"}
+    assert client.get("/api/auth/me", headers=headers).status_code == 401
+
+def test_logout_revokes_tokens(client):
+    """Test that logout revokes the access token and the given refresh token"""
+    tokens = client.post("/api/auth/login", json={"email": "logout@example.com", "password": "secret"}).json()
+    headers = {"Authorization": f"Bearer {tokens['access_token']}"}
+    assert client.get("/api/auth/me", headers=headers).status_code == 200
+
+    response = client.post("/api/auth/logout", json={"refresh_token": tokens["refresh_token"]}, headers=headers)
+    assert response.status_code == 200
+    assert client.get("/api/auth/me", headers=headers).status_code == 401
+    assert client.post("/api/auth/refresh", json={"refresh_token": tokens["refresh_token"]}).status_code == 401
+
+    # Seul le jeton d'accès est listé ; la session de rafraîchissement est fermée
+    db = TestingSessionLocal()
+    assert db.query(RevokedToken).count() == 1
+    assert db.query(RefreshSession).count() == 0
+
+    # Révocation enregistrée par un autre worker : vue après relecture de la table
+    revoked_tokens.reset()
+    assert client.get("/api/auth/me", headers=headers).status_code == 200
+    revoked_tokens.sync(db)
+    db.close()
+    assert client.get("/api/auth/me", headers=headers).status_code == 401
+
+def test_refresh_sessions_do_not_grow(client):
+    """Test that rotations update one session row, a replayed token closes the session"""
+    tokens = client.post("/api/auth/login", json={"email": "rotate@example.com", "password": "secret"}).json()
+    for _ in range(5):
+        tokens = client.post("/api/auth/refresh", json={"refresh_token": tokens["refresh_token"]}).json()
+    other_device = client.post("/api/auth/login", json={"email": "rotate@example.com", "password": "secret"}).json()
+
+    db = TestingSessionLocal()
+    assert db.query(RefreshSession).count() == 2
+    assert db.query(RevokedToken).count() == 0
+    db.close()
+
+    # Jeton déjà échangé présenté à nouveau : la session est fermée, l'autre appareil reste connecté
+    stale = tokens["refresh_token"]
+    client.post("/api/auth/refresh", json={"refresh_token": stale})
+    assert client.post("/api/auth/refresh", json={"refresh_token": stale}).status_code == 401
+    db = TestingSessionLocal()
+    assert db.query(RefreshSession).count() == 1
+    db.close()
+    response = client.post("/api/auth/refresh", json={"refresh_token": other_device["refresh_token"]})
+    assert response.status_code == 200
+
+def test_revocation_sync_is_incremental():
+    """Test that a sync reads only new rows and rereads ids skipped by uncommitted transactions"""
+    Base.metadata.create_all(bind=engine)
+    db = TestingSessionLocal()
+    revocations = RevocationList(bits=1 << 14, hashes=7)
+    expires = datetime.utcnow() + timedelta(minutes=30)
+    db.add_all([RevokedToken(id=1, jti="first", expires_at=expires),
+                RevokedToken(id=3, jti="third", expires_at=expires)])
+    db.commit()
+    revocations.sync(db)
+    assert revocations.is_revoked("first") and revocations.is_revoked("third")
+
+    statements = []
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(parameters)
+    event.listen(engine, "before_cursor_execute", record)
+    try:
+        # Ligne 2 validée après la lecture de la ligne 3
+        db.add(RevokedToken(id=2, jti="second", expires_at=expires))
+        db.commit()
+        revocations.sync(db)
+    finally:
+        event.remove(engine, "before_cursor_execute", record)
+    assert revocations.is_revoked("second")
+    # Bornes : identifiant 3 et trou 2, pas de relecture complète
+    assert 3 in statements[-1] and 2 in statements[-1]
+
+    revocations.sync(db)
+    assert len(revocations) == 3
+    db.close()
+    Base.metadata.drop_all(bind=engine)
+
+def test_revocation_list_expiry():
+    """Test Bloom filter membership and expiry of revoked token ids"""
+    bloom = BloomFilter(bits=1 << 14, hashes=7)
+    keys = [f"jti-{i}" for i in range(500)]
+    for key in keys:
+        bloom.add(key)
+    assert all(key in bloom for key in keys)
+    assert sum(f"other-{i}" in bloom for i in range(5000)) < 100
+
+    revocations = RevocationList(bits=1 << 14, hashes=7)
+    now = time.time()
+    revocations.add("live", now + 3600)
+    revocations.add("expired", now - 1)
+    assert revocations.is_revoked("live")
+    assert not revocations.is_revoked("expired")
+    assert not revocations.is_revoked("unknown")
+    assert not revocations.is_revoked(None)
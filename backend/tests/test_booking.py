@@ -1,13 +1,21 @@
+import asyncio
+import threading
+
 import pytest
 from fastapi.testclient import TestClient
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.pool import StaticPool
-from datetime import datetime, timedelta
+from datetime import datetime, time, timedelta
 
 from main import app
-from models import Base, User, Salon, Reservation
+from models import Base, User, Salon, SalonDayAvailability, Reservation
 from db import get_db
+from services.cache import response_cache
+from services.availability_store import get_day_mask, rebuild_availability
+from services.autocomplete import autocomplete_index
+from services.booking import SlotConflict, claim_slots
+from services.ranking import popular_ranking
 
 # Test database setup
 SQLALCHEMY_DATABASE_URL = "sqlite:///./test_booking.db"
@@ -26,10 +34,10 @@ def override_get_db():
     finally:
         db.close()
 
-app.dependency_overrides[get_db] = override_get_db
-
 @pytest.fixture
 def client():
+    app.dependency_overrides[get_db] = override_get_db
+    response_cache.clear()
     Base.metadata.create_all(bind=engine)
     with TestClient(app) as c:
         yield c
@@ -60,8 +68,8 @@ def setup_test_data(client):
         rating=4.5,
         total_reviews=10,
         price_range="€€",
-        open_time="09:00",
-        close_time="18:00"
+        open_time=time(9, 0),
+        close_time=time(18, 0)
     )
     db.add(salon)
     db.commit()
@@ -104,6 +112,151 @@ def test_get_salon_availability(client, setup_test_data):
     assert "slots" in data
     assert len(data["slots"]) > 0
 
+def test_salon_availability_excludes_reservations(client, setup_test_data):
+    """Test that booked slots are reported as unavailable"""
+    salon_id = setup_test_data["salon_id"]
+    day = (datetime.now() + timedelta(days=1)).date()
+    client.post("/api/reservations/", json={
+        "salon_id": salon_id,
+        "service_type": "Manucure",
+        "appointment_date": datetime.combine(day, time(10, 0)).isoformat(),
+        "duration_minutes": 60,
+        "price": 45.0
+    })
+
+    response = client.get(f"/api/salons/{salon_id}/availability?date={day}&granularity=30")
+    assert response.status_code == 200
+    slots = {slot["time"]: slot["available"] for slot in response.json()["slots"]}
+    assert slots["09:00"] is True
+    assert slots["09:30"] is False
+    assert slots["10:00"] is False
+    assert slots["10:30"] is False
+    assert slots["11:00"] is True
+    # Le dernier créneau de 60 minutes commence une heure avant la fermeture
+    assert max(slots) == "17:00"
+
+def test_salon_availability_ignores_cancelled(client, setup_test_data):
+    """Test that cancelled reservations free their slot"""
+    salon_id = setup_test_data["salon_id"]
+    day = (datetime.now() + timedelta(days=1)).date()
+    create_response = client.post("/api/reservations/", json={
+        "salon_id": salon_id,
+        "service_type": "Manucure",
+        "appointment_date": datetime.combine(day, time(14, 0)).isoformat(),
+        "duration_minutes": 60,
+        "price": 45.0
+    })
+    client.patch(f"/api/reservations/{create_response.json()['id']}/cancel")
+
+    response = client.get(f"/api/salons/{salon_id}/availability?date={day}")
+    slots = {slot["time"]: slot["available"] for slot in response.json()["slots"]}
+    assert slots["14:00"] is True
+
+def test_availability_bitmap_follows_booking_keys(client, setup_test_data):
+    """Test that bitmaps use the 5-minute booking keys and cancelling frees only its own buckets"""
+    salon_id = setup_test_data["salon_id"]
+    day = (datetime.now() + timedelta(days=1)).date()
+    first = client.post("/api/reservations/", json={
+        "salon_id": salon_id,
+        "service_type": "Manucure",
+        "appointment_date": datetime.combine(day, time(10, 0)).isoformat(),
+        "duration_minutes": 22,
+        "price": 25.0
+    }).json()
+    # La tranche de 10h20 est déjà prise : refusé, comme le montre le bitmap
+    overlapping = {
+        "salon_id": salon_id,
+        "service_type": "Pose",
+        "appointment_date": datetime.combine(day, time(10, 22)).isoformat(),
+        "duration_minutes": 38,
+        "price": 45.0
+    }
+    assert client.post("/api/reservations/", json=overlapping).status_code == 409
+    overlapping["appointment_date"] = datetime.combine(day, time(10, 25)).isoformat()
+    overlapping["duration_minutes"] = 35
+    second = client.post("/api/reservations/", json=overlapping).json()
+
+    db = TestingSessionLocal()
+    # Tranches de 10h00 à 11h00 : bits 120 à 131 (fin à 10h22 arrondie à la tranche de 10h20)
+    assert get_day_mask(db, salon_id, day) == 0b111111111111 << 120
+
+    client.patch(f"/api/reservations/{second['id']}/cancel")
+    db.expire_all()
+    assert get_day_mask(db, salon_id, day) == 0b11111 << 120
+
+    # La reconstruction complète aboutit au même état
+    rebuild_availability(db, days=7)
+    assert get_day_mask(db, salon_id, day) == 0b11111 << 120
+
+    client.patch(f"/api/reservations/{first['id']}/cancel")
+    db.expire_all()
+    assert get_day_mask(db, salon_id, day) == 0
+    db.close()
+
+def test_rebuild_availability_repairs_drift(client, setup_test_data):
+    """Test that the nightly rebuild restores a bitmap changed by hand and keeps later bookings"""
+    salon_id = setup_test_data["salon_id"]
+    day = (datetime.now() + timedelta(days=1)).date()
+    booking = {
+        "salon_id": salon_id,
+        "service_type": "Manucure",
+        "appointment_date": datetime.combine(day, time(10, 0)).isoformat(),
+        "duration_minutes": 30,
+        "price": 25.0
+    }
+    assert client.post("/api/reservations/", json=booking).status_code == 200
+
+    db = TestingSessionLocal()
+    # Dérive : bitmap effacé par une correction manuelle, bit fantôme à 15h
+    db.query(SalonDayAvailability).filter(SalonDayAvailability.salon_id == salon_id).update(
+        {SalonDayAvailability.busy_2: 0, SalonDayAvailability.busy_3: 1 << 36}, synchronize_session=False
+    )
+    db.commit()
+    busy = client.get(f"/api/salons/?available_date={day}&available_time=10:00&duration=30").json()
+    assert salon_id in [salon["id"] for salon in busy]
+
+    rebuild_availability(db, days=7)
+    assert get_day_mask(db, salon_id, day) == 0b111111 << 120
+    db.close()
+
+    busy = client.get(f"/api/salons/?available_date={day}&available_time=10:00&duration=30").json()
+    free = client.get(f"/api/salons/?available_date={day}&available_time=15:00&duration=30").json()
+    assert salon_id not in [salon["id"] for salon in busy]
+    assert salon_id in [salon["id"] for salon in free]
+
+    # Les mises à jour incrémentales reprennent sur la ligne reconstruite
+    booking["appointment_date"] = datetime.combine(day, time(10, 30)).isoformat()
+    assert client.post("/api/reservations/", json=booking).status_code == 200
+    db = TestingSessionLocal()
+    assert get_day_mask(db, salon_id, day) == 0b111111111111 << 120
+    db.close()
+
+def test_availability_same_inside_and_beyond_horizon(client, setup_test_data):
+    """Test that bitmaps, exact intervals, search and booking agree on a 50-minute booking"""
+    salon_id = setup_test_data["salon_id"]
+    for days_ahead in (1, 90):
+        day = (datetime.now() + timedelta(days=days_ahead)).date()
+        booking = {
+            "salon_id": salon_id,
+            "service_type": "Manucure",
+            "appointment_date": datetime.combine(day, time(10, 0)).isoformat(),
+            "duration_minutes": 50,
+            "price": 45.0
+        }
+        assert client.post("/api/reservations/", json=booking).status_code == 200
+
+        response = client.get(f"/api/salons/{salon_id}/availability?date={day}&duration=15&granularity=5")
+        slots = {slot["time"]: slot["available"] for slot in response.json()["slots"]}
+        assert (slots["10:45"], slots["10:50"]) == (False, True), days_ahead
+
+        busy = client.get(f"/api/salons/?available_date={day}&available_time=10:45&duration=15").json()
+        free = client.get(f"/api/salons/?available_date={day}&available_time=10:50&duration=15").json()
+        assert salon_id not in [salon["id"] for salon in busy], days_ahead
+        assert salon_id in [salon["id"] for salon in free], days_ahead
+
+        booking["appointment_date"] = datetime.combine(day, time(10, 50)).isoformat()
+        assert client.post("/api/reservations/", json=booking).status_code == 200
+
 def test_create_reservation(client, setup_test_data):
     """Test creating a reservation"""
     reservation_data = {
@@ -122,6 +275,27 @@ def test_create_reservation(client, setup_test_data):
     assert data["status"] == "confirmed"
     assert data["price"] == 45.0
 
+def test_create_reservation_unknown_salon(client, setup_test_data):
+    """Test that the salon check and insert are one statement and nothing is written for an unknown salon"""
+    reservation_data = {
+        "salon_id": 999,
+        "service_type": "Manucure classique",
+        "appointment_date": (datetime.now() + timedelta(days=1)).isoformat(),
+        "duration_minutes": 30,
+        "price": 30.0
+    }
+    response = client.post("/api/reservations/", json=reservation_data)
+    assert response.status_code == 404
+    assert client.get("/api/reservations/").json() == []
+
+    reservation_data["salon_id"] = setup_test_data["salon_id"]
+    response = client.post("/api/reservations/", json=reservation_data)
+    assert response.status_code == 200
+    db = TestingSessionLocal()
+    reservation = db.get(Reservation, response.json()["id"])
+    assert reservation.end_date == reservation.appointment_date + timedelta(minutes=30)
+    db.close()
+
 def test_get_reservations(client, setup_test_data):
     """Test getting user reservations"""
     # First create a reservation
@@ -140,6 +314,99 @@ def test_get_reservations(client, setup_test_data):
     data = response.json()
     assert len(data) >= 1
 
+def auth_headers(client, email):
+    response = client.post("/api/auth/login", json={"email": email, "password": "secret"})
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+def count_statements(client, url, headers=None):
+    """Nombre de requêtes SQL exécutées pour servir url"""
+    statements = []
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+    event.listen(engine, "before_cursor_execute", record)
+    try:
+        response = client.get(url, headers=headers)
+    finally:
+        event.remove(engine, "before_cursor_execute", record)
+    assert response.status_code == 200
+    return response, len(statements)
+
+def test_get_reservations_expanded(client, setup_test_data):
+    """Test embedded salon and client summaries loaded without N+1 queries"""
+    db = TestingSessionLocal()
+    salons = [
+        Salon(name=f"Salon {i}", description="Nail art", address=f"{i} Rue Test", city="Paris",
+              phone="0123456789", email=f"salon{i}@test.com", price_range="€€")
+        for i in range(5)
+    ]
+    db.add_all(salons)
+    db.flush()
+    start = datetime.combine((datetime.now() + timedelta(days=1)).date(), time(9, 0))
+    db.add_all([
+        Reservation(salon_id=salons[i % 5].id, client_id=setup_test_data["user_id"], service_type="Manucure",
+                    appointment_date=start + timedelta(hours=i), duration_minutes=60, price=45.0)
+        for i in range(10)
+    ])
+    db.commit()
+    db.close()
+
+    headers = auth_headers(client, "client@test.com")
+    # Relecture initiale des jetons révoqués, hors comptage
+    client.get("/api/auth/me", headers=headers)
+    response, small_page = count_statements(client, "/api/reservations/?expand=salon,client&limit=2", headers)
+    assert len(response.json()) == 2
+    response, large_page = count_statements(client, "/api/reservations/?expand=salon,client&limit=10", headers)
+    data = response.json()
+    assert len(data) == 10
+    assert small_page == large_page == 1
+    assert {item["salon"]["name"] for item in data} == {f"Salon {i}" for i in range(5)}
+    assert data[0]["salon"]["id"] == data[0]["salon_id"]
+    assert data[0]["client"]["email"] == "client@test.com"
+
+    # Sans expansion : aucune relation chargée, ni avant ni après la sérialisation
+    response, statements = count_statements(client, "/api/reservations/?expand=salon&limit=10")
+    assert statements == 1
+    assert response.json()[0]["client"] is None
+    response, statements = count_statements(client, "/api/reservations/?limit=10")
+    assert statements == 1
+    assert response.json()[0]["salon"] is None
+
+    response = client.get("/api/reservations/?expand=payments")
+    assert response.status_code == 400
+
+def test_client_expansion_limited_to_owner(client, setup_test_data):
+    """Test that client contact details are only listed for the client or the salon owner"""
+    db = TestingSessionLocal()
+    owner = User(email="owner@test.com", name="Owner", phone="", is_professional=True)
+    other = User(email="other@test.com", name="Other", phone="", is_professional=False)
+    db.add_all([owner, other])
+    db.flush()
+    owned = Salon(name="Owned Salon", description="Nail art", address="2 Rue Test", city="Paris",
+                  phone="0123456789", email="owned@test.com", price_range="€€", owner_id=owner.id)
+    db.add(owned)
+    db.flush()
+    start = datetime.combine((datetime.now() + timedelta(days=1)).date(), time(9, 0))
+    db.add_all([
+        Reservation(salon_id=owned.id, client_id=setup_test_data["user_id"], service_type="Manucure",
+                    appointment_date=start, duration_minutes=60, price=45.0),
+        Reservation(salon_id=setup_test_data["salon_id"], client_id=setup_test_data["user_id"],
+                    service_type="Pédicure", appointment_date=start + timedelta(hours=2),
+                    duration_minutes=60, price=45.0),
+    ])
+    db.commit()
+    db.close()
+
+    assert client.get("/api/reservations/?expand=client").status_code == 401
+    assert len(client.get("/api/reservations/?expand=salon").json()) == 2
+
+    response = client.get("/api/reservations/?expand=client", headers=auth_headers(client, "client@test.com"))
+    assert len(response.json()) == 2
+    response = client.get("/api/reservations/?expand=client", headers=auth_headers(client, "owner@test.com"))
+    assert [item["service_type"] for item in response.json()] == ["Manucure"]
+    assert response.json()[0]["client"]["email"] == "client@test.com"
+    response = client.get("/api/reservations/?expand=client", headers=auth_headers(client, "other@test.com"))
+    assert response.json() == []
+
 def test_cancel_reservation(client, setup_test_data):
     """Test cancelling a reservation"""
     # Create reservation
@@ -167,6 +434,344 @@ def test_search_salons_by_city(client, setup_test_data):
     assert len(data) >= 1
     assert all(salon["city"] == "Test City" for salon in data)
 
+def test_filter_salons_by_availability(client, setup_test_data):
+    """Test filtering salons free at a given date and time"""
+    day = (datetime.now() + timedelta(days=1)).date()
+    client.post("/api/reservations/", json={
+        "salon_id": setup_test_data["salon_id"],
+        "service_type": "Manucure",
+        "appointment_date": datetime.combine(day, time(14, 0)).isoformat(),
+        "duration_minutes": 60,
+        "price": 45.0
+    })
+
+    busy = client.get(f"/api/salons/?available_date={day}&available_time=14:30")
+    assert busy.status_code == 200
+    assert busy.json() == []
+
+    free = client.get(f"/api/salons/?available_date={day}&available_time=15:00")
+    assert [salon["id"] for salon in free.json()] == [setup_test_data["salon_id"]]
+
+    closed = client.get(f"/api/salons/?available_date={day}&available_time=17:30")
+    assert closed.json() == []
+
+def test_full_text_search(client, setup_test_data):
+    """Test full-text search with prefixes, accents and rating blend"""
+    db = TestingSessionLocal()
+    db.add(Salon(
+        name="Salon Élégance",
+        description="Manucure et beauté des ongles",
+        address="1 Rue de la Paix",
+        city="Paris",
+        phone="0123456789",
+        email="elegance@test.com",
+        rating=4.9,
+        total_reviews=50,
+        price_range="€€€",
+        open_time=time(9, 0),
+        close_time=time(18, 0)
+    ))
+    db.commit()
+    db.close()
+
+    response = client.get("/api/salons/search?q=elegan")
+    assert [salon["name"] for salon in response.json()] == ["Salon Élégance"]
+
+    response = client.get("/api/salons/search?q=beaute ongles")
+    assert [salon["name"] for salon in response.json()] == ["Salon Élégance"]
+
+    # Même pertinence sur "salon" : la meilleure note passe devant
+    response = client.get("/api/salons/search?q=salon")
+    assert [salon["name"] for salon in response.json()] == ["Salon Élégance", "Test Salon"]
+
+    first_page = client.get("/api/salons/search?q=salon&limit=1")
+    assert [salon["name"] for salon in first_page.json()] == ["Salon Élégance"]
+    cursor = first_page.headers["X-Next-Cursor"]
+    second_page = client.get(f"/api/salons/search?q=salon&limit=1&cursor={cursor}")
+    assert [salon["name"] for salon in second_page.json()] == ["Test Salon"]
+    assert "X-Next-Cursor" not in second_page.headers
+
+    response = client.get("/api/salons/search?q=*")
+    assert response.json() == []
+
+def test_search_index_follows_new_salons(client):
+    """Test that salons created through the API are searchable"""
+    client.post("/api/salons/", json={
+        "name": "Nail Bar Bellecour",
+        "description": "Nail art",
+        "address": "2 Place Bellecour",
+        "city": "Lyon",
+        "phone": "0478000000",
+        "email": "bar@test.com",
+        "price_range": "€",
+        "open_time": "10:00:00",
+        "close_time": "19:00:00"
+    })
+    response = client.get("/api/salons/search?q=bellecour")
+    assert len(response.json()) == 1
+
+def test_autocomplete_salons(client, setup_test_data):
+    """Test prefix suggestions ordered by rating"""
+    autocomplete_index.reset()
+    db = TestingSessionLocal()
+    db.add(Salon(
+        name="Test Nails Élite",
+        description="Nail art",
+        address="3 Rue Test",
+        city="Testville",
+        phone="0123456789",
+        email="elite@test.com",
+        rating=4.9,
+        total_reviews=40,
+        price_range="€€",
+        open_time=time(9, 0),
+        close_time=time(18, 0)
+    ))
+    db.commit()
+    db.close()
+
+    response = client.get("/api/salons/autocomplete?q=tes")
+    assert response.status_code == 200
+    assert [s["name"] for s in response.json()] == ["Test Nails Élite", "Test Salon"]
+
+    response = client.get("/api/salons/autocomplete?q=test eli")
+    assert [s["name"] for s in response.json()] == ["Test Nails Élite"]
+
+    # Un salon créé par l'API est ajouté à l'index sans rechargement
+    client.post("/api/salons/", json={
+        "name": "Testarossa Nails",
+        "description": "Nail art",
+        "address": "4 Rue Test",
+        "city": "Paris",
+        "phone": "0123456789",
+        "email": "rossa@test.com",
+        "price_range": "€",
+        "open_time": "10:00:00",
+        "close_time": "19:00:00"
+    })
+    response = client.get("/api/salons/autocomplete?q=testa")
+    assert [s["name"] for s in response.json()] == ["Testarossa Nails"]
+    autocomplete_index.reset()
+
+def test_popular_salons_bayesian_ranking(client, setup_test_data):
+    """Test that popularity weighs the rating by the number of reviews, per city"""
+    popular_ranking.reset()
+    db = TestingSessionLocal()
+    for name, city, rating, reviews in [
+        ("Perfect Once", "Lyon", 5.0, 1),
+        ("Solid Lyon", "Lyon", 4.9, 300),
+        ("Good Paris", "Paris", 4.8, 120),
+        ("No Reviews", "Paris", 0.0, 0),
+    ]:
+        db.add(Salon(
+            name=name,
+            description="Nail art",
+            address="1 Rue Test",
+            city=city,
+            phone="0123456789",
+            email=f"{name.replace(' ', '').lower()}@test.com",
+            rating=rating,
+            total_reviews=reviews,
+            price_range="€€",
+            open_time=time(9, 0),
+            close_time=time(18, 0)
+        ))
+    db.commit()
+    db.close()
+
+    response = client.get("/api/salons/popular?limit=3")
+    assert response.status_code == 200
+    # Un seul avis à 5 ne suffit pas à passer devant 300 avis à 4.9
+    assert [s["name"] for s in response.json()] == ["Solid Lyon", "Perfect Once", "Good Paris"]
+
+    response = client.get("/api/salons/popular?city=lyon")
+    assert [s["name"] for s in response.json()] == ["Solid Lyon", "Perfect Once"]
+    response = client.get("/api/salons/popular?city=Paris")
+    assert [s["name"] for s in response.json()] == ["Good Paris"]
+
+    # L'instantané est servi tel quel jusqu'à son invalidation
+    db = TestingSessionLocal()
+    salon = db.query(Salon).filter(Salon.name == "No Reviews").one()
+    salon.rating, salon.total_reviews = 4.95, 500
+    salon_id = salon.id
+    db.commit()
+    db.close()
+    response = client.get("/api/salons/popular?city=Paris")
+    assert [s["name"] for s in response.json()] == ["Good Paris"]
+
+    popular_ranking.invalidate()
+    asyncio.run(response_cache.invalidate_salon(salon_id))
+    response = client.get("/api/salons/popular?city=Paris")
+    assert [s["name"] for s in response.json()] == ["No Reviews", "Good Paris"]
+    popular_ranking.reset()
+
+def test_salon_facets(client, setup_test_data):
+    """Test facet counts by city, price range and minimum rating"""
+    db = TestingSessionLocal()
+    for name, city, price_range, rating in [
+        ("Paris Un", "Paris", "€", 4.8),
+        ("Paris Deux", "paris", "€€€", 4.2),
+        ("Lyon Un", "Lyon", "€", 3.5),
+    ]:
+        db.add(Salon(
+            name=name,
+            description="Nail art",
+            address="1 Rue Test",
+            city=city,
+            phone="0123456789",
+            email=f"{name.replace(' ', '').lower()}@test.com",
+            rating=rating,
+            total_reviews=10,
+            price_range=price_range,
+            open_time=time(9, 0),
+            close_time=time(18, 0)
+        ))
+    db.commit()
+    db.close()
+
+    response = client.get("/api/salons/facets")
+    assert response.status_code == 200
+    facets = response.json()
+    assert facets["total"] == 4
+    assert [(c["value"], c["count"]) for c in facets["cities"]] == [("paris", 2), ("lyon", 1), ("test city", 1)]
+    assert [(p["value"], p["count"]) for p in facets["price_ranges"]] == [("€", 2), ("€€", 1), ("€€€", 1)]
+    assert [(r["min_rating"], r["count"]) for r in facets["ratings"]] == [(4.5, 2), (4.0, 3), (3.0, 4), (0.0, 4)]
+
+    response = client.get("/api/salons/facets?city=PARIS&min_rating=4.5")
+    facets = response.json()
+    assert facets["total"] == 1
+    assert facets["price_ranges"] == [{"value": "€", "label": "€", "count": 1}]
+
+    # Même filtre normalisé : même entrée de cache
+    response = client.get("/api/salons/facets?city=paris&min_rating=4.5")
+    assert response.headers["X-Cache"] == "HIT"
+
+def test_salon_facets_unknown_price_range_not_shared(client, setup_test_data):
+    """Test that an unknown price range does not poison the unfiltered facets entry"""
+    response = client.get("/api/salons/facets?price_range=bogus")
+    assert response.status_code == 200
+    assert response.json()["total"] == 0
+
+    response = client.get("/api/salons/facets")
+    assert response.headers["X-Cache"] == "MISS"
+    assert response.json()["total"] == 1
+
+def test_nearby_salons_within_radius(client):
+    """Test radius filtering and distance ordering"""
+    salons = [
+        ("Opéra Nails", 48.8712, 2.3320),       # ~0,2 km
+        ("Bastille Nails", 48.8532, 2.3691),    # ~3,4 km
+        ("Bellecour Nails", 45.7578, 4.8320),   # Lyon, ~390 km
+        ("Sans Adresse", None, None),
+    ]
+    for name, lat, lng in salons:
+        response = client.post("/api/salons/", json={
+            "name": name,
+            "description": "Nail art",
+            "address": "1 Rue Test",
+            "city": "Paris",
+            "phone": "0123456789",
+            "email": "geo@test.com",
+            "price_range": "€€",
+            "open_time": "09:00:00",
+            "close_time": "19:00:00",
+            "latitude": lat,
+            "longitude": lng
+        })
+        assert response.status_code == 200
+
+    response = client.get("/api/salons/nearby?lat=48.8698&lng=2.3311&radius=5")
+    assert response.status_code == 200
+    data = response.json()
+    assert [salon["name"] for salon in data["salons"]] == ["Opéra Nails", "Bastille Nails"]
+    assert data["salons"][0]["distance_km"] < data["salons"][1]["distance_km"] <= 5
+
+    response = client.get("/api/salons/nearby?lat=48.8698&lng=2.3311&radius=1")
+    assert [salon["name"] for salon in response.json()["salons"]] == ["Opéra Nails"]
+
+    # Seuls les plus proches sont chargés ; taille de page bornée
+    response = client.get("/api/salons/nearby?lat=48.8698&lng=2.3311&radius=5&limit=1")
+    assert [salon["name"] for salon in response.json()["salons"]] == ["Opéra Nails"]
+    assert response.json()["salons"][0]["email"] == "geo@test.com"
+    for limit in (0, 101):
+        assert client.get(f"/api/salons/nearby?lat=48.8698&lng=2.3311&limit={limit}").status_code == 422
+
+def test_salons_cursor_pagination(client):
+    """Test keyset pagination across pages, with ties on rating"""
+    db = TestingSessionLocal()
+    for i, rating in enumerate([4.9, 4.5, 4.5, 4.5, 3.8, 4.2, 4.5]):
+        db.add(Salon(
+            name=f"Salon {i}",
+            description="Nail art",
+            address="1 Rue Test",
+            city="Paris",
+            phone="0123456789",
+            email="page@test.com",
+            rating=rating,
+            total_reviews=i,
+            price_range="€€",
+            open_time=time(9, 0),
+            close_time=time(18, 0)
+        ))
+    db.commit()
+    expected = [salon.id for salon in db.query(Salon).order_by(Salon.rating.desc(), Salon.id.desc())]
+    db.close()
+
+    seen = []
+    cursor = None
+    while True:
+        url = "/api/salons/?limit=3" + (f"&cursor={cursor}" if cursor else "")
+        response = client.get(url)
+        assert response.status_code == 200
+        seen += [salon["id"] for salon in response.json()]
+        cursor = response.headers.get("X-Next-Cursor")
+        if not cursor:
+            break
+    assert seen == expected
+
+    # Le mode offset reste disponible et donne le même ordre
+    response = client.get("/api/salons/?skip=3&limit=3")
+    assert [salon["id"] for salon in response.json()] == expected[3:6]
+
+    # Un curseur d'un autre tri est refusé
+    first_page = client.get("/api/salons/?limit=3&sort_by=reviews")
+    response = client.get(f"/api/salons/?limit=3&cursor={first_page.headers['X-Next-Cursor']}")
+    assert response.status_code == 400
+    assert client.get("/api/salons/?cursor=not-a-cursor").status_code == 400
+
+def test_salons_with_unknown_price_range(client):
+    """Test price sort, cursor and filter with imported salons lacking a known price range"""
+    db = TestingSessionLocal()
+    for i, price_range in enumerate(["€€", None, "€", "legacy", "€€€"]):
+        db.add(Salon(name=f"Tier {i}", description="Nail art", address="1 Rue Test", city="Paris",
+                     phone="0123456789", email=f"tier{i}@test.com", price_range=price_range,
+                     open_time=time(9, 0), close_time=time(18, 0)))
+    db.commit()
+    db.close()
+
+    seen = []
+    cursor = None
+    while True:
+        url = "/api/salons/?limit=2&sort_by=price" + (f"&cursor={cursor}" if cursor else "")
+        response = client.get(url)
+        assert response.status_code == 200
+        seen += [salon["price_range"] for salon in response.json()]
+        cursor = response.headers.get("X-Next-Cursor")
+        if not cursor:
+            break
+    # Gammes inconnues après les gammes renseignées
+    assert seen == ["€", "€€", "€€€", None, "legacy"]
+
+    assert client.get("/api/salons/?price_range=zzz").json() == []
+    assert len(client.get("/api/salons/?price_range=€").json()) == 1
+
+    response = client.post("/api/salons/", json={
+        "name": "Invalid", "description": "Nail art", "address": "1 Rue Test", "city": "Paris",
+        "phone": "0123456789", "email": "invalid@test.com", "price_range": "zzz",
+        "open_time": "09:00:00", "close_time": "18:00:00"
+    })
+    assert response.status_code == 422
+
 def test_search_salons_empty_result(client):
     """Test searching salons with no results"""
     response = client.get("/api/salons/?city=Nonexistent City")
@@ -192,6 +797,53 @@ def test_double_booking_prevention(client, setup_test_data):
     
     # Try to create second reservation at same time
     response2 = client.post("/api/reservations/", json=reservation_data)
-    # In a real implementation, this should fail with conflict
-    # For now, we just ensure the endpoint works
-    assert response2.status_code in [200, 409]
+    assert response2.status_code == 409
+
+    # An overlapping slot is rejected too, an adjacent one is accepted
+    start = datetime.combine((datetime.now() + timedelta(days=2)).date(), time(10, 0))
+    for offset, expected in [(0, 200), (30, 409), (60, 200)]:
+        slot = (start + timedelta(minutes=offset)).isoformat()
+        response = client.post("/api/reservations/", json={**reservation_data, "appointment_date": slot})
+        assert response.status_code == expected
+
+def test_concurrent_booking_single_winner(client, setup_test_data):
+    """Test that concurrent claims on the same slot yield exactly one winner"""
+    concurrent_engine = create_engine(
+        SQLALCHEMY_DATABASE_URL,
+        connect_args={"check_same_thread": False, "timeout": 30},
+    )
+    ConcurrentSession = sessionmaker(autocommit=False, autoflush=False, bind=concurrent_engine)
+    start = datetime.combine((datetime.now() + timedelta(days=4)).date(), time(11, 0))
+    results = []
+
+    def book():
+        db = ConcurrentSession()
+        try:
+            reservation = Reservation(
+                salon_id=setup_test_data["salon_id"],
+                client_id=setup_test_data["user_id"],
+                service_type="Manucure",
+                appointment_date=start,
+                duration_minutes=60,
+                price=45.0
+            )
+            db.add(reservation)
+            db.flush()
+            claim_slots(db, reservation)
+            db.commit()
+            results.append("ok")
+        except SlotConflict:
+            db.rollback()
+            results.append("conflict")
+        finally:
+            db.close()
+
+    threads = [threading.Thread(target=book) for _ in range(20)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    concurrent_engine.dispose()
+
+    assert results.count("ok") == 1
+    assert results.count("conflict") == 19
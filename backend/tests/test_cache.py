@@ -0,0 +1,256 @@
+import asyncio
+import time as clock
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from datetime import time
+
+from main import app
+from models import Base, Salon
+from db import get_db
+from services.cache import CacheEntry, LocalCacheBackend, response_cache
+from services.ranking import popular_ranking
+from services.singleflight import SingleFlight
+
+# Test database setup
+SQLALCHEMY_DATABASE_URL = "sqlite:///./test_cache.db"
+
+engine = create_engine(
+    SQLALCHEMY_DATABASE_URL,
+    connect_args={"check_same_thread": False},
+    poolclass=StaticPool,
+)
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+def override_get_db():
+    try:
+        db = TestingSessionLocal()
+        yield db
+    finally:
+        db.close()
+
+@pytest.fixture
+def client():
+    app.dependency_overrides[get_db] = override_get_db
+    response_cache.clear()
+    popular_ranking.reset()
+    Base.metadata.create_all(bind=engine)
+    with TestClient(app) as c:
+        yield c
+    Base.metadata.drop_all(bind=engine)
+    response_cache.clear()
+
+@pytest.fixture
+def salon_ids(client):
+    db = TestingSessionLocal()
+    salons = [
+        Salon(
+            name=f"Salon {i}",
+            description="Nail art",
+            address=f"{i} Rue Test",
+            city="Paris",
+            phone="0123456789",
+            email=f"salon{i}@test.com",
+            rating=4.0 + i / 10,
+            total_reviews=10 * i,
+            price_range="€€",
+            open_time=time(9, 0),
+            close_time=time(18, 0)
+        )
+        for i in range(3)
+    ]
+    db.add_all(salons)
+    db.commit()
+    yield [salon.id for salon in salons]
+    db.close()
+
+def salon_payload(name):
+    return {
+        "name": name,
+        "description": "Nail art",
+        "address": "9 Rue Test",
+        "city": "Paris",
+        "phone": "0123456789",
+        "email": "new@test.com",
+        "price_range": "€",
+        "open_time": "10:00:00",
+        "close_time": "19:00:00"
+    }
+
+def test_salon_list_is_cached_with_validators(client, salon_ids):
+    """Test that a second identical request is served from the cache with the same ETag"""
+    first = client.get("/api/salons/?limit=2")
+    assert first.status_code == 200
+    assert first.headers["X-Cache"] == "MISS"
+    assert first.headers["ETag"]
+    assert first.headers["Last-Modified"]
+    assert first.headers["X-Next-Cursor"]
+
+    second = client.get("/api/salons/?limit=2")
+    assert second.headers["X-Cache"] == "HIT"
+    assert second.headers["ETag"] == first.headers["ETag"]
+    assert second.headers["X-Next-Cursor"] == first.headers["X-Next-Cursor"]
+    assert second.json() == first.json()
+
+def test_conditional_requests_return_304(client, salon_ids):
+    """Test If-None-Match and If-Modified-Since against a cached salon"""
+    first = client.get(f"/api/salons/{salon_ids[0]}")
+    etag = first.headers["ETag"]
+
+    response = client.get(f"/api/salons/{salon_ids[0]}", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.headers["ETag"] == etag
+    assert response.content == b""
+
+    response = client.get(f"/api/salons/{salon_ids[0]}", headers={"If-None-Match": '"autre"'})
+    assert response.status_code == 200
+
+    response = client.get(
+        f"/api/salons/{salon_ids[0]}",
+        headers={"If-Modified-Since": first.headers["Last-Modified"]}
+    )
+    assert response.status_code == 304
+
+def test_create_salon_invalidates_lists(client, salon_ids):
+    """Test that creating a salon invalidates cached lists but not other salon pages"""
+    client.get("/api/salons/")
+    client.get(f"/api/salons/{salon_ids[0]}")
+
+    client.post("/api/salons/", json=salon_payload("Nouveau Salon"))
+
+    response = client.get("/api/salons/")
+    assert response.headers["X-Cache"] == "MISS"
+    assert "Nouveau Salon" in [s["name"] for s in response.json()]
+    assert client.get(f"/api/salons/{salon_ids[0]}").headers["X-Cache"] == "HIT"
+
+def test_rating_update_invalidates_salon(client, salon_ids):
+    """Test that invalidating a salon refreshes its page and the lists"""
+    client.get(f"/api/salons/{salon_ids[0]}")
+    client.get("/api/salons/")
+
+    db = TestingSessionLocal()
+    db.query(Salon).filter(Salon.id == salon_ids[0]).update({"rating": 5.0})
+    db.commit()
+    db.close()
+    asyncio.run(response_cache.invalidate_salon(salon_ids[0]))
+
+    response = client.get(f"/api/salons/{salon_ids[0]}")
+    assert response.headers["X-Cache"] == "MISS"
+    assert response.json()["rating"] == 5.0
+    assert client.get("/api/salons/").json()[0]["id"] == salon_ids[0]
+
+def test_stale_response_is_revalidated(client, salon_ids, monkeypatch):
+    """Test that an expired entry is rebuilt once and keeps its Last-Modified if unchanged"""
+    monkeypatch.setattr(response_cache, "ttl", 0)
+    first = client.get("/api/salons/popular")
+
+    # Une autre requête revalide déjà : la réponse périmée est servie telle quelle
+    response_cache._revalidating.add(next(iter(response_cache.backend._entries)))
+    stale = client.get("/api/salons/popular")
+    assert stale.headers["X-Cache"] == "STALE"
+    response_cache._revalidating.clear()
+
+    revalidated = client.get("/api/salons/popular")
+    assert revalidated.headers["X-Cache"] == "REVALIDATED"
+    assert revalidated.headers["ETag"] == first.headers["ETag"]
+    assert revalidated.headers["Last-Modified"] == first.headers["Last-Modified"]
+
+def test_errors_are_not_cached(client):
+    """Test that a 404 is not stored"""
+    assert client.get("/api/salons/999").status_code == 404
+    assert response_cache.backend._entries == {}
+
+def test_concurrent_misses_share_one_query(client, salon_ids, monkeypatch):
+    """Test that identical requests arriving on an empty cache run a single build"""
+    calls = []
+    top = popular_ranking.top
+
+    def slow_top(db, limit, city=None):
+        calls.append(limit)
+        clock.sleep(0.2)
+        return top(db, limit, city)
+
+    monkeypatch.setattr(popular_ranking, "top", slow_top)
+
+    async def burst():
+        async with httpx.AsyncClient(app=app, base_url="http://test") as ac:
+            return await asyncio.gather(*[ac.get("/api/salons/popular") for _ in range(10)])
+
+    responses = asyncio.run(burst())
+    assert len(calls) == 1
+    assert {r.status_code for r in responses} == {200}
+    assert len({r.headers["ETag"] for r in responses}) == 1
+    assert sorted(r.headers["X-Cache"] for r in responses) == ["COALESCED"] * 9 + ["MISS"]
+
+def test_single_flight_shares_errors():
+    """Test that waiters receive the leader's exception and the key is released"""
+    flight = SingleFlight()
+    calls = []
+
+    async def failing():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        raise ValueError("boom")
+
+    async def run():
+        results = await asyncio.gather(*[flight.do("k", failing) for _ in range(5)], return_exceptions=True)
+        assert not flight.in_flight("k")
+        return results
+
+    results = asyncio.run(run())
+    assert len(calls) == 1
+    assert all(isinstance(result, ValueError) for result in results)
+
+def test_local_backend_bounds():
+    """Test LRU eviction by entry count and by size"""
+    backend = LocalCacheBackend(max_entries=2, max_bytes=10)
+
+    def entry(body):
+        return CacheEntry(body=body, etag='"x"', last_modified=0.0, stored_at=0.0)
+
+    backend.set("a", entry(b"1"), ttl=60)
+    backend.set("b", entry(b"2"), ttl=60)
+    assert backend.get("a") is not None
+    backend.set("c", entry(b"3"), ttl=60)
+    assert backend.get("b") is None
+    assert backend.get("a") is not None
+
+    # 1 + 1 + 9 octets > 10 : l'entrée la moins récemment lue (c) est évincée
+    backend.set("d", entry(b"123456789"), ttl=60)
+    assert backend.get("c") is None
+    assert backend.get("a") is not None and backend.get("d") is not None
+
+    backend.set("e", entry(b"x" * 11), ttl=60)
+    assert backend.get("e") is None
+
+class UnavailableBackend(LocalCacheBackend):
+    """Backend partagé arrêté : chaque opération échoue"""
+
+    blocking = True
+    errors = (ConnectionError,)
+
+    def _fail(self, *args):
+        raise ConnectionError("Connection refused")
+
+    get = set = versions = bump = _fail
+
+def test_unavailable_backend_is_a_cache_miss(client, salon_ids, monkeypatch):
+    """Test that a failing shared backend serves responses uncached instead of failing"""
+    monkeypatch.setattr(response_cache, "backend", UnavailableBackend())
+
+    for _ in range(2):
+        response = client.get("/api/salons/?limit=2")
+        assert response.status_code == 200
+        assert response.headers["X-Cache"] == "MISS"
+        assert len(response.json()) == 2
+
+    response = client.get(f"/api/salons/{salon_ids[0]}")
+    assert response.status_code == 200
+    assert response.json()["id"] == salon_ids[0]
+
+    # L'invalidation échoue aussi sans faire échouer l'écriture
+    assert client.post("/api/salons/", json=salon_payload("Sans Cache")).status_code == 200
@@ -0,0 +1,110 @@
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, exc, text
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import QueuePool, StaticPool
+
+from main import app
+from models import Base
+from db import get_db
+from services import pool_metrics as pool_metrics_module
+from services.pool_metrics import PoolMetrics, instrumented_pool, monitor_engine
+
+# Test database setup
+SQLALCHEMY_DATABASE_URL = "sqlite:///./test_health.db"
+
+engine = create_engine(
+    SQLALCHEMY_DATABASE_URL,
+    connect_args={"check_same_thread": False},
+    poolclass=StaticPool,
+)
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+def override_get_db():
+    try:
+        db = TestingSessionLocal()
+        yield db
+    finally:
+        db.close()
+
+@pytest.fixture
+def client():
+    app.dependency_overrides[get_db] = override_get_db
+    Base.metadata.create_all(bind=engine)
+    with TestClient(app) as c:
+        yield c
+    Base.metadata.drop_all(bind=engine)
+
+@pytest.fixture
+def small_pool():
+    """Pool instrumenté d'une seule connexion, sans débordement"""
+    metrics = PoolMetrics()
+    pool_engine = create_engine(
+        "sqlite:///./test_health_pool.db",
+        poolclass=instrumented_pool(QueuePool, metrics),
+        pool_size=1,
+        max_overflow=0,
+        pool_timeout=0.1,
+    )
+    monitor_engine("test", pool_engine, metrics)
+    yield pool_engine, metrics
+    pool_metrics_module._monitored.pop("test", None)
+    pool_engine.dispose()
+
+def test_pool_records_waits_and_timeouts(small_pool):
+    """Test checkout counters, peak usage and timeouts of the instrumented pool"""
+    pool_engine, metrics = small_pool
+    connection = pool_engine.connect()
+    connection.execute(text("SELECT 1"))
+
+    with pytest.raises(exc.TimeoutError):
+        pool_engine.connect()
+
+    stats = metrics.snapshot(pool_engine.pool)
+    assert stats["checkouts"] == 1
+    assert stats["timeouts"] == 1
+    assert stats["checked_out"] == 1
+    assert stats["peak_checked_out"] == 1
+    assert stats["size"] == 1
+    assert stats["wait_ms"]["max"] >= 0
+    connection.close()
+
+    # Les compteurs survivent à la recréation du pool
+    pool_engine.dispose()
+    with pool_engine.connect():
+        pass
+    assert metrics.snapshot(pool_engine.pool)["checkouts"] == 2
+
+def test_readiness_reports_saturated_pool(client, small_pool):
+    """Test that /health/ready checks the database and reports pool saturation"""
+    pool_engine, _ = small_pool
+    response = client.get("/health/ready")
+    assert response.status_code == 200
+    assert response.json()["status"] == "ready"
+    assert "test" in response.json()["pools"]
+
+    connection = pool_engine.connect()
+    response = client.get("/health/ready")
+    assert response.status_code == 503
+    assert response.json()["status"] == "saturated"
+    connection.close()
+
+    assert client.get("/health/ready").status_code == 200
+
+def test_internal_metrics(client, small_pool, monkeypatch):
+    """Test the internal metrics surface, disabled until a token is configured"""
+    pool_engine, _ = small_pool
+    with pool_engine.connect():
+        pass
+    monkeypatch.setattr("main.INTERNAL_METRICS_TOKEN", None)
+    assert client.get("/internal/metrics").status_code == 404
+    monkeypatch.setattr("main.INTERNAL_METRICS_TOKEN", "")
+    assert client.get("/internal/metrics", headers={"X-Internal-Token": ""}).status_code == 404
+
+    monkeypatch.setattr("main.INTERNAL_METRICS_TOKEN", "secret")
+    assert client.get("/internal/metrics").status_code == 403
+    assert client.get("/internal/metrics", headers={"X-Internal-Token": "wrong"}).status_code == 403
+    response = client.get("/internal/metrics", headers={"X-Internal-Token": "secret"})
+    assert response.status_code == 200
+    assert response.json()["pools"]["test"]["checkouts"] == 1
+    assert "primary" in response.json()["pools"]
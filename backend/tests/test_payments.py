@@ -0,0 +1,224 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from datetime import datetime, time, timedelta
+
+from main import app
+from models import Base, Salon, Reservation, ReservationSlot
+from db import get_db
+from services.cache import response_cache
+from routers.payments import handle_successful_payment
+from services.booking import hold_slots, release_hold
+
+# Test database setup
+SQLALCHEMY_DATABASE_URL = "sqlite:///./test_payments.db"
+
+engine = create_engine(
+    SQLALCHEMY_DATABASE_URL,
+    connect_args={"check_same_thread": False},
+    poolclass=StaticPool,
+)
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+def override_get_db():
+    try:
+        db = TestingSessionLocal()
+        yield db
+    finally:
+        db.close()
+
+@pytest.fixture
+def client():
+    app.dependency_overrides[get_db] = override_get_db
+    response_cache.clear()
+    Base.metadata.create_all(bind=engine)
+    with TestClient(app) as c:
+        yield c
+    Base.metadata.drop_all(bind=engine)
+
+@pytest.fixture
+def salon_id(client):
+    db = TestingSessionLocal()
+    salon = Salon(
+        name="Test Salon",
+        description="Test salon description",
+        address="123 Test Street",
+        city="Test City",
+        phone="0123456789",
+        email="salon@test.com",
+        rating=4.5,
+        total_reviews=10,
+        price_range="€€",
+        open_time=time(9, 0),
+        close_time=time(18, 0)
+    )
+    db.add(salon)
+    db.commit()
+    yield salon.id
+    db.close()
+
+@pytest.fixture
+def stripe_session(mocker):
+    return mocker.patch(
+        "stripe.checkout.Session.create",
+        return_value=SimpleNamespace(id="cs_test_123", url="https://checkout.stripe.test/cs_test_123")
+    )
+
+def appointment(days=1, hour=14):
+    return datetime.combine((datetime.now() + timedelta(days=days)).date(), time(hour, 0))
+
+def checkout_payload(salon_id, start):
+    return {
+        "salon_id": salon_id,
+        "service_type": "Manucure",
+        "appointment_date": start.isoformat(),
+        "price": 45.0,
+        "client_email": "client@test.com",
+        "client_name": "Test Client"
+    }
+
+def test_checkout_holds_slot(client, salon_id, stripe_session):
+    """Test that an open checkout session blocks the slot for other clients"""
+    start = appointment()
+    response = client.post("/api/payments/create-checkout-session", json=checkout_payload(salon_id, start))
+    assert response.status_code == 200
+    metadata = stripe_session.call_args.kwargs["metadata"]
+    assert metadata["hold_token"]
+
+    booking = client.post("/api/reservations/", json={
+        "salon_id": salon_id,
+        "service_type": "Manucure",
+        "appointment_date": start.isoformat(),
+        "duration_minutes": 60,
+        "price": 45.0
+    })
+    assert booking.status_code == 409
+
+    second_checkout = client.post("/api/payments/create-checkout-session", json=checkout_payload(salon_id, start))
+    assert second_checkout.status_code == 409
+
+def test_expired_hold_does_not_block(client, salon_id):
+    """Test that an expired hold is swept when the slot is claimed again"""
+    start = appointment(hour=10)
+    db = TestingSessionLocal()
+    hold_slots(db, salon_id, start, 60, expires_at=datetime.utcnow() - timedelta(minutes=1))
+    db.commit()
+    db.close()
+
+    booking = client.post("/api/reservations/", json={
+        "salon_id": salon_id,
+        "service_type": "Manucure",
+        "appointment_date": start.isoformat(),
+        "duration_minutes": 60,
+        "price": 45.0
+    })
+    assert booking.status_code == 200
+
+def test_held_slot_shown_busy(client, salon_id, stripe_session):
+    """Test that availability and search show a held slot as taken until the hold goes away"""
+    for days in (1, 90):
+        start = appointment(days=days, hour=14)
+        day = start.date()
+        response = client.post("/api/payments/create-checkout-session", json=checkout_payload(salon_id, start))
+        assert response.status_code == 200
+        hold_token = stripe_session.call_args.kwargs["metadata"]["hold_token"]
+        # Blocage expiré : n'occupe plus rien
+        db = TestingSessionLocal()
+        hold_slots(db, salon_id, appointment(days=days, hour=10), 60,
+                   expires_at=datetime.utcnow() - timedelta(minutes=1))
+        db.commit()
+
+        slots = {
+            slot["time"]: slot["available"]
+            for slot in client.get(f"/api/salons/{salon_id}/availability?date={day}").json()["slots"]
+        }
+        assert (slots["10:00"], slots["13:30"], slots["14:00"], slots["15:00"]) == (True, False, False, True), days
+        busy = client.get(f"/api/salons/?available_date={day}&available_time=14:00").json()
+        free = client.get(f"/api/salons/?available_date={day}&available_time=15:00").json()
+        assert salon_id not in [salon["id"] for salon in busy], days
+        assert salon_id in [salon["id"] for salon in free], days
+
+        release_hold(db, hold_token)
+        db.commit()
+        db.close()
+        busy = client.get(f"/api/salons/?available_date={day}&available_time=14:00").json()
+        assert salon_id in [salon["id"] for salon in busy], days
+
+def test_webhook_converts_hold_into_reservation(client, salon_id, stripe_session):
+    """Test that checkout.session.completed turns the hold into a reservation"""
+    start = appointment(hour=11)
+    client.post("/api/payments/create-checkout-session", json=checkout_payload(salon_id, start))
+    metadata = stripe_session.call_args.kwargs["metadata"]
+
+    db = TestingSessionLocal()
+    asyncio.run(handle_successful_payment({
+        "metadata": metadata,
+        "amount_total": 4500,
+        "payment_intent": "pi_test_123"
+    }, db))
+
+    reservation = db.query(Reservation).filter(Reservation.stripe_payment_id == "pi_test_123").one()
+    slots = db.query(ReservationSlot).filter(ReservationSlot.salon_id == salon_id).all()
+    assert len(slots) == 12
+    assert all(slot.reservation_id == reservation.id for slot in slots)
+    assert all(slot.hold_token is None and slot.expires_at is None for slot in slots)
+    db.close()
+
+def test_webhook_refunds_when_slot_taken(client, salon_id, mocker):
+    """Test that a paid session whose slot was taken meanwhile is refunded, and redelivery is idempotent"""
+    refund = mocker.patch("stripe.Refund.create", return_value=SimpleNamespace(id="re_test_123"))
+    start = appointment(hour=16)
+    metadata = {
+        "salon_id": str(salon_id),
+        "client_email": "payer@test.com",
+        "client_name": "Payer",
+        "service_type": "Manucure",
+        "appointment_date": start.isoformat(),
+        "duration_minutes": "60",
+    }
+    db = TestingSessionLocal()
+    paid = {"metadata": metadata, "amount_total": 4500, "payment_intent": "pi_test_first"}
+    asyncio.run(handle_successful_payment(paid, db))
+    # Stripe renvoie le même événement : ni doublon ni remboursement
+    asyncio.run(handle_successful_payment(paid, db))
+    assert db.query(Reservation).filter(Reservation.stripe_payment_id == "pi_test_first").count() == 1
+    refund.assert_not_called()
+
+    asyncio.run(handle_successful_payment(
+        {"metadata": metadata, "amount_total": 4500, "payment_intent": "pi_test_second"}, db
+    ))
+    assert db.query(Reservation).filter(Reservation.stripe_payment_id == "pi_test_second").count() == 0
+    refund.assert_called_once()
+    assert refund.call_args.kwargs["payment_intent"] == "pi_test_second"
+    assert refund.call_args.kwargs["idempotency_key"] == "slot-unavailable-pi_test_second"
+    db.close()
+
+def test_cancel_checkout_releases_hold(client, salon_id, stripe_session, mocker):
+    """Test that cancelling the checkout session frees the slot immediately"""
+    start = appointment(hour=15)
+    client.post("/api/payments/create-checkout-session", json=checkout_payload(salon_id, start))
+    metadata = stripe_session.call_args.kwargs["metadata"]
+    mocker.patch(
+        "stripe.checkout.Session.retrieve",
+        return_value=SimpleNamespace(status="open", metadata=metadata)
+    )
+    expire = mocker.patch("stripe.checkout.Session.expire")
+
+    response = client.post("/api/payments/session/cs_test_123/cancel")
+    assert response.status_code == 200
+    assert response.json() == {"released": True}
+    expire.assert_called_once_with("cs_test_123")
+
+    booking = client.post("/api/reservations/", json={
+        "salon_id": salon_id,
+        "service_type": "Manucure",
+        "appointment_date": start.isoformat(),
+        "duration_minutes": 60,
+        "price": 45.0
+    })
+    assert booking.status_code == 200
@@ -0,0 +1,89 @@
+import random
+from datetime import time
+
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+
+from models import Base, Salon, PRICE_TIERS
+from routers.salons import SALON_SORT_KEYS, filter_salons
+from services.pagination import keyset_after
+
+# Benchmark database: enough rows for the planner to prefer the composite indexes
+SQLALCHEMY_DATABASE_URL = "sqlite:///./test_query_plans.db"
+SALON_COUNT = 5000
+CITIES = ["Paris", "Lyon", "Marseille", "Nice", "Bordeaux", "Lille", "Nantes", "Toulouse"]
+
+engine = create_engine(SQLALCHEMY_DATABASE_URL)
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+# (tri, filtres) couramment envoyés par le front à GET /api/salons
+QUERY_SHAPES = [
+    ("rating", {}),
+    ("rating", {"city": "Paris"}),
+    ("rating", {"city": "Paris", "price_range": "€€"}),
+    ("rating", {"city": "Paris", "min_rating": 4.0}),
+    ("rating", {"price_range": "€€"}),
+    ("rating", {"min_rating": 4.5}),
+    ("price", {}),
+    ("price", {"city": "Lyon"}),
+    ("reviews", {}),
+]
+
+@pytest.fixture(scope="module")
+def db():
+    Base.metadata.create_all(bind=engine)
+    session = TestingSessionLocal()
+    rng = random.Random(42)
+    session.add_all([
+        Salon(
+            name=f"Salon {i}",
+            description="Nail art",
+            address=f"{i} Rue Test",
+            city=rng.choice(CITIES),
+            phone="0123456789",
+            email=f"salon{i}@test.com",
+            rating=round(rng.uniform(3.0, 5.0), 1),
+            total_reviews=rng.randint(0, 500),
+            price_range=rng.choice(list(PRICE_TIERS)),
+            open_time=time(9, 0),
+            close_time=time(19, 0)
+        )
+        for i in range(SALON_COUNT)
+    ])
+    session.commit()
+    session.execute(text("ANALYZE"))
+    yield session
+    session.close()
+    Base.metadata.drop_all(bind=engine)
+
+def explain(db, query):
+    sql = str(query.statement.compile(engine, compile_kwargs={"literal_binds": True}))
+    return [row[3] for row in db.execute(text(f"EXPLAIN QUERY PLAN {sql}"))]
+
+def ordered(query, keys):
+    return query.order_by(*[column.desc() if descending else column.asc() for column, descending, _ in keys])
+
+@pytest.mark.parametrize("sort_by,filters", QUERY_SHAPES)
+def test_salon_list_uses_composite_index(db, sort_by, filters):
+    """Test that each filter + sort shape is served by one index, without sorting"""
+    keys = SALON_SORT_KEYS[sort_by]
+    first_page = ordered(filter_salons(db.query(Salon), **filters), keys).limit(20)
+    cursor_page = ordered(
+        filter_salons(db.query(Salon), **filters).filter(keyset_after(keys, [2, 2500])), keys
+    ).limit(20)
+
+    for query in (first_page, cursor_page):
+        plan = explain(db, query)
+        assert len(plan) == 1, plan
+        assert "USING INDEX ix_salons_" in plan[0], plan
+        assert "TEMP B-TREE" not in plan[0], plan
+
+@pytest.mark.parametrize("sort_by,filters", QUERY_SHAPES)
+def test_salon_list_ids_are_index_only(db, sort_by, filters):
+    """Test that the id projection of each shape never touches the table"""
+    keys = SALON_SORT_KEYS[sort_by]
+    query = ordered(filter_salons(db.query(Salon.id), **filters), keys).limit(20)
+    plan = explain(db, query)
+    assert len(plan) == 1, plan
+    assert "USING COVERING INDEX ix_salons_" in plan[0], plan
@@ -0,0 +1,142 @@
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from datetime import time
+
+import db as db_module
+from main import app
+from models import Base, Salon
+from db import PRIMARY_STICKY_COOKIE, PRIMARY_STICKY_HEADER, get_db
+from services.cache import response_cache
+
+# Test database setup : deux bases distinctes pour observer d'où vient la lecture
+SQLALCHEMY_DATABASE_URL = "sqlite:///./test_replica_primary.db"
+REPLICA_DATABASE_URL = "sqlite:///./test_replica_replica.db"
+
+engine = create_engine(
+    SQLALCHEMY_DATABASE_URL,
+    connect_args={"check_same_thread": False},
+    poolclass=StaticPool,
+)
+replica_engine = create_engine(
+    REPLICA_DATABASE_URL,
+    connect_args={"check_same_thread": False},
+    poolclass=StaticPool,
+)
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+TestingReplicaSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=replica_engine)
+
+def override_get_db():
+    try:
+        db = TestingSessionLocal()
+        yield db
+    finally:
+        db.close()
+
+def add_salon(session_factory, name):
+    db = session_factory()
+    db.add(Salon(
+        name=name,
+        description="Nail art",
+        address="1 Rue Test",
+        city="Paris",
+        phone="0123456789",
+        email="salon@test.com",
+        rating=4.5,
+        total_reviews=10,
+        price_range="€€",
+        open_time=time(9, 0),
+        close_time=time(18, 0)
+    ))
+    db.commit()
+    db.close()
+
+@pytest.fixture
+def client(monkeypatch):
+    app.dependency_overrides[get_db] = override_get_db
+    monkeypatch.setattr(db_module, "ReplicaSessionLocal", TestingReplicaSessionLocal)
+    response_cache.clear()
+    Base.metadata.create_all(bind=engine)
+    Base.metadata.create_all(bind=replica_engine)
+    with TestClient(app) as c:
+        yield c
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.drop_all(bind=replica_engine)
+    response_cache.clear()
+
+def salon_names(client):
+    return [s["name"] for s in client.get("/api/salons/").json()]
+
+def test_reads_go_to_replica(client):
+    """Test that salon browsing is served by the replica"""
+    add_salon(TestingReplicaSessionLocal, "Salon Réplique")
+    assert salon_names(client) == ["Salon Réplique"]
+
+def test_read_your_writes_after_write(client):
+    """Test that a client reads from the primary right after its own write"""
+    add_salon(TestingReplicaSessionLocal, "Salon Réplique")
+
+    response = client.post("/api/salons/", json={
+        "name": "Salon Primaire",
+        "description": "Nail art",
+        "address": "2 Rue Test",
+        "city": "Paris",
+        "phone": "0123456789",
+        "email": "new@test.com",
+        "price_range": "€",
+        "open_time": "10:00:00",
+        "close_time": "19:00:00"
+    })
+    assert response.status_code == 200
+    assert PRIMARY_STICKY_COOKIE in response.cookies
+
+    # Réplique en retard : le client voit quand même son salon
+    salon_id = response.json()["id"]
+    assert salon_names(client) == ["Salon Primaire"]
+    assert client.get(f"/api/salons/{salon_id}").status_code == 200
+
+    # Les autres clients restent sur la réplique
+    response_cache.clear()
+    client.cookies.clear()
+    assert salon_names(client) == ["Salon Réplique"]
+
+def test_read_your_writes_cross_site_header(client):
+    """Test that the sticky hint works without cookies when the frontend echoes the header"""
+    add_salon(TestingReplicaSessionLocal, "Salon Réplique")
+    response = client.post("/api/salons/", json={
+        "name": "Salon Primaire",
+        "description": "Nail art",
+        "address": "2 Rue Test",
+        "city": "Paris",
+        "phone": "0123456789",
+        "email": "new@test.com",
+        "price_range": "€",
+        "open_time": "10:00:00",
+        "close_time": "19:00:00"
+    })
+    until = response.headers[PRIMARY_STICKY_HEADER]
+    # Requêtes cross-site : aucun cookie renvoyé, seul l'en-tête fait foi
+    client.cookies.clear()
+    response = client.get("/api/salons/", headers={PRIMARY_STICKY_HEADER: until})
+    assert [s["name"] for s in response.json()] == ["Salon Primaire"]
+    response_cache.clear()
+    assert salon_names(client) == ["Salon Réplique"]
+
+    # Une échéance forgée au-delà de la fenêtre est ignorée
+    response_cache.clear()
+    response = client.get("/api/salons/", headers={PRIMARY_STICKY_HEADER: "99999999999"})
+    assert [s["name"] for s in response.json()] == ["Salon Réplique"]
+
+def test_failed_write_does_not_stick(client):
+    """Test that an error response does not pin the client to the primary"""
+    response = client.post("/api/reservations/", json={
+        "salon_id": 999,
+        "service_type": "Manucure",
+        "appointment_date": "2030-01-07T10:00:00",
+        "duration_minutes": 60,
+        "price": 45.0
+    })
+    assert response.status_code == 404
+    assert PRIMARY_STICKY_COOKIE not in response.cookies
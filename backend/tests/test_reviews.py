@@ -0,0 +1,138 @@
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from datetime import time
+
+from main import app
+from models import Base, Salon
+from db import get_db
+from services.autocomplete import autocomplete_index
+from services.cache import response_cache
+from services.ranking import popular_ranking
+from services.user_cache import user_cache
+
+# Test database setup
+SQLALCHEMY_DATABASE_URL = "sqlite:///./test_reviews.db"
+
+engine = create_engine(
+    SQLALCHEMY_DATABASE_URL,
+    connect_args={"check_same_thread": False},
+    poolclass=StaticPool,
+)
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+def override_get_db():
+    try:
+        db = TestingSessionLocal()
+        yield db
+    finally:
+        db.close()
+
+@pytest.fixture
+def client():
+    app.dependency_overrides[get_db] = override_get_db
+    response_cache.clear()
+    autocomplete_index.reset()
+    popular_ranking.reset()
+    user_cache.clear()
+    Base.metadata.create_all(bind=engine)
+    with TestClient(app) as c:
+        yield c
+    Base.metadata.drop_all(bind=engine)
+    response_cache.clear()
+
+@pytest.fixture
+def salon_id(client):
+    """Salon importé : note et nombre d'avis renseignés, sans somme des notes"""
+    db = TestingSessionLocal()
+    salon = Salon(
+        name="Salon Avis",
+        description="Nail art",
+        address="1 Rue Test",
+        city="Paris",
+        phone="0123456789",
+        email="salon@test.com",
+        rating=4.0,
+        total_reviews=10,
+        price_range="€€",
+        open_time=time(9, 0),
+        close_time=time(19, 0)
+    )
+    db.add(salon)
+    db.commit()
+    salon_id = salon.id
+    db.close()
+    return salon_id
+
+def auth_headers(client, email):
+    response = client.post("/api/auth/login", json={"email": email, "password": "secret"})
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+def salon_stats(client, salon_id):
+    data = client.get(f"/api/salons/{salon_id}").json()
+    return round(data["rating"], 4), data["total_reviews"]
+
+def test_reviews_maintain_salon_aggregates(client, salon_id):
+    """Test that creating, editing and deleting reviews updates rating and count incrementally"""
+    alice = auth_headers(client, "alice@test.com")
+    bob = auth_headers(client, "bob@test.com")
+    assert salon_stats(client, salon_id) == (4.0, 10)
+
+    response = client.post(f"/api/salons/{salon_id}/reviews", json={"rating": 5, "comment": "Parfait"}, headers=alice)
+    assert response.status_code == 200
+    review_id = response.json()["id"]
+    assert salon_stats(client, salon_id) == (round(45 / 11, 4), 11)
+
+    client.post(f"/api/salons/{salon_id}/reviews", json={"rating": 1}, headers=bob)
+    assert salon_stats(client, salon_id) == (round(46 / 12, 4), 12)
+
+    response = client.patch(f"/api/reviews/{review_id}", json={"rating": 3}, headers=alice)
+    assert response.status_code == 200
+    assert response.json()["rating"] == 3
+    assert response.json()["comment"] == "Parfait"
+    assert salon_stats(client, salon_id) == (round(44 / 12, 4), 12)
+
+    # Seul l'auteur peut modifier ou supprimer son avis
+    assert client.patch(f"/api/reviews/{review_id}", json={"rating": 5}, headers=bob).status_code == 403
+    assert client.delete(f"/api/reviews/{review_id}", headers=bob).status_code == 403
+
+    assert client.delete(f"/api/reviews/{review_id}", headers=alice).status_code == 200
+    assert salon_stats(client, salon_id) == (round(41 / 11, 4), 11)
+    assert client.delete(f"/api/reviews/{review_id}", headers=alice).status_code == 404
+
+def test_review_updates_derived_views(client, salon_id):
+    """Test that popular ranking and autocomplete follow rating changes"""
+    headers = auth_headers(client, "alice@test.com")
+    assert client.get("/api/salons/popular").json()[0]["rating"] == 4.0
+
+    client.post(f"/api/salons/{salon_id}/reviews", json={"rating": 5}, headers=headers)
+    assert client.get("/api/salons/popular").json()[0]["total_reviews"] == 11
+    suggestions = client.get("/api/salons/autocomplete?q=avis").json()
+    assert round(suggestions[0]["rating"], 4) == round(45 / 11, 4)
+
+def test_review_validation_and_listing(client, salon_id):
+    """Test rating bounds, unknown salon and paginated listing"""
+    headers = auth_headers(client, "alice@test.com")
+    assert client.post(f"/api/salons/{salon_id}/reviews", json={"rating": 6}, headers=headers).status_code == 422
+    assert client.post("/api/salons/999/reviews", json={"rating": 4}, headers=headers).status_code == 404
+
+    for author, rating in [("carol", 3), ("dave", 4), ("erin", 5)]:
+        author_headers = auth_headers(client, f"{author}@test.com")
+        client.post(f"/api/salons/{salon_id}/reviews", json={"rating": rating}, headers=author_headers)
+
+    first_page = client.get(f"/api/salons/{salon_id}/reviews?limit=2")
+    assert [review["rating"] for review in first_page.json()] == [5, 4]
+    cursor = first_page.headers["X-Next-Cursor"]
+    second_page = client.get(f"/api/salons/{salon_id}/reviews?limit=2&cursor={cursor}")
+    assert [review["rating"] for review in second_page.json()] == [3]
+
+def test_one_review_per_client_and_salon(client, salon_id):
+    """Test that a second review from the same account is refused without touching the aggregates"""
+    headers = auth_headers(client, "alice@test.com")
+    assert client.post(f"/api/salons/{salon_id}/reviews", json={"rating": 5}, headers=headers).status_code == 200
+    response = client.post(f"/api/salons/{salon_id}/reviews", json={"rating": 1}, headers=headers)
+    assert response.status_code == 409
+    assert salon_stats(client, salon_id) == (round(45 / 11, 4), 11)
+    assert len(client.get(f"/api/salons/{salon_id}/reviews").json()) == 1
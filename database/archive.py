@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+"""
+Job d'archivage des réservations (à lancer par cron, par exemple chaque nuit)
+Reconstruit ensuite les bitmaps de disponibilité de l'horizon : les réservations
+clôturées en sortent et toute dérive (correction manuelle en SQL) est réparée
+"""
+
+import argparse
+import sys
+import os
+from datetime import datetime, timedelta
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+# Add backend directory to Python path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'backend'))
+
+from db import DATABASE_URL
+from services.archive import ARCHIVE_AFTER_DAYS, ARCHIVE_BATCH_SIZE, archive_reservations, complete_past_reservations
+from services.availability_store import rebuild_availability
+
+# Create engine and session
+engine = create_engine(DATABASE_URL)
+SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+def main():
+    parser = argparse.ArgumentParser(description="Archiver les réservations anciennes")
+    parser.add_argument("--after-days", type=int, default=ARCHIVE_AFTER_DAYS,
+                        help="Archiver les rendez-vous plus anciens que ce nombre de jours")
+    parser.add_argument("--batch-size", type=int, default=ARCHIVE_BATCH_SIZE, help="Lignes par transaction")
+    parser.add_argument("--skip-availability", action="store_true",
+                        help="Ne pas reconstruire les bitmaps de disponibilité")
+    args = parser.parse_args()
+
+    now = datetime.utcnow()
+    db = SessionLocal()
+    try:
+        completed = complete_past_reservations(db, now, args.batch_size)
+        print(f"✅ {completed} rendez-vous passés clôturés")
+        archived = archive_reservations(db, now - timedelta(days=args.after_days), args.batch_size)
+        print(f"✅ {archived} réservations archivées")
+        if not args.skip_availability:
+            rebuilt = rebuild_availability(db)
+            print(f"✅ {rebuilt} bitmaps de disponibilité reconstruits")
+    except Exception as e:
+        print(f"❌ Erreur lors de l'archivage: {e}")
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    main()
@@ -3,17 +3,28 @@
 Script pour peupler la base de données avec des données de test
 """
 
+import argparse
+import csv
+import io
+import random
 import sys
 import os
-from datetime import datetime, time
-from sqlalchemy import create_engine
+from bisect import bisect_left
+from datetime import date, datetime, time, timedelta
+from itertools import accumulate, islice
+from typing import Tuple
+from sqlalchemy import create_engine, func, text
 from sqlalchemy.orm import sessionmaker
 
 # Add backend directory to Python path
 sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'backend'))
 
-from models import Base, Salon, User, Reservation
+from models import PRICE_TIERS, Base, Salon, User, Reservation, ReservationSlot
 from db import DATABASE_URL
+from services.availability_store import rebuild_availability
+from services.booking import claim_slots, slot_keys
+from services.geo import encode_geohash
+from services.normalize import normalize
 
 # Create engine and session
 engine = create_engine(DATABASE_URL)
@@ -84,6 +95,8 @@ def seed_salons():
             image_url="https://images.unsplash.com/photo-1604654894610-df63bc536371?w=800",
             open_time=time(9, 0),
             close_time=time(19, 0),
+            latitude=48.8698,
+            longitude=2.3311,
             owner_id=owner1.id if owner1 else None
         ),
         Salon(
@@ -99,6 +112,8 @@ def seed_salons():
             image_url="https://images.unsplash.com/photo-1587691592099-24045742c181?w=800",
             open_time=time(10, 0),
             close_time=time(18, 0),
+            latitude=45.764,
+            longitude=4.8357,
             owner_id=owner2.id if owner2 else None
         ),
         Salon(
@@ -114,6 +129,8 @@ def seed_salons():
             image_url="https://images.unsplash.com/photo-1595475884562-dcadd9821e71?w=800",
             open_time=time(8, 0),
             close_time=time(20, 0),
+            latitude=43.695,
+            longitude=7.265,
             owner_id=None
         ),
         Salon(
@@ -129,6 +146,8 @@ def seed_salons():
             image_url="https://images.unsplash.com/photo-1562887189-1d458946e3a0?w=800",
             open_time=time(9, 30),
             close_time=time(18, 30),
+            latitude=43.2965,
+            longitude=5.3698,
             owner_id=None
         ),
         Salon(
@@ -144,6 +163,8 @@ def seed_salons():
             image_url="https://images.unsplash.com/photo-1599948128020-9a44168c34c4?w=800",
             open_time=time(10, 0),
             close_time=time(19, 0),
+            latitude=45.7578,
+            longitude=4.832,
             owner_id=None
         )
     ]
@@ -192,20 +213,355 @@ def seed_reservations():
     
     for reservation in reservations:
         db.add(reservation)
+        db.flush()
+        claim_slots(db, reservation)
     
     db.commit()
     print(f"✅ {len(reservations)} réservations ajoutées")
     db.close()
 
+# ---------------------------------------------------------------------------
+# Génération de données synthétiques (planification de capacité, benchmarks)
+# ---------------------------------------------------------------------------
+
+# Villes (latitude, longitude, poids) : la répartition suit grossièrement la population
+CITIES = [
+    ("Paris", 48.8566, 2.3522, 30.0),
+    ("Marseille", 43.2965, 5.3698, 8.0),
+    ("Lyon", 45.7640, 4.8357, 7.0),
+    ("Toulouse", 43.6047, 1.4442, 5.0),
+    ("Nice", 43.7102, 7.2620, 4.0),
+    ("Nantes", 47.2184, -1.5536, 3.5),
+    ("Montpellier", 43.6108, 3.8767, 3.0),
+    ("Strasbourg", 48.5734, 7.7521, 3.0),
+    ("Bordeaux", 44.8378, -0.5792, 3.0),
+    ("Lille", 50.6292, 3.0573, 3.0),
+    ("Rennes", 48.1173, -1.6778, 2.0),
+    ("Reims", 49.2583, 4.0317, 1.5),
+    ("Saint-Étienne", 45.4397, 4.3872, 1.5),
+    ("Toulon", 43.1242, 5.9280, 1.5),
+    ("Le Havre", 49.4944, 0.1079, 1.2),
+    ("Grenoble", 45.1885, 5.7245, 1.2),
+    ("Dijon", 47.3220, 5.0415, 1.0),
+    ("Angers", 47.4784, -0.5632, 1.0),
+    ("Nîmes", 43.8367, 4.3601, 1.0),
+    ("Aix-en-Provence", 43.5297, 5.4474, 1.0),
+]
+
+NAME_PREFIXES = ["Nail", "Beauty", "Ongles", "Studio", "Atelier", "Luxe", "Glam", "Bulle", "L'Instant", "Côté"]
+NAME_SUFFIXES = ["Paradise", "Studio", "& Co", "Spa", "Boutique", "Bar", "Lab", "Nails", "Beauté", "Art"]
+STREETS = ["Rue de la République", "Avenue Jean Jaurès", "Rue Victor Hugo", "Boulevard Gambetta",
+           "Rue Pasteur", "Place de la Mairie", "Rue du Commerce", "Avenue de la Gare"]
+FIRST_NAMES = ["Sophie", "Marie", "Camille", "Léa", "Chloé", "Manon", "Inès", "Sarah", "Julie", "Emma",
+               "Lucie", "Clara", "Anaïs", "Laura", "Pauline", "Thomas", "Nicolas", "Karim", "Lina", "Yasmine"]
+LAST_NAMES = ["Martin", "Bernard", "Dubois", "Thomas", "Robert", "Richard", "Petit", "Durand", "Leroy",
+              "Moreau", "Simon", "Laurent", "Lefebvre", "Michel", "Garcia", "Benali", "Nguyen", "Roux"]
+
+PRICE_RANGE_WEIGHTS = [("€", 35), ("€€", 45), ("€€€", 20)]
+PRICE_FACTORS = {"€": 0.8, "€€": 1.0, "€€€": 1.5}
+SCHEDULES = [(time(9, 0), time(19, 0)), (time(10, 0), time(19, 0)), (time(9, 30), time(18, 30)),
+             (time(8, 0), time(20, 0)), (time(10, 0), time(20, 0))]
+
+# Prestations : (libellé, durée en minutes, prix de base, poids)
+SERVICES = [
+    ("Manucure", 30, 25.0, 25),
+    ("Manucure française", 45, 35.0, 20),
+    ("Semi-permanent", 60, 40.0, 25),
+    ("Nail art", 60, 45.0, 10),
+    ("Pédicure", 60, 40.0, 10),
+    ("Pose d'ongles en gel", 90, 55.0, 10),
+]
+
+# Fréquentation par jour de la semaine (lundi = 0) et par heure
+WEEKDAY_WEIGHTS = [0.6, 0.9, 1.0, 1.0, 1.3, 1.8, 0.2]
+HOUR_WEIGHTS = {8: 0.4, 9: 0.8, 10: 1.4, 11: 1.5, 12: 0.9, 13: 0.8, 14: 1.0, 15: 1.0,
+                16: 1.2, 17: 1.8, 18: 1.9, 19: 1.0}
+
+QUARTERS_PER_DAY = 96
+# Part maximale des quarts d'heure d'ouverture qu'un salon peut avoir réservés
+MAX_OCCUPANCY = 0.6
+
+
+def _weighted(rng, population, cum_weights):
+    """Tirage pondéré en O(log n) sur des poids cumulés précalculés"""
+    return population[bisect_left(cum_weights, rng.random() * cum_weights[-1])]
+
+
+def _next_id(db, model) -> int:
+    return (db.query(func.max(model.id)).scalar() or 0) + 1
+
+
+class BulkLoader:
+    """Chargement par lots : COPY sur Postgres, executemany sur les autres bases"""
+
+    def __init__(self, engine, batch_size: int):
+        self.engine = engine
+        self.batch_size = batch_size
+        self.use_copy = engine.dialect.name == "postgresql"
+
+    def load(self, table, columns, rows) -> int:
+        total = 0
+        rows = iter(rows)
+        while True:
+            batch = list(islice(rows, self.batch_size))
+            if not batch:
+                return total
+            self._write(table, columns, batch)
+            total += len(batch)
+            print(f"   {table.name}: {total} lignes", end="\r")
+
+    def load_with_children(self, table, columns, child_table, child_columns, rows) -> Tuple[int, int]:
+        """Comme load, pour des paires (ligne, lignes enfants) : les enfants d'un lot sont
+        chargés juste après leurs parents, sans jamais être accumulés pour tout le jeu"""
+        total = children = 0
+        rows = iter(rows)
+        while True:
+            batch = list(islice(rows, self.batch_size))
+            if not batch:
+                return total, children
+            self._write(table, columns, [row for row, _ in batch])
+            child_rows = [child for _, row_children in batch for child in row_children]
+            if child_rows:
+                self._write(child_table, child_columns, child_rows)
+            total += len(batch)
+            children += len(child_rows)
+            print(f"   {table.name}: {total} lignes, {child_table.name}: {children} lignes", end="\r")
+
+    def _write(self, table, columns, batch):
+        if self.use_copy:
+            self._copy(table, columns, batch)
+        else:
+            with self.engine.begin() as connection:
+                connection.execute(table.insert(), [dict(zip(columns, row)) for row in batch])
+
+    def _copy(self, table, columns, batch):
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for row in batch:
+            writer.writerow(["" if value is None else value for value in row])
+        buffer.seek(0)
+        connection = self.engine.raw_connection()
+        try:
+            with connection.cursor() as cursor:
+                cursor.copy_expert(
+                    f"COPY {table.name} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)", buffer
+                )
+            connection.commit()
+        finally:
+            connection.close()
+
+
+def generate_users(rng, first_id: int, count: int, today: date):
+    for user_id in range(first_id, first_id + count):
+        first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+        yield (
+            user_id,
+            f"client{user_id}@example.com",
+            f"{first} {last}",
+            f"06 {rng.randint(10, 99)} {rng.randint(10, 99)} {rng.randint(10, 99)} {rng.randint(10, 99)}",
+            False,
+            datetime.combine(today - timedelta(days=rng.randint(0, 730)), time(12, 0)),
+        )
+
+
+def generate_salons(rng, first_id: int, count: int, today: date, profiles: list):
+    """Salons répartis selon le poids des villes ; les colonnes dérivées sont calculées ici
+    (le chargement en masse ne passe pas par les événements de l'ORM)"""
+    city_cum = list(accumulate(weight for _, _, _, weight in CITIES))
+    price_cum = list(accumulate(weight for _, weight in PRICE_RANGE_WEIGHTS))
+    for salon_id in range(first_id, first_id + count):
+        city, city_lat, city_lng, _ = _weighted(rng, CITIES, city_cum)
+        price_range = _weighted(rng, [price for price, _ in PRICE_RANGE_WEIGHTS], price_cum)
+        open_time, close_time = rng.choice(SCHEDULES)
+        # Notes concentrées entre 4 et 5, nombre d'avis à longue traîne
+        rating = round(min(5.0, max(1.0, rng.gauss(4.3, 0.45))), 1)
+        total_reviews = min(5000, int(rng.paretovariate(1.2) * 5) - 5)
+        latitude = round(city_lat + rng.gauss(0, 0.03), 6)
+        longitude = round(city_lng + rng.gauss(0, 0.04), 6)
+        profiles.append((salon_id, open_time, close_time, price_range, total_reviews + 5))
+        yield (
+            salon_id,
+            f"{rng.choice(NAME_PREFIXES)} {rng.choice(NAME_SUFFIXES)}",
+            "Salon de manucure et de nail art.",
+            f"{rng.randint(1, 200)} {rng.choice(STREETS)}",
+            city,
+            normalize(city),
+            f"0{rng.randint(1, 5)} {rng.randint(10, 99)} {rng.randint(10, 99)} {rng.randint(10, 99)} {rng.randint(10, 99)}",
+            f"contact{salon_id}@salons.example.com",
+            rating,
+            total_reviews,
+            price_range,
+            PRICE_TIERS[price_range],
+            open_time,
+            close_time,
+            latitude,
+            longitude,
+            encode_geohash(latitude, longitude),
+            datetime.combine(today - timedelta(days=rng.randint(30, 1500)), time(12, 0)),
+        )
+
+
+def allocate_reservations(rng, profiles: list, total: int, days: int) -> list:
+    """Nombre de réservations par salon, proportionnel à sa popularité et borné par sa capacité"""
+    weight_sum = sum(weight for *_, weight in profiles)
+    counts = []
+    for salon_id, open_time, close_time, _, weight in profiles:
+        open_quarters = (close_time.hour * 60 + close_time.minute - open_time.hour * 60 - open_time.minute) // 15
+        capacity = int(days * open_quarters * MAX_OCCUPANCY / 4)
+        expected = total * weight / weight_sum
+        count = int(expected) + (1 if rng.random() < expected - int(expected) else 0)
+        counts.append(min(count, capacity))
+    return counts
+
+
+def generate_reservations(rng, first_id: int, profiles: list, counts: list, user_count: int,
+                          first_user_id: int, first_day: date, days: int, today: date):
+    """Réservations sans chevauchement par salon, chacune avec ses lignes de
+    reservation_slots (tranches des rendez-vous confirmés à venir, vide sinon)"""
+    day_weights = [WEEKDAY_WEIGHTS[(first_day + timedelta(days=d)).weekday()] for d in range(days)]
+    day_cum = list(accumulate(day_weights))
+    service_cum = list(accumulate(weight for *_, weight in SERVICES))
+    reservation_id = first_id
+
+    for (salon_id, open_time, close_time, price_range, _), count in zip(profiles, counts):
+        open_q = (open_time.hour * 60 + open_time.minute) // 15
+        close_q = (close_time.hour * 60 + close_time.minute) // 15
+        quarters = list(range(open_q, close_q))
+        quarter_cum = list(accumulate(HOUR_WEIGHTS.get(q // 4, 0.5) for q in quarters))
+        busy = bytearray(days * QUARTERS_PER_DAY)
+
+        for _ in range(count):
+            service, duration, base_price, _ = _weighted(rng, SERVICES, service_cum)
+            length = duration // 15
+            # Quelques essais pour trouver un créneau libre, sinon la réservation est abandonnée
+            for _ in range(10):
+                day = _weighted(rng, range(days), day_cum)
+                start_q = _weighted(rng, quarters, quarter_cum)
+                first = day * QUARTERS_PER_DAY + start_q
+                if start_q + length <= close_q and not any(busy[first:first + length]):
+                    break
+            else:
+                continue
+            busy[first:first + length] = b"\x01" * length
+
+            start = datetime.combine(first_day + timedelta(days=day), time(start_q // 4, (start_q % 4) * 15))
+            if start.date() < today:
+                status = "completed" if rng.random() < 0.85 else "cancelled"
+            else:
+                status = "confirmed" if rng.random() < 0.9 else "cancelled"
+            payment_status = "paid" if status != "cancelled" else rng.choice(["refunded", "pending"])
+            slots = [
+                (salon_id, key, reservation_id, None, None) for key in slot_keys(start, duration)
+            ] if status == "confirmed" else []
+
+            yield (
+                reservation_id,
+                salon_id,
+                first_user_id + rng.randrange(user_count),
+                service,
+                start,
+                duration,
+                start + timedelta(minutes=duration),
+                round(base_price * PRICE_FACTORS[price_range], 2),
+                status,
+                payment_status,
+                start - timedelta(days=rng.randint(0, 30), minutes=rng.randint(0, 1439)),
+            ), slots
+            reservation_id += 1
+
+
+def _reset_sequences(engine):
+    """Postgres : recaler les séquences après des insertions à identifiants explicites"""
+    if engine.dialect.name != "postgresql":
+        return
+    with engine.begin() as connection:
+        for table in ("users", "salons", "reservations"):
+            connection.execute(text(
+                f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), "
+                f"(SELECT coalesce(max(id), 1) FROM {table}))"
+            ))
+
+
+def seed_synthetic(salons: int, reservations: int, users: int, seed: int, batch_size: int,
+                   days_back: int, days_ahead: int, today: date):
+    """Générer un jeu de données volumineux et reproductible (même graine + même date = mêmes données)"""
+    rng = random.Random(seed)
+    loader = BulkLoader(engine, batch_size)
+    first_day = today - timedelta(days=days_back)
+    days = days_back + days_ahead
+
+    db = SessionLocal()
+    first_user_id, first_salon_id, first_reservation_id = (
+        _next_id(db, User), _next_id(db, Salon), _next_id(db, Reservation)
+    )
+    db.close()
+
+    count = loader.load(User.__table__, ["id", "email", "name", "phone", "is_professional", "created_at"],
+                        generate_users(rng, first_user_id, users, today))
+    print(f"✅ {count} utilisateurs générés          ")
+
+    profiles = []
+    count = loader.load(Salon.__table__, [
+        "id", "name", "description", "address", "city", "city_normalized", "phone", "email", "rating",
+        "total_reviews", "price_range", "price_tier", "open_time", "close_time", "latitude", "longitude",
+        "geohash", "created_at"
+    ], generate_salons(rng, first_salon_id, salons, today, profiles))
+    print(f"✅ {count} salons générés          ")
+
+    counts = allocate_reservations(rng, profiles, reservations, days)
+    count, slot_count = loader.load_with_children(
+        Reservation.__table__, [
+            "id", "salon_id", "client_id", "service_type", "appointment_date", "duration_minutes", "end_date",
+            "price", "status", "payment_status", "created_at"
+        ],
+        ReservationSlot.__table__, ["salon_id", "slot_start", "reservation_id", "hold_token", "expires_at"],
+        generate_reservations(rng, first_reservation_id, profiles, counts, users, first_user_id,
+                              first_day, days, today)
+    )
+    print(f"✅ {count} réservations générées, {slot_count} tranches réservées          ")
+
+    _reset_sequences(engine)
+    with engine.begin() as connection:
+        connection.execute(text("ANALYZE"))
+
+def seed_availability():
+    """Reconstruire les bitmaps de disponibilité des prochains jours"""
+    db = SessionLocal()
+    count = rebuild_availability(db)
+    print(f"✅ {count} bitmaps de disponibilité calculés")
+    db.close()
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Peupler la base de données Bookinails")
+    parser.add_argument("--salons", type=int, default=0,
+                        help="Nombre de salons synthétiques (0 = jeu de démonstration)")
+    parser.add_argument("--reservations", type=int, default=0, help="Nombre de réservations synthétiques")
+    parser.add_argument("--users", type=int, default=None,
+                        help="Nombre de clientes synthétiques (défaut : une pour 20 réservations)")
+    parser.add_argument("--seed", type=int, default=42, help="Graine du générateur (données reproductibles)")
+    parser.add_argument("--today", type=date.fromisoformat, default=date.today(),
+                        help="Date de référence AAAA-MM-JJ (fixer pour des benchmarks reproductibles)")
+    parser.add_argument("--days-back", type=int, default=300, help="Historique de réservations, en jours")
+    parser.add_argument("--days-ahead", type=int, default=60, help="Réservations à venir, en jours")
+    parser.add_argument("--batch-size", type=int, default=10000, help="Lignes par lot (COPY / executemany)")
+    return parser.parse_args(argv)
+
 def main():
     """Fonction principale pour peupler la base de données"""
+    args = parse_args()
     print("🚀 Début du peuplement de la base de données...")
     
     try:
         create_tables()
-        seed_users()
-        seed_salons()
-        seed_reservations()
+        if args.salons:
+            users = args.users if args.users is not None else max(100, args.reservations // 20)
+            seed_synthetic(args.salons, args.reservations, users, args.seed, args.batch_size,
+                           args.days_back, args.days_ahead, args.today)
+        else:
+            seed_users()
+            seed_salons()
+            seed_reservations()
+        seed_availability()
         
         print("🎉 Base de données peuplée avec succès !")
         
@@ -25,6 +25,9 @@ export interface RegisterData extends LoginCredentials {
 class AuthService {
   private tokenKey = 'bookinails_token'
   private userKey = 'bookinails_user'
+  // Sticky-primary hint from the API (read-your-writes behind a replica)
+  private primaryUntilKey = 'bookinails_primary_until'
+  private primaryUntilHeader = 'x-primary-until'
 
   // Get stored token
   getToken(): string | null {
@@ -73,9 +76,24 @@ class AuthService {
       axios.defaults.headers.common['Authorization'] = `Bearer ${token}`
     }
 
+    // Echo the sticky-primary hint: cookies are not sent cross-site (vercel.app -> onrender.com)
+    axios.interceptors.request.use((config) => {
+      const primaryUntil = sessionStorage.getItem(this.primaryUntilKey)
+      if (primaryUntil) {
+        config.headers.set(this.primaryUntilHeader, primaryUntil)
+      }
+      return config
+    })
+
     // Add response interceptor to handle 401
     axios.interceptors.response.use(
-      (response) => response,
+      (response) => {
+        const primaryUntil = response.headers[this.primaryUntilHeader]
+        if (primaryUntil) {
+          sessionStorage.setItem(this.primaryUntilKey, primaryUntil)
+        }
+        return response
+      },
       (error) => {
         if (error.response?.status === 401) {
           this.logout()